@@ -14,13 +14,17 @@ from apscheduler.triggers.cron import CronTrigger
 from flask import Flask, request, jsonify
 
 from biz.gitlab.webhook_handler import slugify_url
+from biz.llm.factory import Factory
 from biz.queue.worker import handle_merge_request_event, handle_push_event, handle_github_pull_request_event, \
     handle_github_push_event
 from biz.service.review_service import ReviewService
+from biz.utils.coalescer import make_coalesce_key
 from biz.utils.im import notifier
 from biz.utils.log import logger
-from biz.utils.queue import handle_queue
+from biz.utils.metrics import metrics
+from biz.utils.queue import handle_queue, QueueFullError
 from biz.utils.reporter import Reporter
+from biz.utils.token_util import prewarm
 
 from biz.utils.config_checker import check_config
 
@@ -71,6 +75,12 @@ def daily_report():
         return jsonify({'message': f"Failed to generate daily report: {e}"}), 500
 
 
+@api_app.route('/metrics', methods=['GET'])
+def get_metrics():
+    # 进程内的运行指标(HTTP连接复用、队列状态等)
+    return jsonify(metrics.snapshot())
+
+
 def setup_scheduler():
     """
     配置并启动定时任务调度器
@@ -116,10 +126,15 @@ def handle_webhook():
         # 判断是GitLab还是GitHub的webhook
         webhook_source = request.headers.get('X-GitHub-Event')
 
-        if webhook_source:  # GitHub webhook
-            return handle_github_webhook(webhook_source, data)
-        else:  # GitLab webhook
-            return handle_gitlab_webhook(data)
+        try:
+            if webhook_source:  # GitHub webhook
+                return handle_github_webhook(webhook_source, data)
+            else:  # GitLab webhook
+                return handle_gitlab_webhook(data)
+        except QueueFullError as e:
+            # 队列已满，返回503让调用方稍后重试
+            logger.warn(f'Webhook rejected: {e}')
+            return jsonify({'message': f'Server is busy, please retry later: {e}'}), 503
     else:
         return jsonify({'message': 'Invalid data format'}), 400
 
@@ -138,8 +153,16 @@ def handle_github_webhook(event_type, data):
     logger.info(f'Payload: {json.dumps(data)}')
 
     if event_type == "pull_request":
+        # 同一个PR的多次推送只保留最新的Review任务
+        coalesce_key, revision = None, None
+        pull_request = data.get('pull_request', {})
+        if data.get('action') in ['opened', 'synchronize']:
+            coalesce_key = make_coalesce_key(github_url_slug, data.get('repository', {}).get('full_name'),
+                                             pull_request.get('number'))
+            revision = pull_request.get('head', {}).get('sha')
         # 使用handle_queue进行异步处理
-        handle_queue(handle_github_pull_request_event, data, github_token, github_url, github_url_slug)
+        handle_queue(handle_github_pull_request_event, data, github_token, github_url, github_url_slug,
+                     coalesce_key=coalesce_key, revision=revision)
         # 立马返回响应
         return jsonify(
             {'message': f'GitHub request received(event_type={event_type}), will process asynchronously.'}), 200
@@ -187,8 +210,16 @@ def handle_gitlab_webhook(data):
 
     # 处理Merge Request Hook
     if object_kind == "merge_request":
-        # 创建一个新进程进行异步处理
-        handle_queue(handle_merge_request_event, data, gitlab_token, gitlab_url, gitlab_url_slug)
+        # 同一个MR的多次推送只保留最新的Review任务
+        coalesce_key, revision = None, None
+        merge_request = data.get('object_attributes', {})
+        if merge_request.get('action') in ['open', 'update']:
+            coalesce_key = make_coalesce_key(gitlab_url_slug, merge_request.get('target_project_id'),
+                                             merge_request.get('iid'))
+            revision = merge_request.get('last_commit', {}).get('id')
+        # 放入队列进行异步处理
+        handle_queue(handle_merge_request_event, data, gitlab_token, gitlab_url, gitlab_url_slug,
+                     coalesce_key=coalesce_key, revision=revision)
         # 立马返回响应
         return jsonify(
             {'message': f'Request received(object_kind={object_kind}), will process asynchronously.'}), 200
@@ -207,6 +238,8 @@ def handle_gitlab_webhook(data):
 
 if __name__ == '__main__':
     check_config()
+    # 启动时加载 tokenizer，避免第一次 Review 时才加载
+    prewarm(('cl100k_base', Factory.getTokenizer().encoding_name))
     # 启动定时任务调度器
     setup_scheduler()
 
@@ -1,10 +1,8 @@
 import abc
-import os
 from abc import abstractmethod
 from typing import List, Dict, Any
 
-from biz.llm.factory import Factory
-from biz.utils.token_util import count_tokens, truncate_text_by_tokens
+from biz.llm.factory import Factory, get_review_max_tokens
 
 
 class BaseReviewFunc(abc.ABC):
@@ -55,11 +53,10 @@ class LLMReviewFunc(BaseReviewFunc):
     """
     基于LLM的Review功能的基础类，定义了一些通用的方法和属性。
     """
-    DEFAULT_REVIEW_MAX_TOKENS = 10000
 
     def __init__(self):
         self.client = Factory().getClient()
-        self.review_max_tokens = int(os.getenv('REVIEW_MAX_TOKENS', self.DEFAULT_REVIEW_MAX_TOKENS))
+        self.review_max_tokens = get_review_max_tokens()
 
     def call_llm(self, messages: List[Dict[str, Any]]) -> str:
         print(f"向 AI请求, messages: {messages}")
@@ -72,10 +69,8 @@ class LLMReviewFunc(BaseReviewFunc):
             print("警告: 内容为空，无法进行评审。")
             return '内容为空，无法进行评审。'
 
-        # 计算tokens数量，如果超过REVIEW_MAX_TOKENS，截断changes_text
-        tokens_count = count_tokens(text)
-        if tokens_count > self.review_max_tokens:
-            text = truncate_text_by_tokens(text, self.review_max_tokens)
+        # 超过REVIEW_MAX_TOKENS时截断text(只编码一次)
+        text, _ = Factory.getTokenizer().fit(text, self.review_max_tokens)
 
         messages = self.get_prompts(text)
         review_result = self.call_llm(messages).strip()
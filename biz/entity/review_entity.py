@@ -1,6 +1,6 @@
 class MergeRequestReviewEntity:
     def __init__(self, project_name: str, author: str, source_branch: str, target_branch: str, updated_at: int,
-                 commits: list, score: float, url: str, review_result: str, url_slug: str):
+                 commits: list, score: float, url: str, review_result: str, url_slug: str, last_commit_id: str = ''):
         self.project_name = project_name
         self.author = author
         self.source_branch = source_branch
@@ -11,6 +11,7 @@ class MergeRequestReviewEntity:
         self.url = url
         self.review_result = review_result
         self.url_slug = url_slug
+        self.last_commit_id = last_commit_id
 
     @property
     def commit_messages(self):
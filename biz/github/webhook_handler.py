@@ -1,21 +1,26 @@
 import json
 import os
-import re
 import time
+from functools import partial
+from urllib.parse import parse_qs, urlparse
 
-import requests
-
+from biz.utils import http_client
+from biz.utils.code_parser import parse_diff
+from biz.utils.concurrent_util import run_concurrently
+from biz.utils.file_filter import get_file_filter
 from biz.utils.log import logger
+from biz.utils.retry_util import backoff_attempts
+from biz.utils.token_util import get_tokenizer
 
 
 
-def filter_changes(changes: list):
+def filter_changes(changes: list, project: str = None):
     '''
     过滤数据，只保留支持的文件类型以及必要的字段信息
     专门处理GitHub格式的变更
+    :param project: 仓库全名(owner/repo)，用于读取项目级的过滤配置
     '''
-    # 从环境变量中获取支持的文件扩展名
-    supported_extensions = os.getenv('SUPPORTED_EXTENSIONS', '.java,.py,.php').split(',')
+    file_filter = get_file_filter(project)
     
     # 筛选出未被删除的文件
     not_deleted_changes = []
@@ -27,30 +32,27 @@ def filter_changes(changes: list):
             
         # 如果没有status字段或status不为"removed"，继续检查diff模式
         diff = change.get('diff', '')
-        if diff:
-            diff_header_match = re.match(r'@@ -\d+,\d+ \+0,0 @@', diff)
-            if diff_header_match:
-                # 检查除了diff头部外的所有行是否都以减号开头
-                diff_lines = diff.split('\n')[1:]  # 跳过diff头部
-                if all(line.startswith('-') or not line for line in diff_lines):
-                    logger.info(f"Detected file deletion via diff pattern: {change.get('new_path')}")
-                    continue
+        if diff and diff.startswith('@@'):
+            # 所有 hunk 的新文件行数都为 0，即只有删除行
+            hunks = parse_diff(diff).hunks
+            if hunks and all(hunk.new_count == 0 and not hunk.added for hunk in hunks):
+                logger.info(f"Detected file deletion via diff pattern: {change.get('new_path')}")
+                continue
                     
         not_deleted_changes.append(change)
     
-    logger.info(f"SUPPORTED_EXTENSIONS: {supported_extensions}")
     logger.info(f"After filtering deleted files: {not_deleted_changes}")
     
-    # 过滤 `new_path` 以支持的扩展名结尾的元素, 仅保留diff和new_path字段
+    # 过滤 `new_path` 命中过滤规则的元素, 仅保留diff和new_path字段
     filtered_changes = [
         {
             'diff': item.get('diff', ''),
             'new_path': item['new_path']
         }
         for item in not_deleted_changes
-        if any(item.get('new_path', '').endswith(ext) for ext in supported_extensions)
+        if file_filter.accept(item)
     ]
-    logger.info(f"After filtering by extension: {filtered_changes}")
+    logger.info(f"After filtering by file filter: {filtered_changes}")
     return filtered_changes
 
 
@@ -63,6 +65,9 @@ class PullRequestHandler:
         self.event_type = None
         self.repo_full_name = None
         self.action = None
+        self.last_commit_id = None
+        # 因 token 预算停止读取后续分页时为 True
+        self.changes_truncated = False
         self.parse_event_type()
 
     def parse_event_type(self):
@@ -75,50 +80,97 @@ class PullRequestHandler:
         self.pull_request_number = self.webhook_data.get('pull_request', {}).get('number')
         self.repo_full_name = self.webhook_data.get('repository', {}).get('full_name')
         self.action = self.webhook_data.get('action')
-
-    def get_pull_request_changes(self) -> list:
+        self.last_commit_id = self.webhook_data.get('pull_request', {}).get('head', {}).get('sha')
+
+    def __get_paginated(self, url: str, headers: dict, token_budget: int = None, page_tokens: callable = None):
+        """
+        以 per_page=100 读取 GitHub 分页接口：先读取第一页，根据 Link 头得到最后一页后，剩余分页按批并发读取
+        :param token_budget: 累计 token 数达到该值后不再读取后续分页，None 表示读取全部
+        :param page_tokens: 计算一页数据 token 数的函数
+        :return: (数据列表, 是否因 token 预算提前结束)；请求失败时返回 (None, False)
+        """
+        per_page = 100
+        concurrency = int(os.getenv('GITHUB_PAGINATION_CONCURRENCY', 4))
+
+        def get_page(page: int):
+            response = http_client.get(url, headers=headers, params={'per_page': per_page, 'page': page})
+            logger.debug(f"Get page {page} from GitHub: {response.status_code}, URL: {url}")
+            if response.status_code != 200:
+                logger.warn(f"Failed to get page {page} from GitHub (URL: {url}): {response.status_code}, {response.text}")
+                return None, None
+            return response.json(), response
+
+        items, response = get_page(1)
+        if items is None:
+            return None, False
+        last_url = response.links.get('last', {}).get('url')
+        last_page = int(parse_qs(urlparse(last_url).query).get('page', [1])[0]) if last_url else 1
+
+        used_tokens = page_tokens(items) if token_budget is not None else 0
+        page = 2
+        while page <= last_page:
+            if token_budget is not None and used_tokens >= token_budget:
+                logger.info(f"Token budget {token_budget} reached at page {page - 1}/{last_page}, skip remaining pages, URL: {url}")
+                return items, True
+            batch = range(page, min(page + concurrency, last_page + 1))
+            for page_items, _ in run_concurrently(*[partial(get_page, batch_page) for batch_page in batch]):
+                if page_items is None:
+                    return None, False
+                items.extend(page_items)
+                if token_budget is not None:
+                    used_tokens += page_tokens(page_items)
+            page = batch.stop
+        return items, False
+
+    def get_pull_request_changes(self, token_budget: int = None) -> list:
+        """
+        获取 Pull Request 的 changes
+        :param token_budget: 需要 Review 的文件 diff 累计 token 数达到该值后不再读取后续分页，None 表示读取全部
+        """
         # 检查是否为 Pull Request Hook 事件
         if self.event_type != 'pull_request':
             logger.warn(f"Invalid event type: {self.event_type}. Only 'pull_request' event is supported now.")
             return []
 
-        # GitHub pull request changes API可能存在延迟，多次尝试
-        max_retries = 3  # 最大重试次数
-        retry_delay = 10  # 重试间隔时间（秒）
-        for attempt in range(max_retries):
+        # GitHub pull request changes API可能存在延迟，以指数退避多次尝试
+        url = f"https://api.github.com/repos/{self.repo_full_name}/pulls/{self.pull_request_number}/files"
+        headers = {
+            'Authorization': f'token {self.github_token}',
+            'Accept': 'application/vnd.github.v3+json'
+        }
+
+        def to_changes(files: list) -> list:
+            # 转换成GitLab格式的changes
+            return [
+                {
+                    'old_path': file.get('previous_filename') or file.get('filename'),
+                    'new_path': file.get('filename'),
+                    'diff': file.get('patch', ''),
+                    'status': file.get('status', '')
+                }
+                for file in files
+            ]
+
+        def page_tokens(files: list) -> int:
+            changes = filter_changes(to_changes(files), self.repo_full_name)
+            return sum(get_tokenizer().count_batch([change['diff'] for change in changes]))
+
+        for attempt, retry_delay in backoff_attempts(max_elapsed=30):
             # 调用 GitHub API 获取 Pull Request 的 files（变更）
-            url = f"https://api.github.com/repos/{self.repo_full_name}/pulls/{self.pull_request_number}/files"
-            headers = {
-                'Authorization': f'token {self.github_token}',
-                'Accept': 'application/vnd.github.v3+json'
-            }
-            response = requests.get(url, headers=headers)
-            logger.debug(
-                f"Get changes response from GitHub (attempt {attempt + 1}): {response.status_code}, {response.text}, URL: {url}")
+            files, self.changes_truncated = self.__get_paginated(url, headers, token_budget, page_tokens)
+            logger.debug(f"Get changes from GitHub (attempt {attempt}): {files}, URL: {url}")
 
             # 检查请求是否成功
-            if response.status_code == 200:
-                files = response.json()
-                if files:
-                    # 转换成GitLab格式的changes
-                    changes = []
-                    for file in files:
-                        change = {
-                            'old_path': file.get('filename'),
-                            'new_path': file.get('filename'),
-                            'diff': file.get('patch', '')
-                        }
-                        changes.append(change)
-                    return changes
-                else:
-                    logger.info(
-                        f"Changes is empty, retrying in {retry_delay} seconds... (attempt {attempt + 1}/{max_retries}), URL: {url}")
-                    time.sleep(retry_delay)
-            else:
-                logger.warn(f"Failed to get changes from GitHub (URL: {url}): {response.status_code}, {response.text}")
+            if files is None:
                 return []
-
-        logger.warning(f"Max retries ({max_retries}) reached. Changes is still empty.")
+            if files:
+                return to_changes(files)
+            if retry_delay is None:
+                break
+            logger.info(f"Changes is empty, retrying in {retry_delay} seconds... (attempt {attempt}), URL: {url}")
+            time.sleep(retry_delay)
+
+        logger.warning(f"Max retries ({attempt}) reached. Changes is still empty.")
         return []  # 达到最大重试次数后返回空列表
 
     def get_pull_request_commits(self) -> list:
@@ -132,30 +184,28 @@ class PullRequestHandler:
             'Authorization': f'token {self.github_token}',
             'Accept': 'application/vnd.github.v3+json'
         }
-        response = requests.get(url, headers=headers)
-        logger.debug(f"Get commits response from GitHub: {response.status_code}, {response.text}")
-        
+        github_commits, _ = self.__get_paginated(url, headers)
+        logger.debug(f"Get commits from GitHub: {github_commits}")
+
         # 检查请求是否成功
-        if response.status_code == 200:
-            # 将GitHub的commits转换为GitLab格式的commits
-            github_commits = response.json()
-            gitlab_format_commits = []
-            for commit in github_commits:
-                gitlab_commit = {
-                    'id': commit.get('sha'),
-                    'title': commit.get('commit', {}).get('message', '').split('\n')[0],
-                    'message': commit.get('commit', {}).get('message', ''),
-                    'author_name': commit.get('commit', {}).get('author', {}).get('name'),
-                    'author_email': commit.get('commit', {}).get('author', {}).get('email'),
-                    'created_at': commit.get('commit', {}).get('author', {}).get('date'),
-                    'web_url': commit.get('html_url')
-                }
-                gitlab_format_commits.append(gitlab_commit)
-            return gitlab_format_commits
-        else:
-            logger.warn(f"Failed to get commits: {response.status_code}, {response.text}")
+        if github_commits is None:
             return []
 
+        # 将GitHub的commits转换为GitLab格式的commits
+        gitlab_format_commits = []
+        for commit in github_commits:
+            gitlab_commit = {
+                'id': commit.get('sha'),
+                'title': commit.get('commit', {}).get('message', '').split('\n')[0],
+                'message': commit.get('commit', {}).get('message', ''),
+                'author_name': commit.get('commit', {}).get('author', {}).get('name'),
+                'author_email': commit.get('commit', {}).get('author', {}).get('email'),
+                'created_at': commit.get('commit', {}).get('author', {}).get('date'),
+                'web_url': commit.get('html_url')
+            }
+            gitlab_format_commits.append(gitlab_commit)
+        return gitlab_format_commits
+
     def add_pull_request_notes(self, review_result):
         url = f"https://api.github.com/repos/{self.repo_full_name}/issues/{self.pull_request_number}/comments"
         headers = {
@@ -165,7 +215,7 @@ class PullRequestHandler:
         data = {
             'body': review_result
         }
-        response = requests.post(url, headers=headers, json=data)
+        response = http_client.post(url, headers=headers, json=data)
         logger.debug(f"Add comment to GitHub PR {url}: {response.status_code}, {response.text}")
         if response.status_code == 201:
             logger.info("Comment successfully added to pull request.")
@@ -236,7 +286,7 @@ class PushHandler:
         data = {
             'body': message
         }
-        response = requests.post(url, headers=headers, json=data)
+        response = http_client.post(url, headers=headers, json=data)
         logger.debug(f"Add comment to commit {last_commit_id}: {response.status_code}, {response.text}")
         if response.status_code == 201:
             logger.info("Comment successfully added to push commit.")
@@ -251,7 +301,7 @@ class PushHandler:
             'Authorization': f'token {self.github_token}',
             'Accept': 'application/vnd.github.v3+json'
         }
-        response = requests.get(url, headers=headers)
+        response = http_client.get(url, headers=headers)
         logger.debug(
             f"Get commits response from GitHub for repository_commits: {response.status_code}, {response.text}, URL: {url}")
 
@@ -268,7 +318,7 @@ class PushHandler:
             'Authorization': f'token {self.github_token}',
             'Accept': 'application/vnd.github.v3+json'
         }
-        response = requests.get(url, headers=headers)
+        response = http_client.get(url, headers=headers)
         logger.debug(
             f"Get commit response from GitHub: {response.status_code}, {response.text}, URL: {url}")
 
@@ -283,7 +333,7 @@ class PushHandler:
             'Authorization': f'token {self.github_token}',
             'Accept': 'application/vnd.github.v3+json'
         }
-        response = requests.get(url, headers=headers)
+        response = http_client.get(url, headers=headers)
         logger.debug(
             f"Get changes response from GitHub for repository_compare: {response.status_code}, {response.text}, URL: {url}")
 
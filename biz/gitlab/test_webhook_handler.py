@@ -2,9 +2,9 @@
 # -*- coding: utf-8 -*-
 # @Time    : 2025/3/18 17:58
 # @Author  : Arrow
-from unittest import TestCase, main
+from unittest import TestCase, main, mock
 
-from biz.gitlab.webhook_handler import PushHandler
+from biz.gitlab.webhook_handler import MergeRequestHandler, PushHandler
 
 
 # @Describe:
@@ -32,5 +32,32 @@ class TestPushHandler(TestCase):
         self.assertTrue(parent_id)
 
 
+class TestMergeRequestHandler(TestCase):
+    def test_get_merge_request_commits_paginated(self):
+        """超过一页的 commits 按 X-Next-Page 全部读取"""
+        webhook_data = {'object_kind': 'merge_request', 'object_attributes': {'iid': 1, 'target_project_id': 2}}
+        handler = MergeRequestHandler(webhook_data, 'token', 'https://gitlab.example.com')
+        pages = [
+            mock.Mock(status_code=200, headers={'X-Next-Page': '2'}, json=lambda: [{'id': str(i)} for i in range(100)]),
+            mock.Mock(status_code=200, headers={'X-Next-Page': ''}, json=lambda: [{'id': '100'}]),
+        ]
+        with mock.patch('biz.gitlab.webhook_handler.http_client.get', side_effect=pages) as get:
+            commits = handler.get_merge_request_commits()
+        self.assertEqual(len(commits), 101)
+        self.assertEqual([call.kwargs['params'] for call in get.call_args_list],
+                         [{'page': 1, 'per_page': 100}, {'page': 2, 'per_page': 100}])
+
+    def test_no_sleep_after_last_attempt(self):
+        """最后一次尝试之后不再等待"""
+        webhook_data = {'object_kind': 'merge_request', 'object_attributes': {'iid': 1, 'target_project_id': 2}}
+        handler = MergeRequestHandler(webhook_data, 'token', 'https://gitlab.example.com')
+        not_ready = mock.Mock(status_code=200, json=lambda: {'diff_refs': None})
+        with mock.patch('biz.gitlab.webhook_handler.http_client.get', return_value=not_ready) as get, \
+                mock.patch('biz.gitlab.webhook_handler.time.sleep') as sleep:
+            self.assertFalse(handler.wait_for_diff_ready(max_elapsed=3))
+        self.assertEqual(get.call_count, sleep.call_count + 1)
+        self.assertEqual(sum(call.args[0] for call in sleep.call_args_list), 3)
+
+
 if __name__ == '__main__':
     main()
@@ -3,28 +3,31 @@ import re
 import time
 from urllib.parse import urljoin
 
-import requests
-
+from biz.utils import http_client
+from biz.utils.file_filter import get_file_filter
+from biz.utils.git_mirror import get_mirror_changes
 from biz.utils.log import logger
+from biz.utils.retry_util import backoff_attempts
+from biz.utils.token_util import count_tokens
 
 
-def filter_changes(changes: list):
+def filter_changes(changes: list, project: str = None):
     '''
     过滤数据，只保留支持的文件类型以及必要的字段信息
+    :param project: 项目路径(path_with_namespace)，用于读取项目级的过滤配置
     '''
-    # 从环境变量中获取支持的文件扩展名
-    supported_extensions = os.getenv('SUPPORTED_EXTENSIONS', '.java,.py,.php').split(',')
+    file_filter = get_file_filter(project)
 
     filter_deleted_files_changes = [change for change in changes if change.get("deleted_file") == False]
 
-    # 过滤 `new_path` 以支持的扩展名结尾的元素, 仅保留diff和new_path字段
+    # 过滤 `new_path` 命中过滤规则的元素, 仅保留diff和new_path字段
     filtered_changes = [
         {
             'diff': item.get('diff', ''),
             'new_path': item['new_path']
         }
         for item in filter_deleted_files_changes
-        if any(item.get('new_path', '').endswith(ext) for ext in supported_extensions)
+        if file_filter.accept(item)
     ]
     return filtered_changes
 
@@ -48,6 +51,24 @@ def slugify_url(original_url: str) -> str:
 
 
 
+def repository_compare(gitlab_url: str, gitlab_token: str, project_id, before: str, after: str) -> list:
+    # 比较两个提交之间的差异
+    url = f"{urljoin(f'{gitlab_url}/', f'api/v4/projects/{project_id}/repository/compare')}?from={before}&to={after}"
+    headers = {
+        'Private-Token': gitlab_token
+    }
+    response = http_client.get(url, headers=headers, verify=False)
+    logger.debug(
+        f"Get changes response from GitLab for repository_compare: {response.status_code}, {response.text}, URL: {url}")
+
+    if response.status_code == 200:
+        return response.json().get('diffs', [])
+    else:
+        logger.warn(
+            f"Failed to get changes for repository_compare: {response.status_code}, {response.text}")
+        return []
+
+
 class MergeRequestHandler:
     def __init__(self, webhook_data: dict, gitlab_token: str, gitlab_url: str):
         self.merge_request_iid = None
@@ -57,6 +78,12 @@ class MergeRequestHandler:
         self.event_type = None
         self.project_id = None
         self.action = None
+        self.project_path = None
+        self.last_commit_id = None
+        self.oldrev = None
+        self.diffs_api_supported = True
+        # 因 token 预算停止读取后续 diff 分页时为 True
+        self.changes_truncated = False
         self.parse_event_type()
 
     def parse_event_type(self):
@@ -71,62 +98,176 @@ class MergeRequestHandler:
         self.merge_request_iid = merge_request.get('iid')
         self.project_id = merge_request.get('target_project_id')
         self.action = merge_request.get('action')
-
-    def get_merge_request_changes(self) -> list:
+        self.project_path = self.webhook_data.get('project', {}).get('path_with_namespace')
+        self.last_commit_id = merge_request.get('last_commit', {}).get('id')
+        # 只有推送了新的提交时，update 事件才会携带 oldrev
+        self.oldrev = merge_request.get('oldrev')
+
+    def get_merge_request_changes(self, token_budget: int = None) -> list:
+        """
+        获取 Merge Request 的 changes，优先分页读取 /diffs 接口
+        :param token_budget: 需要 Review 的文件 diff 累计 token 数达到该值后不再读取后续分页，None 表示读取全部
+        """
         # 检查是否为 Merge Request Hook 事件
         if self.event_type != 'merge_request':
             logger.warn(f"Invalid event type: {self.event_type}. Only 'merge_request' event is supported now.")
             return []
 
-        # Gitlab merge request changes API可能存在延迟，多次尝试
-        max_retries = 3  # 最大重试次数
-        retry_delay = 10  # 重试间隔时间（秒）
-        for attempt in range(max_retries):
-            # 调用 GitLab API 获取 Merge Request 的 changes
-            url = urljoin(f"{self.gitlab_url}/",
-                          f"api/v4/projects/{self.project_id}/merge_requests/{self.merge_request_iid}/changes")
-            headers = {
-                'Private-Token': self.gitlab_token
-            }
-            response = requests.get(url, headers=headers, verify=False)
-            logger.debug(
-                f"Get changes response from GitLab (attempt {attempt + 1}): {response.status_code}, {response.text}, URL: {url}")
-
-            # 检查请求是否成功
-            if response.status_code == 200:
-                changes = response.json().get('changes', [])
-                if changes:
-                    return changes
-                else:
-                    logger.info(
-                        f"Changes is empty, retrying in {retry_delay} seconds... (attempt {attempt + 1}/{max_retries}), URL: {url}")
-                    time.sleep(retry_delay)
-            else:
-                logger.warn(f"Failed to get changes from GitLab (URL: {url}): {response.status_code}, {response.text}")
+        # 开启 GIT_MIRROR_ENABLED 时优先通过本地 mirror 计算 diff，失败时回退到 API
+        changes = self.__get_merge_request_changes_from_mirror()
+        if changes is not None:
+            return changes
+
+        # Gitlab 生成 MR diff 存在延迟，先等待 diff 准备完成，再以指数退避重试
+        self.wait_for_diff_ready()
+        for attempt, retry_delay in backoff_attempts(max_elapsed=30):
+            changes = None
+            if self.diffs_api_supported:
+                changes = self.__get_merge_request_diffs(token_budget)
+            if not self.diffs_api_supported:
+                # GitLab 15.7 之前没有 /diffs 接口，使用 /changes 接口
+                changes = self.__get_merge_request_changes_legacy(attempt)
+            if changes is None:
                 return []
+            if changes:
+                return changes
+            if retry_delay is None:
+                break
+
+            logger.info(f"Changes is empty, retrying in {retry_delay} seconds... (attempt {attempt})")
+            time.sleep(retry_delay)
 
-        logger.warning(f"Max retries ({max_retries}) reached. Changes is still empty.")
+        logger.warning(f"Max retries ({attempt}) reached. Changes is still empty.")
         return []  # 达到最大重试次数后返回空列表
 
+    def __get_merge_request_changes_from_mirror(self):
+        merge_request = self.webhook_data.get('object_attributes', {})
+        target = merge_request.get('target', {})
+        target_branch = merge_request.get('target_branch')
+        if not self.last_commit_id or not target_branch:
+            return None
+        return get_mirror_changes(
+            project_path=target.get('path_with_namespace', ''),
+            remote_url=target.get('git_http_url', ''),
+            token=self.gitlab_token,
+            refs=[target_branch, f'refs/merge-requests/{self.merge_request_iid}/head'],
+            base=f'refs/heads/{target_branch}',
+            head=self.last_commit_id,
+            use_merge_base=True,
+        )
+
+    def __get_merge_request_diffs(self, token_budget: int = None):
+        """
+        分页读取 /merge_requests/:iid/diffs，逐页解析，token 预算用完后停止读取
+        :return: changes 列表；请求失败时返回 None，接口不存在时同时将 diffs_api_supported 置为 False
+        """
+        url = urljoin(f"{self.gitlab_url}/",
+                      f"api/v4/projects/{self.project_id}/merge_requests/{self.merge_request_iid}/diffs")
+        headers = {
+            'Private-Token': self.gitlab_token
+        }
+        per_page = int(os.getenv('GITLAB_DIFFS_PER_PAGE', 50))
+        changes = []
+        used_tokens = 0
+        page = 1
+        self.changes_truncated = False
+        while page:
+            response = http_client.get(url, headers=headers, params={'page': page, 'per_page': per_page},
+                                       verify=False)
+            logger.debug(f"Get diffs response from GitLab (page {page}): {response.status_code}, URL: {url}")
+            if response.status_code == 404 and page == 1:
+                logger.info(f"GitLab diffs API is not available, fallback to changes API, URL: {url}")
+                self.diffs_api_supported = False
+                return None
+            if response.status_code != 200:
+                logger.warn(f"Failed to get diffs from GitLab (URL: {url}, page: {page}): {response.status_code}, {response.text}")
+                return None
+
+            for change in response.json():
+                changes.append(change)
+                if token_budget is not None and filter_changes([change], self.project_path):
+                    used_tokens += count_tokens(change.get('diff', ''))
+            next_page = response.headers.get('X-Next-Page')
+            page = int(next_page) if next_page else None
+            if page and token_budget is not None and used_tokens >= token_budget:
+                logger.info(f"Token budget {token_budget} reached at page {page - 1}, skip remaining diffs, URL: {url}")
+                self.changes_truncated = True
+                break
+        return changes
+
+    def __get_merge_request_changes_legacy(self, attempt: int = 1):
+        # 调用 GitLab API 获取 Merge Request 的 changes
+        url = urljoin(f"{self.gitlab_url}/",
+                      f"api/v4/projects/{self.project_id}/merge_requests/{self.merge_request_iid}/changes")
+        headers = {
+            'Private-Token': self.gitlab_token
+        }
+        response = http_client.get(url, headers=headers, verify=False)
+        logger.debug(
+            f"Get changes response from GitLab (attempt {attempt}): {response.status_code}, {response.text}, URL: {url}")
+
+        # 检查请求是否成功
+        if response.status_code == 200:
+            return response.json().get('changes', [])
+        logger.warn(f"Failed to get changes from GitLab (URL: {url}): {response.status_code}, {response.text}")
+        return None
+
+    def wait_for_diff_ready(self, max_elapsed: float = 30) -> bool:
+        """
+        轮询 MR 详情，等待 GitLab 完成 diff 的准备(prepared_at 和 diff_refs 不为空)
+        :return: diff 是否已准备完成，超时或请求失败时返回 False
+        """
+        url = urljoin(f"{self.gitlab_url}/",
+                      f"api/v4/projects/{self.project_id}/merge_requests/{self.merge_request_iid}")
+        headers = {
+            'Private-Token': self.gitlab_token
+        }
+        for _, retry_delay in backoff_attempts(max_elapsed=max_elapsed):
+            response = http_client.get(url, headers=headers, verify=False)
+            if response.status_code != 200:
+                logger.warn(f"Failed to get merge request from GitLab (URL: {url}): {response.status_code}")
+                return False
+            merge_request = response.json()
+            # 老版本 GitLab 没有 prepared_at 字段，只判断 diff_refs
+            if merge_request.get('diff_refs') and merge_request.get('prepared_at', True):
+                return True
+            if retry_delay is None:
+                break
+            logger.info(f"Merge request diff is not ready, retrying in {retry_delay} seconds..., URL: {url}")
+            time.sleep(retry_delay)
+        return False
+
+    def get_merge_request_incremental_changes(self, base_commit_id: str) -> list:
+        """获取 base_commit_id(上次 Review 的 head) 到当前 head 之间新增的变更"""
+        if self.event_type != 'merge_request' or not self.last_commit_id:
+            return []
+        return repository_compare(self.gitlab_url, self.gitlab_token, self.project_id, base_commit_id,
+                                  self.last_commit_id)
+
     def get_merge_request_commits(self) -> list:
         # 检查是否为 Merge Request Hook 事件
         if self.event_type != 'merge_request':
             return []
 
-        # 调用 GitLab API 获取 Merge Request 的 commits
+        # 调用 GitLab API 获取 Merge Request 的 commits，默认每页只返回 20 个，按 X-Next-Page 读取所有分页
         url = urljoin(f"{self.gitlab_url}/",
                       f"api/v4/projects/{self.project_id}/merge_requests/{self.merge_request_iid}/commits")
         headers = {
             'Private-Token': self.gitlab_token
         }
-        response = requests.get(url, headers=headers, verify=False)
-        logger.debug(f"Get commits response from gitlab: {response.status_code}, {response.text}")
-        # 检查请求是否成功
-        if response.status_code == 200:
-            return response.json()
-        else:
-            logger.warn(f"Failed to get commits: {response.status_code}, {response.text}")
-            return []
+        commits = []
+        page = 1
+        while page:
+            response = http_client.get(url, headers=headers, params={'page': page, 'per_page': 100}, verify=False)
+            logger.debug(f"Get commits response from gitlab (page {page}): {response.status_code}, {response.text}")
+            # 检查请求是否成功
+            if response.status_code != 200:
+                logger.warn(f"Failed to get commits (page {page}): {response.status_code}, {response.text}")
+                return []
+            commits.extend(response.json())
+            next_page = response.headers.get('X-Next-Page')
+            page = int(next_page) if next_page else None
+        return commits
 
     def add_merge_request_notes(self, review_result):
         url = urljoin(f"{self.gitlab_url}/",
@@ -138,7 +279,7 @@ class MergeRequestHandler:
         data = {
             'body': review_result
         }
-        response = requests.post(url, headers=headers, json=data, verify=False)
+        response = http_client.post(url, headers=headers, json=data, verify=False)
         logger.debug(f"Add notes to gitlab {url}: {response.status_code}, {response.text}")
         if response.status_code == 201:
             logger.info("Note successfully added to merge request.")
@@ -211,7 +352,7 @@ class PushHandler:
         data = {
             'note': message
         }
-        response = requests.post(url, headers=headers, json=data, verify=False)
+        response = http_client.post(url, headers=headers, json=data, verify=False)
         logger.debug(f"Add comment to commit {last_commit_id}: {response.status_code}, {response.text}")
         if response.status_code == 201:
             logger.info("Comment successfully added to push commit.")
@@ -226,7 +367,7 @@ class PushHandler:
         headers = {
             'Private-Token': self.gitlab_token
         }
-        response = requests.get(url, headers=headers, verify=False)
+        response = http_client.get(url, headers=headers, verify=False)
         logger.debug(
             f"Get commits response from GitLab for repository_commits: {response.status_code}, {response.text}, URL: {url}")
 
@@ -244,21 +385,7 @@ class PushHandler:
         return ""
 
     def repository_compare(self, before: str, after: str):
-        # 比较两个提交之间的差异
-        url = f"{urljoin(f'{self.gitlab_url}/', f'api/v4/projects/{self.project_id}/repository/compare')}?from={before}&to={after}"
-        headers = {
-            'Private-Token': self.gitlab_token
-        }
-        response = requests.get(url, headers=headers, verify=False)
-        logger.debug(
-            f"Get changes response from GitLab for repository_compare: {response.status_code}, {response.text}, URL: {url}")
-
-        if response.status_code == 200:
-            return response.json().get('diffs', [])
-        else:
-            logger.warn(
-                f"Failed to get changes for repository_compare: {response.status_code}, {response.text}")
-            return []
+        return repository_compare(self.gitlab_url, self.gitlab_token, self.project_id, before, after)
 
     def get_push_changes(self) -> list:
         # 检查是否为 Push 事件
@@ -281,6 +408,19 @@ class PushHandler:
             if after.startswith('0000000'):
                 # 删除分支处理
                 return []
+            # 开启 GIT_MIRROR_ENABLED 时优先通过本地 mirror 计算 diff，失败时回退到 compare API
+            project = self.webhook_data.get('project', {})
+            changes = get_mirror_changes(
+                project_path=project.get('path_with_namespace', ''),
+                remote_url=project.get('git_http_url', ''),
+                token=self.gitlab_token,
+                refs=[self.webhook_data.get('ref', '')],
+                # 创建分支时以第一个提交的父提交为起点
+                base=f"{self.commit_list[0].get('id')}^" if before.startswith('0000000') else before,
+                head=after,
+            )
+            if changes is not None:
+                return changes
             if before.startswith('0000000'):
                 # 创建分支处理
                 first_commit_id = self.commit_list[0].get('id')
@@ -0,0 +1,350 @@
+import os
+import random
+import threading
+import time
+import uuid
+
+from biz.llm.client.base import BaseClient
+from biz.llm.types import NOT_GIVEN
+from biz.utils.log import logger
+from biz.utils.metrics import metrics
+from biz.utils.rate_limiter import RateLimitExceeded
+
+
+class Endpoint:
+    """负载均衡中的一个地址"""
+
+    def __init__(self, client: BaseClient):
+        self.client = client
+        self.url = getattr(client, 'base_url', '')
+
+
+class MemoryEndpointState:
+    """async 驱动使用的进程内地址状态"""
+
+    def __init__(self, size: int):
+        self.outstanding = [0] * size
+        self.requests = [0] * size
+        self.errors = [0] * size
+        # 连续失败次数，达到 eject_after 时摘除
+        self.failures = [0] * size
+        self.ejected_until = [0.0] * size
+        self._last_checked = [0.0] * size
+        self._lock = threading.Lock()
+
+    def acquire(self, candidates: list) -> tuple[int | None, str, int]:
+        """
+        在 candidates(地址下标)中选择进行中请求最少的可用地址，所有地址都被摘除时选择最早恢复的地址
+        :return: (地址下标，没有可选地址时为 None, 请求标识, 被摘除的地址数)
+        """
+        now = time.time()
+        with self._lock:
+            ejected = sum(1 for until in self.ejected_until if until > now)
+            if not candidates:
+                return None, '', ejected
+            available = [index for index in candidates if self.ejected_until[index] <= now]
+            if available:
+                least = min(self.outstanding[index] for index in available)
+                index = random.choice([index for index in available if self.outstanding[index] == least])
+            else:
+                index = min(candidates, key=lambda index: self.ejected_until[index])
+            self.outstanding[index] += 1
+            self.requests[index] += 1
+            return index, uuid.uuid4().hex, ejected
+
+    def release(self, index: int, token: str, failed: bool, eject_after: int, eject_seconds: float) -> int:
+        """:return: 本次失败导致地址被摘除时返回连续失败次数，否则返回 0"""
+        with self._lock:
+            self.outstanding[index] -= 1
+            if not failed:
+                self.failures[index] = 0
+                self.ejected_until[index] = 0.0
+                return 0
+            self.errors[index] += 1
+            self.failures[index] += 1
+            now = time.time()
+            # 摘除前已发出的请求陆续失败时不重复摘除
+            if self.failures[index] < eject_after or self.ejected_until[index] > now:
+                return 0
+            self.ejected_until[index] = now + eject_seconds
+            return self.failures[index]
+
+    def restore(self, index: int, eject_after: int):
+        """健康检查通过后恢复：连续失败次数保持在阈值，恢复后再次失败时立即重新摘除"""
+        with self._lock:
+            self.failures[index] = max(self.failures[index], eject_after)
+            self.ejected_until[index] = 0.0
+
+    def ejected(self) -> list:
+        with self._lock:
+            return [index for index, until in enumerate(self.ejected_until) if until]
+
+    def claim_health_check(self, index: int, interval: float) -> bool:
+        now = time.time()
+        with self._lock:
+            if now - self._last_checked[index] < interval:
+                return False
+            self._last_checked[index] = now
+            return True
+
+    def stats(self) -> list:
+        now = time.time()
+        with self._lock:
+            return [{'outstanding': self.outstanding[index], 'requests': self.requests[index],
+                     'errors': self.errors[index], 'ejected': self.ejected_until[index] > now}
+                    for index in range(len(self.outstanding))]
+
+
+class RedisEndpointState:
+    """
+    rq 驱动使用的 Redis 实现。每个任务都在 fork 出的子进程中执行，进程内的状态随任务结束丢失，
+    进行中请求数、连续失败次数和摘除时间保存在 Redis 中，所有 worker 共享：
+    - 进行中的请求记录在有序集合中，score 为租约到期时间，进程异常退出时在 lease 秒后自动回收
+    - 地址的选择和失败计数在 Lua 脚本中原子执行
+    """
+    KEY_PREFIX = 'ai_codereview:llm_endpoint:'
+    KEY_TTL = 7 * 24 * 3600
+    ACQUIRE_SCRIPT = """
+local now, n = tonumber(ARGV[1]), tonumber(ARGV[4])
+local best, best_load, fallback, fallback_until, ejected = nil, nil, nil, nil, 0
+for i = 1, n do
+    redis.call('ZREMRANGEBYSCORE', KEYS[i], '-inf', now)
+    local until_ = tonumber(redis.call('HGET', KEYS[n + i], 'ejected_until') or '0')
+    if until_ > now then
+        ejected = ejected + 1
+    end
+    if string.sub(ARGV[5], i, i) == '1' then
+        if until_ <= now then
+            local load = redis.call('ZCARD', KEYS[i])
+            if best == nil or load < best_load then
+                best, best_load = i, load
+            end
+        elseif fallback == nil or until_ < fallback_until then
+            fallback, fallback_until = i, until_
+        end
+    end
+end
+local chosen = best or fallback
+if chosen == nil then
+    return {0, ejected}
+end
+redis.call('ZADD', KEYS[chosen], ARGV[2], ARGV[3])
+redis.call('EXPIRE', KEYS[chosen], ARGV[6])
+redis.call('HINCRBY', KEYS[n + chosen], 'requests', 1)
+redis.call('EXPIRE', KEYS[n + chosen], ARGV[6])
+return {chosen, ejected}
+"""
+    RELEASE_SCRIPT = """
+redis.call('ZREM', KEYS[1], ARGV[1])
+if ARGV[2] == '0' then
+    redis.call('HSET', KEYS[2], 'failures', 0, 'ejected_until', 0)
+    return 0
+end
+redis.call('HINCRBY', KEYS[2], 'errors', 1)
+local failures = redis.call('HINCRBY', KEYS[2], 'failures', 1)
+local until_ = tonumber(redis.call('HGET', KEYS[2], 'ejected_until') or '0')
+if failures < tonumber(ARGV[4]) or until_ > tonumber(ARGV[3]) then
+    return 0
+end
+redis.call('HSET', KEYS[2], 'ejected_until', tonumber(ARGV[3]) + tonumber(ARGV[5]))
+return failures
+"""
+
+    def __init__(self, provider: str, urls: list, lease: float, connection=None):
+        if connection is None:
+            from biz.utils.queue import get_redis
+            connection = get_redis()
+        self.connection = connection
+        self.lease = lease
+        self._inflight_keys = [f'{self.KEY_PREFIX}{provider}:{url}:inflight' for url in urls]
+        self._state_keys = [f'{self.KEY_PREFIX}{provider}:{url}:state' for url in urls]
+        self._check_keys = [f'{self.KEY_PREFIX}{provider}:{url}:health_check' for url in urls]
+        self._acquire_script = connection.register_script(self.ACQUIRE_SCRIPT)
+        self._release_script = connection.register_script(self.RELEASE_SCRIPT)
+
+    def acquire(self, candidates: list) -> tuple[int | None, str, int]:
+        token = uuid.uuid4().hex
+        now = time.time()
+        # 进行中请求数相同时选择 candidates 中靠前的地址，打乱顺序使请求均匀分布
+        order = list(range(len(self._inflight_keys)))
+        random.shuffle(order)
+        mask = ''.join('1' if index in candidates else '0' for index in order)
+        chosen, ejected = self._acquire_script(
+            keys=[self._inflight_keys[index] for index in order] + [self._state_keys[index] for index in order],
+            args=[now, now + self.lease, token, len(order), mask, self.KEY_TTL])
+        if not chosen:
+            return None, '', ejected
+        return order[chosen - 1], token, ejected
+
+    def release(self, index: int, token: str, failed: bool, eject_after: int, eject_seconds: float) -> int:
+        return self._release_script(keys=[self._inflight_keys[index], self._state_keys[index]],
+                                    args=[token, int(failed), time.time(), eject_after, eject_seconds])
+
+    def restore(self, index: int, eject_after: int):
+        self.connection.hset(self._state_keys[index], mapping={'failures': eject_after, 'ejected_until': 0})
+
+    def ejected(self) -> list:
+        pipe = self.connection.pipeline()
+        for key in self._state_keys:
+            pipe.hget(key, 'ejected_until')
+        return [index for index, until in enumerate(pipe.execute()) if until and float(until)]
+
+    def claim_health_check(self, index: int, interval: float) -> bool:
+        # 多个 worker 进程中同一个地址每个周期只检查一次
+        return bool(self.connection.set(self._check_keys[index], 1, nx=True, px=max(int(interval * 1000), 1)))
+
+    def stats(self) -> list:
+        now = time.time()
+        pipe = self.connection.pipeline()
+        for inflight_key, state_key in zip(self._inflight_keys, self._state_keys):
+            pipe.zcount(inflight_key, now, '+inf')
+            pipe.hgetall(state_key)
+        results = pipe.execute()
+        stats = []
+        for outstanding, state in zip(results[::2], results[1::2]):
+            state = {key.decode() if isinstance(key, bytes) else key: float(value) for key, value in state.items()}
+            stats.append({'outstanding': outstanding, 'requests': int(state.get('requests', 0)),
+                          'errors': int(state.get('errors', 0)), 'ejected': state.get('ejected_until', 0) > now})
+        return stats
+
+
+class LoadBalancedClient(BaseClient):
+    """
+    多个 Ollama / OpenAI 兼容地址之间的负载均衡客户端：
+    - 每次请求发往进行中请求数最少的可用地址，相同时随机选择
+    - 连续失败 eject_after 次的地址被摘除 eject_seconds 秒，期间后台线程定期做健康检查(确认模型已部署)，
+      检查通过后提前恢复；摘除时间结束或恢复后再次失败时立即重新摘除
+    - 请求失败时换一个地址重试，每个地址最多尝试一次；等待并发名额超时(RateLimitExceeded)不重试。
+      所有地址都失败时，客户端提供 error_message 的(如 DeepSeek)返回错误说明，否则抛出最后一次的异常
+    """
+
+    def __init__(self, provider: str, clients: list, eject_after: int = 3, eject_seconds: float = 30,
+                 health_check_interval: float = 10, state=None):
+        self.provider = provider
+        self.endpoints = [Endpoint(client) for client in clients]
+        self.eject_after = eject_after
+        self.eject_seconds = eject_seconds
+        self.health_check_interval = health_check_interval
+        self.state = state or MemoryEndpointState(len(clients))
+        self.default_model = getattr(clients[0], 'default_model', '')
+        self.base_url = ','.join(endpoint.url for endpoint in self.endpoints)
+        self._lock = threading.Lock()
+        self._health_checker = None
+
+    def _next(self, tried: set, error: Exception = None) -> tuple[int | None, str]:
+        index, token, ejected = self.state.acquire([index for index in range(len(self.endpoints))
+                                                    if index not in tried])
+        if ejected:
+            # rq 的每个任务都在新的子进程中执行，发现有地址被摘除时在当前进程中启动健康检查
+            self._start_health_checker()
+        if index is not None:
+            tried.add(index)
+            if error is not None:
+                logger.warn(f"{self.provider} request failed ({error}), retrying on {self.endpoints[index].url}.")
+        return index, token
+
+    def _release(self, index: int, token: str, error: Exception = None):
+        failures = self.state.release(index, token, error is not None, self.eject_after, self.eject_seconds)
+        if failures:
+            metrics.incr('llm_endpoint_ejections')
+            logger.warn(f"{self.provider} endpoint {self.endpoints[index].url} ejected for "
+                        f"{self.eject_seconds:.0f}s after {failures} consecutive failures: {error}")
+            self._start_health_checker()
+
+    def _give_up(self, error: Exception) -> str:
+        error_message = getattr(self.endpoints[0].client, 'error_message', None)
+        if error_message is None:
+            raise error
+        return error_message(error)
+
+    def completions(self, messages, model=NOT_GIVEN) -> str:
+        tried, error = set(), None
+        while True:
+            index, token = self._next(tried, error)
+            if index is None:
+                return self._give_up(error)
+            try:
+                result = self.endpoints[index].client.completions(messages, model)
+            except RateLimitExceeded:
+                self._release(index, token)
+                raise
+            except Exception as e:
+                self._release(index, token, e)
+                error = e
+                continue
+            self._release(index, token)
+            return result
+
+    async def acompletions(self, messages, model=NOT_GIVEN) -> str:
+        tried, error = set(), None
+        while True:
+            index, token = self._next(tried, error)
+            if index is None:
+                return self._give_up(error)
+            try:
+                result = await self.endpoints[index].client.acompletions(messages, model)
+            except RateLimitExceeded:
+                self._release(index, token)
+                raise
+            except Exception as e:
+                self._release(index, token, e)
+                error = e
+                continue
+            self._release(index, token)
+            return result
+
+    def health_check(self) -> bool:
+        return any([self._check(index) for index in range(len(self.endpoints))])
+
+    def _check(self, index: int) -> bool:
+        endpoint = self.endpoints[index]
+        try:
+            endpoint.client.health_check()
+        except Exception as e:
+            logger.debug(f"{self.provider} endpoint {endpoint.url} health check failed: {e}")
+            return False
+        if index in self.state.ejected():
+            logger.info(f"{self.provider} endpoint {endpoint.url} passed health check, restored.")
+            self.state.restore(index, self.eject_after)
+        return True
+
+    def _start_health_checker(self):
+        """有地址被摘除时启动后台健康检查线程(fork 出的子进程中按需重新启动)"""
+        with self._lock:
+            if self._health_checker is not None and self._health_checker.is_alive():
+                return
+            self._health_checker = threading.Thread(target=self._run_health_checks, daemon=True,
+                                                    name=f'llm-health-{self.provider}')
+            self._health_checker.start()
+
+    def _run_health_checks(self):
+        while True:
+            time.sleep(self.health_check_interval)
+            ejected = self.state.ejected()
+            if not ejected:
+                return
+            for index in ejected:
+                if self.state.claim_health_check(index, self.health_check_interval):
+                    self._check(index)
+
+    def stats(self) -> dict:
+        return {endpoint.url: stats for endpoint, stats in zip(self.endpoints, self.state.stats())}
+
+
+def split_base_urls(value: str) -> list:
+    return [url.strip() for url in (value or '').split(',') if url.strip()]
+
+
+def create_load_balanced_client(provider: str, clients: list) -> LoadBalancedClient:
+    """rq 驱动下地址状态保存在 Redis 中，所有 worker 共享"""
+    state = None
+    if os.getenv('QUEUE_DRIVER', 'async') == 'rq':
+        state = RedisEndpointState(provider, [getattr(client, 'base_url', '') for client in clients],
+                                   lease=float(os.getenv('LLM_CONCURRENCY_LEASE', 900)))
+    client = LoadBalancedClient(provider, clients,
+                                eject_after=int(os.getenv('LLM_EJECT_AFTER_FAILURES', 3)),
+                                eject_seconds=float(os.getenv('LLM_EJECT_SECONDS', 30)),
+                                health_check_interval=float(os.getenv('LLM_HEALTH_CHECK_INTERVAL', 10)),
+                                state=state)
+    metrics.register_collector(f'llm_endpoints_{provider}', client.stats)
+    return client
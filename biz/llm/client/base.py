@@ -1,3 +1,5 @@
+import asyncio
+import weakref
 from abc import abstractmethod
 from typing import List, Dict, Optional
 
@@ -17,6 +19,16 @@ class BaseClient:
             logger.error("尝试连接LLM失败， {e}")
             return False
 
+    def health_check(self) -> bool:
+        """负载均衡时检查被摘除的地址是否已恢复，失败时抛出异常。默认发送一次对话请求"""
+        return self.ping()
+
+    def _require_model(self, models: List[str]) -> bool:
+        """健康检查时确认 default_model 已部署在该地址，未部署时抛出异常(名称不带标签时按 :latest 匹配)"""
+        if self.default_model not in models and f'{self.default_model}:latest' not in models:
+            raise LookupError(f"model {self.default_model} not found on {getattr(self, 'base_url', '')}")
+        return True
+
     @abstractmethod
     def completions(self,
                     messages: List[Dict[str, str]],
@@ -24,3 +36,25 @@ class BaseClient:
                     ) -> str:
         """Chat with the model.
         """
+
+    async def acompletions(self,
+                           messages: List[Dict[str, str]],
+                           model: Optional[str] | NotGiven = NOT_GIVEN,
+                           ) -> str:
+        """Chat with the model on the running event loop.
+        SDK 没有异步客户端的供应商默认在线程池中执行 completions
+        """
+        return await asyncio.to_thread(self.completions, messages, model)
+
+    def _get_async_client(self, create):
+        """
+        异步 SDK 客户端的连接池绑定创建时的事件循环，按事件循环分别创建。
+        通过 concurrent_util.run_coroutine 在进程内共享的事件循环中调用时，每个进程只创建一个
+        :param create: 创建异步客户端的函数
+        """
+        async_clients = self.__dict__.setdefault('_async_clients', weakref.WeakKeyDictionary())
+        loop = asyncio.get_running_loop()
+        client = async_clients.get(loop)
+        if client is None:
+            client = async_clients[loop] = create()
+        return client
@@ -1,7 +1,7 @@
 import os
 from typing import Dict, List, Optional
 
-from openai import OpenAI
+from openai import AsyncOpenAI, OpenAI
 
 from biz.llm.client.base import BaseClient
 from biz.llm.types import NotGiven, NOT_GIVEN
@@ -9,15 +9,26 @@ from biz.utils.log import logger
 
 
 class DeepSeekClient(BaseClient):
-    def __init__(self, api_key: str = None):
+    # 默认把调用错误转换为错误说明返回；负载均衡时抛出异常，由 LoadBalancedClient 重试和摘除地址
+    raise_errors = False
+    EMPTY_RESPONSE_MESSAGE = "AI服务返回为空，请稍后重试"
+    # 错误说明的开头，Review 结果以此开头时不写入缓存
+    ERROR_MESSAGE_PREFIXES = (EMPTY_RESPONSE_MESSAGE, "DeepSeek API认证失败", "DeepSeek API接口未找到",
+                              "调用DeepSeek API时出错")
+
+    def __init__(self, api_key: str = None, base_url: str = None):
         self.api_key = api_key or os.getenv("DEEPSEEK_API_KEY")
-        self.base_url = os.getenv("DEEPSEEK_API_BASE_URL", "https://api.deepseek.com")
+        self.base_url = base_url or os.getenv("DEEPSEEK_API_BASE_URL", "https://api.deepseek.com")
         if not self.api_key:
             raise ValueError("API key is required. Please provide it or set it in the environment variables.")
 
         self.client = OpenAI(api_key=self.api_key, base_url=self.base_url) # DeepSeek supports OpenAI API SDK
         self.default_model = os.getenv("DEEPSEEK_API_MODEL", "deepseek-chat")
 
+    def health_check(self) -> bool:
+        """轻量的健康检查：列出模型并确认 default_model 可用，不消耗 token"""
+        return self._require_model([model.id for model in self.client.models.list()])
+
     def completions(self,
                     messages: List[Dict[str, str]],
                     model: Optional[str] | NotGiven = NOT_GIVEN,
@@ -33,16 +44,46 @@ class DeepSeekClient(BaseClient):
             
             if not completion or not completion.choices:
                 logger.error("Empty response from DeepSeek API")
-                return "AI服务返回为空，请稍后重试"
+                return self.EMPTY_RESPONSE_MESSAGE
                 
             return completion.choices[0].message.content
             
         except Exception as e:
-            logger.error(f"DeepSeek API error: {str(e)}")
-            # 检查是否是认证错误
-            if "401" in str(e):
-                return "DeepSeek API认证失败，请检查API密钥是否正确"
-            elif "404" in str(e):
-                return "DeepSeek API接口未找到，请检查API地址是否正确"
-            else:
-                return f"调用DeepSeek API时出错: {str(e)}"
+            if self.raise_errors:
+                raise
+            return self.error_message(e)
+
+    async def acompletions(self,
+                           messages: List[Dict[str, str]],
+                           model: Optional[str] | NotGiven = NOT_GIVEN,
+                           ) -> str:
+        try:
+            model = model or self.default_model
+            logger.debug(f"Sending async request to DeepSeek API. Model: {model}, Messages: {messages}")
+            client = self._get_async_client(lambda: AsyncOpenAI(api_key=self.api_key, base_url=self.base_url))
+            completion = await client.chat.completions.create(
+                model=model,
+                messages=messages
+            )
+
+            if not completion or not completion.choices:
+                logger.error("Empty response from DeepSeek API")
+                return self.EMPTY_RESPONSE_MESSAGE
+
+            return completion.choices[0].message.content
+
+        except Exception as e:
+            if self.raise_errors:
+                raise
+            return self.error_message(e)
+
+    @staticmethod
+    def error_message(e: Exception) -> str:
+        logger.error(f"DeepSeek API error: {str(e)}")
+        # 检查是否是认证错误
+        if "401" in str(e):
+            return "DeepSeek API认证失败，请检查API密钥是否正确"
+        elif "404" in str(e):
+            return "DeepSeek API接口未找到，请检查API地址是否正确"
+        else:
+            return f"调用DeepSeek API时出错: {str(e)}"
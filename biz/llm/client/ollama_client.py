@@ -2,19 +2,30 @@ import os
 import re
 from typing import Dict, List, Optional
 
+import httpx
 from ollama import ChatResponse
-from ollama import Client
+from ollama import AsyncClient, Client
 
 from biz.llm.client.base import BaseClient
+from biz.llm.stream import COT_ABORT, StreamCollector
 from biz.llm.types import NotGiven, NOT_GIVEN
 
 
 class OllamaClient(BaseClient):
-    def __init__(self, api_key: str = None):
+    def __init__(self, api_key: str = None, base_url: str = None):
         self.default_model = self.default_model = os.getenv("OLLAMA_API_MODEL", "deepseek-r1-8k:14b")
-        self.base_url = os.getenv("OLLAMA_API_BASE_URL", "http://127.0.0.1:11434")
+        self.base_url = base_url or os.getenv("OLLAMA_API_BASE_URL", "http://127.0.0.1:11434")
+        # 流式输出：边生成边丢弃思考链，超出输出 token 上限、总耗时或分片之间停滞时提前中止生成
+        self.stream_enabled = os.getenv("OLLAMA_STREAM_ENABLED", "1") == "1"
+        self.max_output_tokens = int(os.getenv("OLLAMA_MAX_OUTPUT_TOKENS", 8192))
+        self.stream_timeout = float(os.getenv("OLLAMA_STREAM_TIMEOUT", 600))
+        stall_timeout = float(os.getenv("OLLAMA_STREAM_STALL_TIMEOUT", 120))
+        # 流式输出时读超时即为两个分片之间的最长间隔(包括首个分片前的 prompt 处理时间)
+        self.timeout = httpx.Timeout(None, connect=10, read=stall_timeout) \
+            if self.stream_enabled and stall_timeout else None
         self.client = Client(
             host=self.base_url,
+            timeout=self.timeout,
         )
 
     def _extract_content(self, content: str) -> str:
@@ -29,17 +40,64 @@ class OllamaClient(BaseClient):
         """
         if "<think>" in content and "</think>" not in content:
             # 大模型回复的时候，思考链有可能截断，那么果断忽略回复，返回空
-            return "COT ABORT!"
+            return COT_ABORT
         elif "<think>" not in content and "</think>" in content:
             return content.split("</think>", 1)[1].strip()
         elif re.search(r'<think>.*?</think>', content, re.DOTALL):
             return re.sub(r'<think>.*?</think>', '', content, flags=re.DOTALL).strip()
         return content
 
+    def health_check(self) -> bool:
+        """轻量的健康检查：列出本地模型并确认 default_model 已拉取，不占用 GPU"""
+        return self._require_model([model.model for model in self.client.list().models])
+
+    def _options(self) -> dict | None:
+        # num_predict 由 Ollama 服务端限制生成的 token 数(包括思考链)
+        return {'num_predict': self.max_output_tokens} if self.max_output_tokens else None
+
     def completions(self,
                     messages: List[Dict[str, str]],
                     model: Optional[str] | NotGiven = NOT_GIVEN,
                     ) -> str:
-        response: ChatResponse = self.client.chat(model or self.default_model, messages)
-        content = response['message']['content']
-        return self._extract_content(content)
+        if not self.stream_enabled:
+            response: ChatResponse = self.client.chat(model or self.default_model, messages, options=self._options())
+            return self._extract_content(response['message']['content'])
+
+        collector = StreamCollector('Ollama', self.stream_timeout)
+        stream = self.client.chat(model or self.default_model, messages, stream=True, options=self._options())
+        try:
+            for chunk in stream:
+                if not collector.feed(chunk['message']['content']):
+                    return collector.abort('timeout')
+                if chunk.get('done'):
+                    return collector.finish(truncated=chunk.get('done_reason') == 'length')
+        except httpx.TimeoutException:
+            return collector.abort('stall')
+        finally:
+            # 提前返回时关闭连接，Ollama 检测到连接断开后停止生成
+            stream.close()
+        return collector.finish()
+
+    async def acompletions(self,
+                           messages: List[Dict[str, str]],
+                           model: Optional[str] | NotGiven = NOT_GIVEN,
+                           ) -> str:
+        client = self._get_async_client(lambda: AsyncClient(host=self.base_url, timeout=self.timeout))
+        if not self.stream_enabled:
+            response: ChatResponse = await client.chat(model or self.default_model, messages,
+                                                       options=self._options())
+            return self._extract_content(response['message']['content'])
+
+        collector = StreamCollector('Ollama', self.stream_timeout)
+        stream = await client.chat(model or self.default_model, messages, stream=True, options=self._options())
+        try:
+            async for chunk in stream:
+                if not collector.feed(chunk['message']['content']):
+                    return collector.abort('timeout')
+                if chunk.get('done'):
+                    return collector.finish(truncated=chunk.get('done_reason') == 'length')
+        except httpx.TimeoutException:
+            return collector.abort('stall')
+        finally:
+            await stream.aclose()
+        return collector.finish()
@@ -1,22 +1,26 @@
 import os
 from typing import Dict, List, Optional
 
-from openai import OpenAI
+from openai import AsyncOpenAI, OpenAI
 
 from biz.llm.client.base import BaseClient
 from biz.llm.types import NotGiven, NOT_GIVEN
 
 
 class OpenAIClient(BaseClient):
-    def __init__(self, api_key: str = None):
+    def __init__(self, api_key: str = None, base_url: str = None):
         self.api_key = api_key or os.getenv("OPENAI_API_KEY")
-        self.base_url = os.getenv("OPENAI_API_BASE_URL", "https://api.openai.com")
+        self.base_url = base_url or os.getenv("OPENAI_API_BASE_URL", "https://api.openai.com")
         if not self.api_key:
             raise ValueError("API key is required. Please provide it or set it in the environment variables.")
 
         self.client = OpenAI(api_key=self.api_key, base_url=self.base_url)
         self.default_model = os.getenv("OPENAI_API_MODEL", "gpt-4o-mini")
 
+    def health_check(self) -> bool:
+        """轻量的健康检查：列出模型并确认 default_model 可用，不消耗 token"""
+        return self._require_model([model.id for model in self.client.models.list()])
+
     def completions(self,
                     messages: List[Dict[str, str]],
                     model: Optional[str] | NotGiven = NOT_GIVEN,
@@ -27,3 +31,14 @@ class OpenAIClient(BaseClient):
             messages=messages,
         )
         return completion.choices[0].message.content
+
+    async def acompletions(self,
+                           messages: List[Dict[str, str]],
+                           model: Optional[str] | NotGiven = NOT_GIVEN,
+                           ) -> str:
+        client = self._get_async_client(lambda: AsyncOpenAI(api_key=self.api_key, base_url=self.base_url))
+        completion = await client.chat.completions.create(
+            model=model or self.default_model,
+            messages=messages,
+        )
+        return completion.choices[0].message.content
@@ -8,6 +8,11 @@ from biz.llm.types import NotGiven, NOT_GIVEN
 
 
 class ZhipuAIClient(BaseClient):
+    """
+    zhipuai SDK 没有 asyncio 客户端(chat.asyncCompletions 是需要轮询结果的服务端异步任务接口)，
+    acompletions 使用 BaseClient 的默认实现，在线程池中执行 completions
+    """
+
     def __init__(self, api_key: str = None):
         self.api_key = api_key or os.getenv("ZHIPUAI_API_KEY")
         if not self.api_key:
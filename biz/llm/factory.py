@@ -1,24 +1,129 @@
 import os
+import threading
 
+from biz.llm.balancer import create_load_balanced_client, split_base_urls
 from biz.llm.client.base import BaseClient
 from biz.llm.client.deepseek import DeepSeekClient
 from biz.llm.client.ollama_client import OllamaClient
 from biz.llm.client.openai import OpenAIClient
 from biz.llm.client.qwen import QwenClient
 from biz.llm.client.zhipuai import ZhipuAIClient
+from biz.llm.limiter import limit_concurrency
 from biz.utils.log import logger
+from biz.utils.token_util import Tokenizer, get_tokenizer
+
+
+class ModelProfile:
+    """
+    模型的 token 计数方式和上下文窗口：
+    - encoding_name: 使用的 tiktoken 编码，OpenAI 模型为精确计数
+    - ratio: 其他厂商的模型没有公开的 tiktoken 编码，使用相近编码的 token 数乘以校准系数估算
+    - context_window: 上下文窗口大小(输入 + 输出 token 数)
+    """
+
+    def __init__(self, encoding_name: str, ratio: float, context_window: int):
+        self.encoding_name = encoding_name
+        self.ratio = ratio
+        self.context_window = context_window
+
+    def __repr__(self):
+        return f'ModelProfile({self.encoding_name!r}, ratio={self.ratio}, context_window={self.context_window})'
+
+
+# 按供应商、模型名前缀(小写)匹配，最长前缀优先；'' 为该供应商的默认值
+# 校准系数为代码 diff 上相对于对应 tiktoken 编码的 token 数比例，宁大勿小
+MODEL_PROFILES = {
+    'openai': {
+        '': ModelProfile('o200k_base', 1.0, 128000),
+        'gpt-4o': ModelProfile('o200k_base', 1.0, 128000),
+        'gpt-4.1': ModelProfile('o200k_base', 1.0, 1047576),
+        'o1': ModelProfile('o200k_base', 1.0, 200000),
+        'o3': ModelProfile('o200k_base', 1.0, 200000),
+        'o4': ModelProfile('o200k_base', 1.0, 200000),
+        'gpt-4-turbo': ModelProfile('cl100k_base', 1.0, 128000),
+        'gpt-4': ModelProfile('cl100k_base', 1.0, 8192),
+        'gpt-3.5-turbo': ModelProfile('cl100k_base', 1.0, 16385),
+    },
+    'deepseek': {
+        '': ModelProfile('cl100k_base', 1.05, 64000),
+    },
+    'qwen': {
+        '': ModelProfile('cl100k_base', 1.05, 32768),
+        'qwen-coder-plus': ModelProfile('cl100k_base', 1.05, 131072),
+        'qwen-plus': ModelProfile('cl100k_base', 1.05, 131072),
+        'qwen-turbo': ModelProfile('cl100k_base', 1.05, 1000000),
+        'qwen-long': ModelProfile('cl100k_base', 1.05, 1000000),
+    },
+    'zhipuai': {
+        '': ModelProfile('cl100k_base', 1.0, 128000),
+        'glm-4-long': ModelProfile('cl100k_base', 1.0, 1000000),
+        'glm-4-air': ModelProfile('cl100k_base', 1.0, 128000),
+    },
+    'ollama': {
+        # Ollama 的上下文窗口取决于模型的 num_ctx 配置，通过 OLLAMA_CONTEXT_WINDOW 指定
+        '': ModelProfile('cl100k_base', 1.1, 8192),
+        'qwen': ModelProfile('cl100k_base', 1.05, 8192),
+        'deepseek-r1': ModelProfile('cl100k_base', 1.05, 8192),
+        'llama3': ModelProfile('cl100k_base', 1.0, 8192),
+    },
+}
+
+# 进程内共享的客户端，按 (供应商, 模型, API 地址) 缓存
+_clients = {}
+_clients_lock = threading.Lock()
+
+# 支持在 {PROVIDER}_API_BASE_URL 中配置多个地址并负载均衡的供应商
+MULTI_ENDPOINT_PROVIDERS = ('ollama', 'openai', 'deepseek', 'qwen')
+
+# 自动推算 REVIEW_MAX_TOKENS 时为系统提示词、提交信息等预留的 token 数
+PROMPT_RESERVED_TOKENS = 2048
 
 
 class Factory:
     @staticmethod
     def getClient(provider: str = None) -> BaseClient:
+        """
+        获取进程内共享的客户端，每次 Review 复用同一个 SDK 客户端及其 HTTP 连接池，不再重复创建和认证。
+        按 (供应商, {PROVIDER}_API_MODEL, {PROVIDER}_API_BASE_URL) 缓存，配置变化后创建新的客户端。
+        配置 LLM_MAX_CONCURRENCY 时，同一供应商/地址的并发请求数受限，超出时排队等待。
+        Ollama 和 OpenAI 兼容供应商的 {PROVIDER}_API_BASE_URL 配置了多个地址(逗号分隔)时，返回负载均衡客户端，
+        并发上限按每个地址分别计算
+        """
+        provider = provider or os.getenv("LLM_PROVIDER", "openai")
+        key = (provider, os.getenv(f"{provider.upper()}_API_MODEL"), os.getenv(f"{provider.upper()}_API_BASE_URL"))
+        client = _clients.get(key)
+        if client is None:
+            with _clients_lock:
+                client = _clients.get(key)
+                if client is None:
+                    client = _clients[key] = Factory._createSharedClient(provider)
+        return client
+
+    @staticmethod
+    def _createSharedClient(provider: str) -> BaseClient:
+        base_urls = split_base_urls(os.getenv(f"{provider.upper()}_API_BASE_URL"))
+        if len(base_urls) > 1 and provider in MULTI_ENDPOINT_PROVIDERS:
+            clients = []
+            for base_url in base_urls:
+                client = Factory.createClient(provider, base_url)
+                if isinstance(client, DeepSeekClient):
+                    # 所有地址都失败后才由 LoadBalancedClient 转换为错误说明
+                    client.raise_errors = True
+                clients.append(limit_concurrency(provider, client))
+            logger.info(f"{provider} load balancing across {len(clients)} endpoints: {base_urls}")
+            return create_load_balanced_client(provider, clients)
+        return limit_concurrency(provider, Factory.createClient(provider))
+
+    @staticmethod
+    def createClient(provider: str = None, base_url: str = None) -> BaseClient:
+        """创建新的客户端，base_url 默认为 {PROVIDER}_API_BASE_URL"""
         provider = provider or os.getenv("LLM_PROVIDER", "openai")
         chat_model_providers = {
             'zhipuai': lambda: ZhipuAIClient(),
-            'openai': lambda: OpenAIClient(),
-            'deepseek': lambda: DeepSeekClient(),
-            'qwen': lambda: QwenClient(),
-            'ollama': lambda : OllamaClient()
+            'openai': lambda: OpenAIClient(base_url=base_url),
+            'deepseek': lambda: DeepSeekClient(base_url=base_url),
+            'qwen': lambda: QwenClient(base_url=base_url),
+            'ollama': lambda : OllamaClient(base_url=base_url)
         }
 
         provider_func = chat_model_providers.get(provider)
@@ -26,3 +131,41 @@ class Factory:
             return provider_func()
         else:
             raise Exception(f'Unknown chat model provider: {provider}')
+
+    @staticmethod
+    def getModelProfile(provider: str = None, model: str = None) -> ModelProfile:
+        """
+        获取模型的 token 计数方式和上下文窗口，model 默认为 {PROVIDER}_API_MODEL。
+        可通过 LLM_TOKEN_RATIO、LLM_CONTEXT_WINDOW(Ollama 为 OLLAMA_CONTEXT_WINDOW)覆盖
+        """
+        provider = provider or os.getenv("LLM_PROVIDER", "openai")
+        model = (model or os.getenv(f"{provider.upper()}_API_MODEL", "")).lower()
+        profiles = MODEL_PROFILES.get(provider, {'': ModelProfile('cl100k_base', 1.1, 8192)})
+        prefix = max((prefix for prefix in profiles if model.startswith(prefix)), key=len, default='')
+        profile = profiles.get(prefix) or ModelProfile('cl100k_base', 1.1, 8192)
+
+        ratio = os.getenv("LLM_TOKEN_RATIO")
+        context_window = os.getenv("LLM_CONTEXT_WINDOW") or \
+            (os.getenv("OLLAMA_CONTEXT_WINDOW") if provider == 'ollama' else None)
+        if ratio or context_window:
+            profile = ModelProfile(profile.encoding_name, float(ratio) if ratio else profile.ratio,
+                                   int(context_window) if context_window else profile.context_window)
+        return profile
+
+    @staticmethod
+    def getTokenizer(provider: str = None, model: str = None) -> Tokenizer:
+        """获取与模型匹配的(进程内共享的) tokenizer"""
+        profile = Factory.getModelProfile(provider, model)
+        return get_tokenizer(profile.encoding_name, profile.ratio)
+
+
+def get_review_max_tokens(provider: str = None, model: str = None) -> int:
+    """
+    REVIEW_MAX_TOKENS 配置为 auto 时，按模型上下文窗口推算：上下文窗口 - 预留输出(REVIEW_OUTPUT_TOKENS) - 提示词开销
+    """
+    review_max_tokens = os.getenv("REVIEW_MAX_TOKENS", "10000").strip()
+    if review_max_tokens.lower() != 'auto':
+        return int(review_max_tokens)
+    profile = Factory.getModelProfile(provider, model)
+    output_tokens = int(os.getenv("REVIEW_OUTPUT_TOKENS", 4096))
+    return max(profile.context_window - output_tokens - PROMPT_RESERVED_TOKENS, 1024)
@@ -0,0 +1,290 @@
+import abc
+import asyncio
+import os
+import threading
+import time
+import uuid
+from contextlib import asynccontextmanager, contextmanager
+
+from biz.llm.client.base import BaseClient
+from biz.llm.types import NOT_GIVEN
+from biz.utils.log import logger
+from biz.utils.metrics import metrics
+from biz.utils.rate_limiter import RateLimitExceeded
+
+
+class ConcurrencyLimitExceeded(RateLimitExceeded):
+    """等待 LLM 并发名额超过 max_wait 秒，由调用方推迟任务(与 API 限流的处理方式相同)"""
+
+
+class ConcurrencyGate(abc.ABC):
+    """
+    限制同时发往同一个供应商/地址的请求数，超出时排队等待，等待超过 max_wait 秒时抛出 ConcurrencyLimitExceeded。
+    子类实现 try_acquire / release / stats，事件循环中等待时轮询，不阻塞事件循环
+    """
+    poll_interval = 0.1
+
+    def __init__(self, key: str, limit: int, max_wait: float):
+        self.key = key
+        self.limit = limit
+        self.max_wait = max_wait
+
+    @abc.abstractmethod
+    def try_acquire(self) -> str | None:
+        """获取名额，成功时返回名额标识，没有空闲名额时返回 None"""
+        pass
+
+    @abc.abstractmethod
+    def release(self, token: str):
+        pass
+
+    @abc.abstractmethod
+    def stats(self) -> dict:
+        pass
+
+    def _enter_queue(self, waiter: str):
+        """登记排队(用于统计排队数)，等待期间每次轮询都会调用"""
+
+    def _leave_queue(self, waiter: str):
+        pass
+
+    def _exceeded(self, started: float) -> ConcurrencyLimitExceeded:
+        metrics.incr('llm_concurrency_timeouts')
+        return ConcurrencyLimitExceeded(f"LLM concurrency limit of {self.key} ({self.limit}) reached, "
+                                        f"waited {time.monotonic() - started:.0f}s", self.max_wait)
+
+    def _acquired(self, started: float):
+        waited = time.monotonic() - started
+        metrics.incr('llm_concurrency_wait_ms', int(waited * 1000))
+        if waited >= 1:
+            logger.info(f"Waited {waited:.1f}s for LLM concurrency slot of {self.key}.")
+
+    def acquire(self) -> str:
+        started = time.monotonic()
+        token = self.try_acquire()
+        if token is not None:
+            return token
+        waiter = uuid.uuid4().hex
+        try:
+            while token is None:
+                if time.monotonic() - started > self.max_wait:
+                    raise self._exceeded(started)
+                self._enter_queue(waiter)
+                time.sleep(self.poll_interval)
+                token = self.try_acquire()
+        finally:
+            self._leave_queue(waiter)
+        self._acquired(started)
+        return token
+
+    async def aacquire(self) -> str:
+        started = time.monotonic()
+        token = self.try_acquire()
+        if token is not None:
+            return token
+        waiter = uuid.uuid4().hex
+        try:
+            while token is None:
+                if time.monotonic() - started > self.max_wait:
+                    raise self._exceeded(started)
+                self._enter_queue(waiter)
+                await asyncio.sleep(self.poll_interval)
+                token = self.try_acquire()
+        finally:
+            self._leave_queue(waiter)
+        self._acquired(started)
+        return token
+
+    @contextmanager
+    def slot(self):
+        token = self.acquire()
+        try:
+            yield
+        finally:
+            self.release(token)
+
+    @asynccontextmanager
+    async def aslot(self):
+        token = await self.aacquire()
+        try:
+            yield
+        finally:
+            self.release(token)
+
+
+class MemoryConcurrencyGate(ConcurrencyGate):
+    """async 驱动使用的进程内实现，线程中等待时通过 Condition 唤醒"""
+
+    def __init__(self, key: str, limit: int, max_wait: float):
+        super().__init__(key, limit, max_wait)
+        self._condition = threading.Condition()
+        self._running = 0
+        self._waiting = set()
+
+    def try_acquire(self) -> str | None:
+        with self._condition:
+            if self._running >= self.limit:
+                return None
+            self._running += 1
+            return uuid.uuid4().hex
+
+    def acquire(self) -> str:
+        started = time.monotonic()
+        with self._condition:
+            waiter = uuid.uuid4().hex
+            self._waiting.add(waiter)
+            try:
+                if not self._condition.wait_for(lambda: self._running < self.limit, self.max_wait):
+                    raise self._exceeded(started)
+                self._running += 1
+            finally:
+                self._waiting.discard(waiter)
+        self._acquired(started)
+        return uuid.uuid4().hex
+
+    def release(self, token: str):
+        with self._condition:
+            self._running -= 1
+            self._condition.notify()
+
+    def _enter_queue(self, waiter: str):
+        with self._condition:
+            self._waiting.add(waiter)
+
+    def _leave_queue(self, waiter: str):
+        with self._condition:
+            self._waiting.discard(waiter)
+
+    def stats(self) -> dict:
+        with self._condition:
+            return {'limit': self.limit, 'running': self._running, 'waiting': len(self._waiting)}
+
+
+class RedisConcurrencyGate(ConcurrencyGate):
+    """
+    rq 驱动使用的 Redis 实现，多个 worker 进程(及多台机器)共享同一个并发上限：
+    - 持有的名额记录在有序集合中，score 为租约到期时间，进程异常退出未释放的名额在 lease 秒后自动回收
+    - 排队的请求每次轮询时刷新心跳，用于统计排队数
+    """
+    KEY_PREFIX = 'ai_codereview:llm_concurrency:'
+    poll_interval = 0.5
+    ACQUIRE_SCRIPT = """
+redis.call('ZREMRANGEBYSCORE', KEYS[1], '-inf', ARGV[1])
+if redis.call('ZCARD', KEYS[1]) < tonumber(ARGV[2]) then
+    redis.call('ZADD', KEYS[1], ARGV[3], ARGV[4])
+    redis.call('EXPIRE', KEYS[1], ARGV[5])
+    return 1
+end
+return 0
+"""
+
+    def __init__(self, key: str, limit: int, max_wait: float, lease: float, connection=None):
+        super().__init__(key, limit, max_wait)
+        self.lease = lease
+        if connection is None:
+            from biz.utils.queue import get_redis
+            connection = get_redis()
+        self.connection = connection
+        self._acquire_script = connection.register_script(self.ACQUIRE_SCRIPT)
+        self._holders_key = f'{self.KEY_PREFIX}{key}:holders'
+        self._waiters_key = f'{self.KEY_PREFIX}{key}:waiters'
+
+    def try_acquire(self) -> str | None:
+        token = uuid.uuid4().hex
+        now = time.time()
+        acquired = self._acquire_script(keys=[self._holders_key],
+                                        args=[now, self.limit, now + self.lease, token, int(self.lease) + 60])
+        return token if acquired else None
+
+    def release(self, token: str):
+        self.connection.zrem(self._holders_key, token)
+
+    def _enter_queue(self, waiter: str):
+        pipe = self.connection.pipeline()
+        pipe.zadd(self._waiters_key, {waiter: time.time()})
+        pipe.expire(self._waiters_key, int(self.max_wait) + 60)
+        pipe.execute()
+
+    def _leave_queue(self, waiter: str):
+        self.connection.zrem(self._waiters_key, waiter)
+
+    def stats(self) -> dict:
+        now = time.time()
+        pipe = self.connection.pipeline()
+        pipe.zcount(self._holders_key, now, '+inf')
+        # 超过几个轮询周期没有刷新心跳的排队请求视为已退出
+        pipe.zcount(self._waiters_key, now - self.poll_interval * 10, '+inf')
+        running, waiting = pipe.execute()
+        return {'limit': self.limit, 'running': running, 'waiting': waiting}
+
+
+class ConcurrencyLimitedClient(BaseClient):
+    """
+    在 completions / acompletions 前后获取和释放并发名额，其余属性(default_model 等)直接访问原客户端
+    """
+
+    def __init__(self, client: BaseClient, gate: ConcurrencyGate):
+        self.wrapped = client
+        self.gate = gate
+
+    def __getattr__(self, name):
+        return getattr(self.wrapped, name)
+
+    def completions(self, messages, model=NOT_GIVEN) -> str:
+        with self.gate.slot():
+            return self.wrapped.completions(messages, model)
+
+    async def acompletions(self, messages, model=NOT_GIVEN) -> str:
+        async with self.gate.aslot():
+            return await self.wrapped.acompletions(messages, model)
+
+    def ping(self) -> bool:
+        with self.gate.slot():
+            return self.wrapped.ping()
+
+    def health_check(self) -> bool:
+        # 健康检查不调用模型，不占用并发名额
+        return self.wrapped.health_check()
+
+
+def get_concurrency_limit(provider: str) -> int:
+    """LLM_MAX_CONCURRENCY_{PROVIDER} 优先于 LLM_MAX_CONCURRENCY，0 表示不限制"""
+    return int(os.getenv(f'LLM_MAX_CONCURRENCY_{provider.upper()}') or os.getenv('LLM_MAX_CONCURRENCY') or 0)
+
+
+_gates = {}
+_gates_lock = threading.Lock()
+
+
+def _collect_stats() -> dict:
+    with _gates_lock:
+        gates = dict(_gates)
+    return {key: gate.stats() for key, gate in gates.items()}
+
+
+def get_concurrency_gate(provider: str, endpoint: str = '') -> ConcurrencyGate | None:
+    """获取供应商/地址共享的并发控制，未配置 LLM_MAX_CONCURRENCY 时返回 None"""
+    limit = get_concurrency_limit(provider)
+    if limit <= 0:
+        return None
+    key = f'{provider}:{endpoint}' if endpoint else provider
+    gate = _gates.get(key)
+    if gate is None:
+        with _gates_lock:
+            gate = _gates.get(key)
+            if gate is None:
+                max_wait = float(os.getenv('LLM_QUEUE_MAX_WAIT', 300))
+                if os.getenv('QUEUE_DRIVER', 'async') == 'rq':
+                    gate = RedisConcurrencyGate(key, limit, max_wait, float(os.getenv('LLM_CONCURRENCY_LEASE', 900)))
+                else:
+                    gate = MemoryConcurrencyGate(key, limit, max_wait)
+                if not _gates:
+                    metrics.register_collector('llm_concurrency', _collect_stats)
+                _gates[key] = gate
+    return gate
+
+
+def limit_concurrency(provider: str, client):
+    """按 LLM_MAX_CONCURRENCY 为客户端加上并发控制，未配置时返回原客户端"""
+    gate = get_concurrency_gate(provider, getattr(client, 'base_url', '') or '')
+    return client if gate is None else ConcurrencyLimitedClient(client, gate)
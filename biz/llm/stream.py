@@ -0,0 +1,115 @@
+import time
+
+from biz.utils.log import logger
+from biz.utils.metrics import metrics
+
+THINK_OPEN = '<think>'
+THINK_CLOSE = '</think>'
+# 思考链被截断时返回的内容，与 OllamaClient._extract_content 一致
+COT_ABORT = 'COT ABORT!'
+# 提前中止或被截断的输出末尾附加的说明，包含该说明的结果不写入 Review 缓存
+INCOMPLETE_MARK = '结果不完整。'
+
+
+class StreamAborted(Exception):
+    """流式输出超时或停滞，且还没有收到任何思考链之外的内容"""
+
+
+def _partial_tag_length(text: str) -> int:
+    """text 末尾可能是被拆分到下一个分片的 <think> / </think> 标签，返回需要暂存的长度"""
+    for length in range(min(len(text), len(THINK_CLOSE)), 0, -1):
+        tail = text[-length:]
+        if THINK_OPEN.startswith(tail) or THINK_CLOSE.startswith(tail):
+            return length
+    return 0
+
+
+class ThinkFilter:
+    """
+    在流式输出的过程中丢弃 <think>...</think> 思考链，只保留思考链之外的内容，不缓存思考链本身。
+    标签可能被拆分到多个分片中；只有 </think> 没有 <think> 时(部分模型省略开始标签)，之前的内容都视为思考链
+    """
+
+    def __init__(self):
+        self.in_think = False
+        self._visible = []
+        self._pending = ''
+
+    def feed(self, text: str):
+        data = self._pending + text
+        self._pending = ''
+        while data:
+            if self.in_think:
+                index = data.find(THINK_CLOSE)
+                if index < 0:
+                    partial = _partial_tag_length(data)
+                    self._pending = data[len(data) - partial:] if partial else ''
+                    return
+                self.in_think = False
+                data = data[index + len(THINK_CLOSE):]
+                continue
+
+            open_index, close_index = data.find(THINK_OPEN), data.find(THINK_CLOSE)
+            if open_index >= 0 and (close_index < 0 or open_index < close_index):
+                self._visible.append(data[:open_index])
+                self.in_think = True
+                data = data[open_index + len(THINK_OPEN):]
+            elif close_index >= 0:
+                self._visible.clear()
+                data = data[close_index + len(THINK_CLOSE):]
+            else:
+                partial = _partial_tag_length(data)
+                self._visible.append(data[:len(data) - partial])
+                self._pending = data[len(data) - partial:] if partial else ''
+                return
+
+    @property
+    def has_content(self) -> bool:
+        return any(text.strip() for text in self._visible)
+
+    @property
+    def text(self) -> str:
+        if self.in_think:
+            return COT_ABORT
+        return (''.join(self._visible) + self._pending).strip()
+
+
+class StreamCollector:
+    """
+    收集流式输出：过滤思考链，并限制总耗时(timeout 秒，0 表示不限制)。
+    分片之间的停滞由 HTTP 客户端的读超时控制；输出 token 上限由服务端(如 Ollama 的 num_predict)控制，
+    达到上限时通过 finish(truncated=True) 标记
+    """
+
+    def __init__(self, provider: str, timeout: float = 0):
+        self.provider = provider
+        self.timeout = timeout
+        self.started = time.monotonic()
+        self.chunks = 0
+        self.think_filter = ThinkFilter()
+
+    def feed(self, text: str) -> bool:
+        """
+        :return: 超出总耗时时返回 False，调用方应关闭连接停止生成
+        """
+        self.chunks += 1
+        self.think_filter.feed(text)
+        return not self.timeout or time.monotonic() - self.started <= self.timeout
+
+    def abort(self, reason: str) -> str:
+        """超时或停滞时中止：已有思考链之外的内容时返回不完整的结果，否则抛出 StreamAborted"""
+        elapsed = time.monotonic() - self.started
+        metrics.incr(f'llm_stream_aborted_{reason}')
+        logger.warn(f"{self.provider} stream aborted ({reason}) after {elapsed:.1f}s, {self.chunks} chunks.")
+        if not self.think_filter.has_content:
+            raise StreamAborted(f'{self.provider} stream aborted ({reason}) after {elapsed:.1f}s')
+        return self.think_filter.text + f'\n\n> 模型输出{"超时" if reason == "timeout" else "停滞"}，{INCOMPLETE_MARK}'
+
+    def finish(self, truncated: bool = False) -> str:
+        if truncated:
+            metrics.incr('llm_stream_truncated')
+            logger.warn(f"{self.provider} output reached the token limit after {self.chunks} chunks.")
+            if self.think_filter.in_think or not self.think_filter.has_content:
+                return COT_ABORT
+            return self.think_filter.text + f'\n\n> 模型输出超出 Token 上限，{INCOMPLETE_MARK}'
+        return self.think_filter.text
@@ -0,0 +1,176 @@
+import asyncio
+import os
+from types import SimpleNamespace
+from unittest import TestCase, main, mock, skipUnless
+
+from biz.llm.balancer import LoadBalancedClient, MemoryEndpointState, RedisEndpointState
+from biz.llm.client.base import BaseClient
+from biz.llm.client.deepseek import DeepSeekClient
+from biz.llm.client.ollama_client import OllamaClient
+
+try:
+    import fakeredis
+except ImportError:
+    fakeredis = None
+
+
+class FakeClient(BaseClient):
+    def __init__(self, base_url: str, healthy: bool = True):
+        self.base_url = base_url
+        self.healthy = healthy
+        self.calls = 0
+
+    def completions(self, messages, model=None) -> str:
+        self.calls += 1
+        if not self.healthy:
+            raise ConnectionError(f'{self.base_url} is down')
+        return self.base_url
+
+    async def acompletions(self, messages, model=None) -> str:
+        await asyncio.sleep(0)
+        return self.completions(messages, model)
+
+    def health_check(self) -> bool:
+        if not self.healthy:
+            raise ConnectionError(f'{self.base_url} is down')
+        return True
+
+
+class TestLoadBalancedClient(TestCase):
+    def test_least_outstanding(self):
+        a, b = FakeClient('a'), FakeClient('b')
+        client = LoadBalancedClient('ollama', [a, b])
+        client.state.outstanding[0] = 1
+        self.assertEqual({client.completions([]) for _ in range(5)}, {'b'})
+
+    def test_retry_and_eject(self):
+        a, b = FakeClient('a', healthy=False), FakeClient('b')
+        client = LoadBalancedClient('ollama', [a, b], eject_after=2, eject_seconds=60, health_check_interval=3600)
+        # b 上有一个进行中的请求，a 被摘除前总是先选择 a
+        client.state.outstanding[1] = 1
+        for _ in range(10):
+            self.assertEqual(client.completions([]), 'b')
+        # 连续失败 2 次后被摘除，不再接收请求
+        self.assertEqual(a.calls, 2)
+        self.assertTrue(client.stats()['a']['ejected'])
+
+        a.healthy = True
+        self.assertTrue(client._check(0))
+        self.assertFalse(client.stats()['a']['ejected'])
+
+        # 恢复后连续失败次数保持在阈值，再失败一次立即重新摘除
+        a.healthy = False
+        self.assertEqual(client.completions([]), 'b')
+        self.assertEqual(a.calls, 3)
+        self.assertTrue(client.stats()['a']['ejected'])
+
+    def test_acompletions(self):
+        a, b = FakeClient('a', healthy=False), FakeClient('b')
+        client = LoadBalancedClient('ollama', [a, b], eject_after=1, health_check_interval=3600)
+
+        async def run():
+            return await asyncio.gather(*[client.acompletions([]) for _ in range(4)])
+
+        self.assertEqual(asyncio.run(run()), ['b'] * 4)
+        self.assertTrue(client.stats()['a']['ejected'])
+        self.assertEqual(client.stats()['b'], {'outstanding': 0, 'requests': 4, 'errors': 0, 'ejected': False})
+
+    def test_all_endpoints_fail(self):
+        client = LoadBalancedClient('ollama', [FakeClient('a', healthy=False), FakeClient('b', healthy=False)])
+        self.assertRaises(ConnectionError, client.completions, [])
+
+    def test_deepseek_error_message(self):
+        clients = []
+        for base_url in ('http://a', 'http://b'):
+            deepseek = DeepSeekClient(api_key='test', base_url=base_url)
+            deepseek.raise_errors = True
+            deepseek.client = mock.Mock()
+            deepseek.client.chat.completions.create.side_effect = ConnectionError('down')
+            clients.append(deepseek)
+        client = LoadBalancedClient('deepseek', clients, eject_after=1, health_check_interval=3600)
+        # 每个地址都重试过之后才转换为错误说明
+        self.assertEqual(client.completions([]), '调用DeepSeek API时出错: down')
+        for deepseek in clients:
+            self.assertEqual(deepseek.client.chat.completions.create.call_count, 1)
+
+    def test_health_check_requires_model(self):
+        with mock.patch.dict(os.environ, {'OLLAMA_API_MODEL': 'qwen2.5-coder'}):
+            ollama = OllamaClient(base_url='http://a')
+        ollama.client = mock.Mock()
+        ollama.client.list.return_value = SimpleNamespace(models=[SimpleNamespace(model='llama3:8b')])
+        client = LoadBalancedClient('ollama', [ollama, FakeClient('b')], health_check_interval=3600)
+        client.state.ejected_until[0] = 1e12
+        self.assertFalse(client._check(0))
+        self.assertTrue(client.stats()['http://a']['ejected'])
+
+        ollama.client.list.return_value = SimpleNamespace(models=[SimpleNamespace(model='qwen2.5-coder:latest')])
+        self.assertTrue(client._check(0))
+        self.assertFalse(client.stats()['http://a']['ejected'])
+
+
+@skipUnless(fakeredis, 'fakeredis is not installed')
+class TestRedisEndpointState(TestCase):
+    def setUp(self):
+        self.connection = fakeredis.FakeRedis()
+
+    def state(self) -> RedisEndpointState:
+        return RedisEndpointState('ollama', ['a', 'b'], lease=60, connection=self.connection)
+
+    def test_shared_between_processes(self):
+        # 两个实例模拟两个 rq 任务进程
+        first, second = self.state(), self.state()
+        index, token, ejected = first.acquire([0, 1])
+        self.assertEqual(ejected, 0)
+        # 另一个进程看到进行中的请求，选择另一个地址
+        self.assertEqual(second.acquire([0, 1])[0], 1 - index)
+        self.assertEqual(second.stats()[index]['outstanding'], 1)
+        first.release(index, token, False, 2, 60)
+        self.assertEqual(second.stats()[index], {'outstanding': 0, 'requests': 1, 'errors': 0, 'ejected': False})
+
+    def test_eject_and_restore(self):
+        first, second = self.state(), self.state()
+        for failures in (0, 2):
+            index, token, _ = first.acquire([0])
+            self.assertEqual(first.release(index, token, True, 2, 60), failures)
+        self.assertEqual(second.ejected(), [0])
+        # 被摘除的地址只在没有其它可选地址时使用
+        self.assertEqual(second.acquire([0, 1])[0], 1)
+        self.assertEqual(second.acquire([0])[:3:2], (0, 1))
+        self.assertEqual(second.acquire([]), (None, '', 1))
+
+        second.restore(0, 2)
+        self.assertEqual(first.ejected(), [])
+        index, token, _ = first.acquire([0])
+        self.assertEqual(first.release(index, token, True, 2, 60), 3)
+
+    def test_health_check_claim(self):
+        first, second = self.state(), self.state()
+        self.assertTrue(first.claim_health_check(0, 60))
+        self.assertFalse(second.claim_health_check(0, 60))
+        self.assertTrue(second.claim_health_check(1, 60))
+
+    def test_load_balanced_client(self):
+        a, b = FakeClient('a', healthy=False), FakeClient('b')
+        state = self.state()
+        # b 上有一个进行中的请求，先选择 a
+        state.acquire([1])
+        client = LoadBalancedClient('ollama', [a, b], eject_after=1, health_check_interval=3600, state=state)
+        for _ in range(4):
+            self.assertEqual(client.completions([]), 'b')
+        self.assertEqual(a.calls, 1)
+        # 新进程中的客户端(如下一个 rq 任务)继承摘除状态
+        other = LoadBalancedClient('ollama', [a, b], eject_after=1, health_check_interval=3600, state=self.state())
+        self.assertEqual(other.completions([]), 'b')
+        self.assertEqual(a.calls, 1)
+        self.assertTrue(other.stats()['a']['ejected'])
+
+
+class TestMemoryEndpointState(TestCase):
+    def test_ejected_fallback(self):
+        state = MemoryEndpointState(2)
+        state.ejected_until = [2e12, 1e12]
+        self.assertEqual(state.acquire([0, 1])[0], 1)
+
+
+if __name__ == '__main__':
+    main()
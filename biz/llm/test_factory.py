@@ -0,0 +1,49 @@
+import os
+from unittest import TestCase, main, mock
+
+from biz.llm.balancer import LoadBalancedClient, MemoryEndpointState
+from biz.llm.factory import Factory, get_review_max_tokens
+
+
+class TestModelProfile(TestCase):
+    def test_longest_prefix(self):
+        self.assertEqual(Factory.getModelProfile('openai', 'gpt-4o-mini').encoding_name, 'o200k_base')
+        self.assertEqual(Factory.getModelProfile('openai', 'gpt-4-turbo').context_window, 128000)
+        self.assertEqual(Factory.getModelProfile('openai', 'gpt-4-0613').context_window, 8192)
+        self.assertEqual(Factory.getModelProfile('qwen', 'qwen-unknown').context_window, 32768)
+        self.assertEqual(Factory.getModelProfile('unknown', 'x').ratio, 1.1)
+
+    def test_auto_max_tokens(self):
+        env = {'REVIEW_MAX_TOKENS': 'auto', 'OLLAMA_CONTEXT_WINDOW': '32768'}
+        with mock.patch.dict(os.environ, env):
+            self.assertEqual(get_review_max_tokens('ollama', 'qwen2.5-coder:7b'), 32768 - 4096 - 2048)
+        with mock.patch.dict(os.environ, {'REVIEW_MAX_TOKENS': '5000'}):
+            self.assertEqual(get_review_max_tokens('ollama'), 5000)
+
+
+class TestClientCache(TestCase):
+    def test_shared_per_model(self):
+        with mock.patch.dict(os.environ, {'OLLAMA_API_MODEL': 'qwen2.5-coder:7b'}):
+            client = Factory.getClient('ollama')
+            self.assertIs(Factory.getClient('ollama'), client)
+        with mock.patch.dict(os.environ, {'OLLAMA_API_MODEL': 'llama3:8b'}):
+            self.assertIsNot(Factory.getClient('ollama'), client)
+            self.assertEqual(Factory.getClient('ollama').default_model, 'llama3:8b')
+
+    def test_comma_separated_base_url(self):
+        env = {'QUEUE_DRIVER': 'async', 'DEEPSEEK_API_KEY': 'test', 'DEEPSEEK_API_MODEL': 'deepseek-chat',
+               'DEEPSEEK_API_BASE_URL': 'http://a:8000/v1, http://b:8000/v1'}
+        with mock.patch.dict(os.environ, env):
+            client = Factory.getClient('deepseek')
+            self.assertIs(Factory.getClient('deepseek'), client)
+            # 单个地址的客户端仍然把错误转换为错误说明
+            self.assertFalse(Factory.createClient('deepseek', 'http://a:8000/v1').raise_errors)
+        self.assertIsInstance(client, LoadBalancedClient)
+        self.assertIsInstance(client.state, MemoryEndpointState)
+        self.assertEqual([endpoint.url for endpoint in client.endpoints], ['http://a:8000/v1', 'http://b:8000/v1'])
+        self.assertEqual(client.default_model, 'deepseek-chat')
+        self.assertTrue(all(endpoint.client.raise_errors for endpoint in client.endpoints))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,99 @@
+import asyncio
+import threading
+import time
+from unittest import TestCase, main, mock, skipUnless
+
+from biz.llm.limiter import ConcurrencyLimitExceeded, MemoryConcurrencyGate, RedisConcurrencyGate
+from biz.utils.rate_limiter import RateLimitExceeded
+
+try:
+    import fakeredis
+except ImportError:
+    fakeredis = None
+
+
+class TestMemoryConcurrencyGate(TestCase):
+    def test_threads_wait_for_slot(self):
+        gate = MemoryConcurrencyGate('ollama', 2, max_wait=5)
+        running, peak, lock = [0], [0], threading.Lock()
+
+        def work():
+            with gate.slot():
+                with lock:
+                    running[0] += 1
+                    peak[0] = max(peak[0], running[0])
+                time.sleep(0.05)
+                with lock:
+                    running[0] -= 1
+
+        threads = [threading.Thread(target=work) for _ in range(6)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(peak[0], 2)
+        self.assertEqual(gate.stats(), {'limit': 2, 'running': 0, 'waiting': 0})
+
+    def test_max_wait(self):
+        gate = MemoryConcurrencyGate('ollama', 1, max_wait=0.1)
+        with gate.slot():
+            self.assertEqual(gate.stats()['running'], 1)
+            # 等待超时的任务按限流处理，由 worker 推迟执行
+            with self.assertRaises(RateLimitExceeded):
+                gate.acquire()
+
+    def test_event_loop(self):
+        gate = MemoryConcurrencyGate('ollama', 1, max_wait=1)
+
+        async def work(seconds):
+            async with gate.aslot():
+                await asyncio.sleep(seconds)
+
+        async def run(*seconds):
+            return await asyncio.gather(*(work(s) for s in seconds), return_exceptions=True)
+
+        # 同一个事件循环中的请求依次获得名额
+        self.assertEqual(asyncio.run(run(0.2, 0.2, 0.2)), [None] * 3)
+        gate.max_wait = 0.1
+        results = asyncio.run(run(0.3, 0))
+        self.assertIsNone(results[0])
+        self.assertIsInstance(results[1], ConcurrencyLimitExceeded)
+
+
+@skipUnless(fakeredis, 'fakeredis is not installed')
+class TestRedisConcurrencyGate(TestCase):
+    def setUp(self):
+        self.connection = fakeredis.FakeRedis()
+
+    def gate(self, max_wait: float = 5, lease: float = 60) -> RedisConcurrencyGate:
+        gate = RedisConcurrencyGate('ollama', 2, max_wait=max_wait, lease=lease, connection=self.connection)
+        gate.poll_interval = 0.01
+        return gate
+
+    def test_shared_between_processes(self):
+        # 两个实例模拟两个 rq 任务进程
+        first, second = self.gate(), self.gate()
+        token = first.acquire()
+        second.acquire()
+        self.assertIsNone(first.try_acquire())
+        self.assertEqual(second.stats(), {'limit': 2, 'running': 2, 'waiting': 0})
+        first.release(token)
+        self.assertIsNotNone(second.try_acquire())
+
+    def test_max_wait(self):
+        gate = self.gate(max_wait=0.05)
+        gate.acquire(), gate.acquire()
+        with self.assertRaises(ConcurrencyLimitExceeded):
+            gate.acquire()
+        self.assertEqual(gate.stats()['waiting'], 0)
+
+    def test_expired_lease(self):
+        """持有名额的进程异常退出时，名额在租约到期后回收"""
+        gate = self.gate(lease=10)
+        gate.acquire(), gate.acquire()
+        with mock.patch('biz.llm.limiter.time.time', return_value=time.time() + 11):
+            self.assertIsNotNone(gate.try_acquire())
+
+
+if __name__ == '__main__':
+    main()
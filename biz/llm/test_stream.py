@@ -0,0 +1,42 @@
+from unittest import TestCase, main
+
+from biz.llm.stream import COT_ABORT, StreamAborted, StreamCollector, ThinkFilter
+
+
+def feed(*chunks) -> ThinkFilter:
+    think_filter = ThinkFilter()
+    for chunk in chunks:
+        think_filter.feed(chunk)
+    return think_filter
+
+
+class TestThinkFilter(TestCase):
+    def test_tags_split_across_chunks(self):
+        self.assertEqual(feed('<thi', 'nk>reason', 'ing</th', 'ink>\n总分', ':80分').text, '总分:80分')
+        self.assertEqual(feed('a <', 'b> <think>x</think> c').text, 'a <b>  c')
+
+    def test_missing_open_tag(self):
+        self.assertEqual(feed('reasoning', '</think>', 'result').text, 'result')
+
+    def test_truncated_think(self):
+        think_filter = feed('<think>still thinking')
+        self.assertEqual(think_filter.text, COT_ABORT)
+        self.assertFalse(think_filter.has_content)
+
+
+class TestStreamCollector(TestCase):
+    def test_abort(self):
+        collector = StreamCollector('test')
+        collector.feed('<think>x')
+        self.assertRaises(StreamAborted, collector.abort, 'stall')
+        collector.feed('</think>partial')
+        self.assertTrue(collector.abort('timeout').startswith('partial\n\n> '))
+
+    def test_truncated(self):
+        collector = StreamCollector('test')
+        collector.feed('<think>x')
+        self.assertEqual(collector.finish(truncated=True), COT_ABORT)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,26 @@
+from rq import Worker
+
+# 在父进程中导入任务函数及其依赖(LLM SDK、webhook handler 等)，fork 出的 work horse 直接复用
+import biz.queue.worker  # noqa: F401
+from biz.llm.factory import Factory
+from biz.utils.code_reviewer import CodeReviewer
+from biz.utils.log import logger
+from biz.utils.token_util import prewarm
+
+
+class PrewarmedWorker(Worker):
+    """
+    rq 每个任务都在 fork 出的子进程中执行，子进程中首次加载的内容在任务结束后随进程丢弃。
+    启动时在父进程中预先加载 tokenizer(fetch 阶段使用的 cl100k_base 和当前模型对应的编码)、LLM 客户端和渲染后的提示词，
+    所有子进程通过 fork 继承，不再每个任务重复加载。客户端只创建不发起请求，fork 时连接池为空。
+    用法：rq worker --worker-class biz.queue.rq_worker.PrewarmedWorker
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        logger.info(f"Tokenizer prewarmed in {prewarm(('cl100k_base', Factory.getTokenizer().encoding_name)):.3f}s.")
+        try:
+            CodeReviewer()
+        except Exception as e:
+            # 配置错误时不影响 worker 启动，任务执行时会再次创建并报错
+            logger.warn(f"Failed to prewarm LLM client and prompts: {e}")
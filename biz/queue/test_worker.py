@@ -0,0 +1,67 @@
+import os
+from unittest import TestCase, main, mock
+
+from biz.queue import worker
+from biz.utils.coalescer import MemoryCoalescer, ReviewCoalescer
+
+COMMITS = [{'id': 'c3', 'title': 'third'}, {'id': 'c2', 'title': 'second'}, {'id': 'c1', 'title': 'first'}]
+CHANGES = [{'new_path': 'a.py', 'diff': '+a'}]
+
+
+class TestIncrementalMergeRequestReview(TestCase):
+    def setUp(self):
+        self.webhook_data = {
+            'object_kind': 'merge_request',
+            'project': {'name': 'demo', 'path_with_namespace': 'group/demo'},
+            'user': {'username': 'dev'},
+            'object_attributes': {'url': 'https://gitlab.example.com/group/demo/-/merge_requests/1',
+                                  'source_branch': 'feature', 'target_branch': 'main'},
+        }
+        self.handler = mock.Mock(action='update', oldrev='c2', last_commit_id='c3', project_id=1,
+                                 merge_request_iid=1, changes_truncated=False)
+        self.handler.get_merge_request_commits.return_value = COMMITS
+        self.handler.get_merge_request_incremental_changes.return_value = CHANGES
+        self.handler.get_merge_request_changes.return_value = CHANGES
+        self.reviewer = mock.Mock()
+        self.reviewer.review_changes.return_value = '总分:90分'
+
+    def run_event(self, last_reviewed_commit_id: str, env: dict = None):
+        env = {'MERGE_REQUEST_INCREMENTAL_REVIEW': '1', **(env or {})}
+        with mock.patch.dict(os.environ, env), \
+                mock.patch.object(worker, 'MergeRequestHandler', return_value=self.handler), \
+                mock.patch.object(worker, 'CodeReviewer', return_value=self.reviewer), \
+                mock.patch.object(worker, 'filter_changes', side_effect=lambda changes, project: changes), \
+                mock.patch.object(worker, 'review_coalescer', ReviewCoalescer(backend=MemoryCoalescer())), \
+                mock.patch.object(worker.ReviewService, 'get_mr_last_reviewed_commit_id',
+                                  return_value=last_reviewed_commit_id), \
+                mock.patch.object(worker, 'event_manager', mock.MagicMock()):
+            worker.handle_merge_request_event(self.webhook_data, 'token', 'https://gitlab.example.com',
+                                              'gitlab_example_com')
+
+    def test_incremental_review(self):
+        """上次 Review 的提交仍在 MR 中时，只 Review 之后新增的提交及两次 head 之间的变更"""
+        self.run_event('c1')
+        self.handler.get_merge_request_incremental_changes.assert_called_once_with('c1')
+        self.handler.get_merge_request_changes.assert_not_called()
+        self.reviewer.review_changes.assert_called_once_with(CHANGES, 'third;second', False)
+        note = self.handler.add_merge_request_notes.call_args.args[0]
+        self.assertTrue(note.startswith('Auto Review Result (增量 Review: c1..c3):'))
+
+    def test_rebase_fallback(self):
+        """上次 Review 的提交已不在 MR 中(rebase 或 force push)时全量 Review，不请求 compare"""
+        self.run_event('rebased')
+        self.handler.get_merge_request_incremental_changes.assert_not_called()
+        self.handler.get_merge_request_changes.assert_called_once()
+        self.reviewer.review_changes.assert_called_once_with(CHANGES, 'third;second;first', False)
+        self.assertTrue(self.handler.add_merge_request_notes.call_args.args[0].startswith('Auto Review Result: '))
+
+    def test_rebase_without_fallback(self):
+        self.run_event('rebased', {'MERGE_REQUEST_INCREMENTAL_REBASE_FALLBACK': '0'})
+        self.handler.get_merge_request_incremental_changes.assert_called_once_with('rebased')
+        self.handler.get_merge_request_changes.assert_not_called()
+        note = self.handler.add_merge_request_notes.call_args.args[0]
+        self.assertTrue(note.startswith('Auto Review Result (增量 Review(rebase): rebased..c3):'))
+
+
+if __name__ == '__main__':
+    main()
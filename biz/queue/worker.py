@@ -1,14 +1,21 @@
 import os
 import traceback
 from datetime import datetime
+from functools import partial
 
 from biz.entity.review_entity import MergeRequestReviewEntity, PushReviewEntity
 from biz.event.event_manager import event_manager
 from biz.gitlab.webhook_handler import filter_changes, MergeRequestHandler, PushHandler
 from biz.github.webhook_handler import filter_changes as filter_github_changes, PullRequestHandler as GithubPullRequestHandler, PushHandler as GithubPushHandler
-from biz.utils.code_reviewer import CodeReviewer
+from biz.llm.factory import get_review_max_tokens
+from biz.service.review_service import ReviewService
+from biz.utils.code_reviewer import CodeReviewer, get_review_max_chunks
+from biz.utils.coalescer import make_coalesce_key, review_coalescer
+from biz.utils.concurrent_util import run_concurrently
 from biz.utils.im import notifier
 from biz.utils.log import logger
+from biz.utils.queue import defer_queue
+from biz.utils.rate_limiter import RateLimitExceeded
 
 
 
@@ -28,14 +35,14 @@ def handle_push_event(webhook_data: dict, gitlab_token: str, gitlab_url: str, gi
             # 获取PUSH的changes
             changes = handler.get_push_changes()
             logger.info('changes: %s', changes)
-            changes = filter_changes(changes)
+            changes = filter_changes(changes, webhook_data.get('project', {}).get('path_with_namespace'))
             if not changes:
                 logger.info('未检测到PUSH代码的修改,修改文件可能不满足SUPPORTED_EXTENSIONS。')
             review_result = "关注的文件没有修改"
 
             if len(changes) > 0:
                 commits_text = ';'.join(commit.get('message', '').strip() for commit in commits)
-                review_result = CodeReviewer().review_and_strip_code(str(changes), commits_text)
+                review_result = CodeReviewer().review_changes(changes, commits_text)
                 score = CodeReviewer.parse_review_score(review_text=review_result)
             # 将review结果提交到Gitlab的 notes
             handler.add_push_notes(f'Auto Review Result: \n{review_result}')
@@ -51,6 +58,10 @@ def handle_push_event(webhook_data: dict, gitlab_token: str, gitlab_url: str, gi
             url_slug=gitlab_url_slug,
         ))
 
+    except RateLimitExceeded as e:
+        # API 限流额度用完，推迟到额度重置后重新执行
+        logger.warn(f'{e}, job deferred.')
+        defer_queue(handle_push_event, webhook_data, gitlab_token, gitlab_url, gitlab_url_slug, e.retry_after)
     except Exception as e:
         error_message = f'服务出现未知错误: {str(e)}\n{traceback.format_exc()}'
         notifier.send_notification(content=error_message)
@@ -66,6 +77,9 @@ def handle_merge_request_event(webhook_data: dict, gitlab_token: str, gitlab_url
     :param gitlab_url_slug:
     :return:
     '''
+    incremental_review_enabled = os.environ.get('MERGE_REQUEST_INCREMENTAL_REVIEW', '0') == '1'
+    # 分块 Review 时按所有分块的总预算读取变更
+    review_max_tokens = get_review_max_tokens() * get_review_max_chunks()
     try:
         # 解析Webhook数据
         handler = MergeRequestHandler(webhook_data, gitlab_token, gitlab_url)
@@ -75,27 +89,75 @@ def handle_merge_request_event(webhook_data: dict, gitlab_token: str, gitlab_url
             logger.info(f"Merge Request Hook event, action={handler.action}, ignored.")
             return
 
+        coalesce_key = make_coalesce_key(gitlab_url_slug, handler.project_id, handler.merge_request_iid)
+        if not review_coalescer.is_current(coalesce_key, handler.last_commit_id):
+            logger.info(f"Merge Request {coalesce_key} has newer commits than {handler.last_commit_id}, skipped.")
+            return
+
+        # 标题、标签、指派人等元数据变更也会触发 update 事件，没有新的提交时无需重复 Review
+        mr_url = webhook_data['object_attributes']['url']
+        last_reviewed_commit_id = ReviewService.get_mr_last_reviewed_commit_id(mr_url)
+        if handler.last_commit_id and handler.last_commit_id == last_reviewed_commit_id:
+            logger.info(f"Merge Request {mr_url} head {handler.last_commit_id} has already been reviewed, skipped.")
+            return
+        if handler.action == 'update' and not handler.oldrev and last_reviewed_commit_id:
+            logger.info(f"Merge Request {mr_url} updated without new commits, skipped.")
+            return
+
+        # 增量 Review：只 Review 上次 Review 之后新增的提交
+        incremental_review = incremental_review_enabled and last_reviewed_commit_id and handler.last_commit_id
+        if incremental_review:
+            # 先获取 commits，确认上次 Review 的提交仍在 MR 中之后再决定获取两次 head 之间的变更还是全量变更
+            commits, changes = handler.get_merge_request_commits(), None
+        else:
+            # 并发获取Merge Request的commits和changes
+            commits, changes = run_concurrently(handler.get_merge_request_commits,
+                                                partial(handler.get_merge_request_changes, review_max_tokens))
+        if not commits:
+            logger.error('Failed to get commits')
+            return
+
+        review_commits = commits
+        review_scope = ''
+        if incremental_review:
+            commit_ids = [commit.get('id') for commit in commits]
+            if last_reviewed_commit_id in commit_ids:
+                # commits 按时间倒序排列，上次 Review 的提交之前的都是新增提交
+                review_commits = commits[:commit_ids.index(last_reviewed_commit_id)]
+                review_scope = f'增量 Review: {last_reviewed_commit_id[:8]}..{handler.last_commit_id[:8]}'
+                changes = handler.get_merge_request_incremental_changes(last_reviewed_commit_id)
+            elif os.environ.get('MERGE_REQUEST_INCREMENTAL_REBASE_FALLBACK', '1') == '1':
+                logger.info(f"Commit {last_reviewed_commit_id} is no longer in Merge Request {mr_url} "
+                            f"(rebased or force pushed), fallback to full review.")
+                changes = handler.get_merge_request_changes(review_max_tokens)
+            else:
+                review_scope = f'增量 Review(rebase): {last_reviewed_commit_id[:8]}..{handler.last_commit_id[:8]}'
+                changes = handler.get_merge_request_incremental_changes(last_reviewed_commit_id)
+
         # 仅仅在MR创建或更新时进行Code Review
-        # 获取Merge Request的changes
-        changes = handler.get_merge_request_changes()
         logger.info('changes: %s', changes)
-        changes = filter_changes(changes)
+        changes = filter_changes(changes, webhook_data.get('project', {}).get('path_with_namespace'))
         if not changes:
             logger.info('未检测到有关代码的修改,修改文件可能不满足SUPPORTED_EXTENSIONS。')
             return
 
-        # 获取Merge Request的commits
-        commits = handler.get_merge_request_commits()
-        if not commits:
-            logger.error('Failed to get commits')
+        # review 代码
+        if not review_coalescer.is_current(coalesce_key, handler.last_commit_id):
+            logger.info(f"Merge Request {coalesce_key} has newer commits than {handler.last_commit_id}, skipped.")
             return
+        commits_text = ';'.join(commit['title'] for commit in review_commits)
+        review_result = CodeReviewer().review_changes(changes, commits_text, handler.changes_truncated)
 
-        # review 代码
-        commits_text = ';'.join(commit['title'] for commit in commits)
-        review_result = CodeReviewer().review_and_strip_code(str(changes), commits_text)
+        # review 期间有新的推送，丢弃本次结果，由最新的任务提交
+        if not review_coalescer.is_current(coalesce_key, handler.last_commit_id):
+            logger.info(f"Merge Request {coalesce_key} updated during review, result discarded.")
+            return
 
         # 将review结果提交到Gitlab的 notes
-        handler.add_merge_request_notes(f'Auto Review Result: \n{review_result}')
+        if review_scope:
+            handler.add_merge_request_notes(f'Auto Review Result ({review_scope}): \n{review_result}')
+        else:
+            handler.add_merge_request_notes(f'Auto Review Result: \n{review_result}')
 
         # dispatch merge_request_reviewed event
         event_manager['merge_request_reviewed'].send(
@@ -107,12 +169,17 @@ def handle_merge_request_event(webhook_data: dict, gitlab_token: str, gitlab_url
                 updated_at=int(datetime.now().timestamp()),
                 commits=commits,
                 score=CodeReviewer.parse_review_score(review_text=review_result),
-                url=webhook_data['object_attributes']['url'],
+                url=mr_url,
                 review_result=review_result,
                 url_slug=gitlab_url_slug,
+                last_commit_id=handler.last_commit_id or '',
             )
         )
 
+    except RateLimitExceeded as e:
+        # API 限流额度用完，推迟到额度重置后重新执行
+        logger.warn(f'{e}, job deferred.')
+        defer_queue(handle_merge_request_event, webhook_data, gitlab_token, gitlab_url, gitlab_url_slug, e.retry_after)
     except Exception as e:
         error_message = f'AI Code Review 服务出现未知错误: {str(e)}\n{traceback.format_exc()}'
         notifier.send_notification(content=error_message)
@@ -134,14 +201,14 @@ def handle_github_push_event(webhook_data: dict, github_token: str, github_url:
             # 获取PUSH的changes
             changes = handler.get_push_changes()
             logger.info('changes: %s', changes)
-            changes = filter_github_changes(changes)
+            changes = filter_github_changes(changes, webhook_data.get('repository', {}).get('full_name'))
             if not changes:
                 logger.info('未检测到PUSH代码的修改,修改文件可能不满足SUPPORTED_EXTENSIONS。')
             review_result = "关注的文件没有修改"
 
             if len(changes) > 0:
                 commits_text = ';'.join(commit.get('message', '').strip() for commit in commits)
-                review_result = CodeReviewer().review_and_strip_code(str(changes), commits_text)
+                review_result = CodeReviewer().review_changes(changes, commits_text)
                 score = CodeReviewer.parse_review_score(review_text=review_result)
             # 将review结果提交到GitHub的 notes
             handler.add_push_notes(f'Auto Review Result: \n{review_result}')
@@ -157,6 +224,10 @@ def handle_github_push_event(webhook_data: dict, github_token: str, github_url:
             url_slug=github_url_slug,
         ))
 
+    except RateLimitExceeded as e:
+        # API 限流额度用完，推迟到额度重置后重新执行
+        logger.warn(f'{e}, job deferred.')
+        defer_queue(handle_github_push_event, webhook_data, github_token, github_url, github_url_slug, e.retry_after)
     except Exception as e:
         error_message = f'服务出现未知错误: {str(e)}\n{traceback.format_exc()}'
         notifier.send_notification(content=error_message)
@@ -172,6 +243,8 @@ def handle_github_pull_request_event(webhook_data: dict, github_token: str, gith
     :param github_url_slug:
     :return:
     '''
+    # 分块 Review 时按所有分块的总预算读取变更
+    review_max_tokens = get_review_max_tokens() * get_review_max_chunks()
     try:
         # 解析Webhook数据
         handler = GithubPullRequestHandler(webhook_data, github_token, github_url)
@@ -181,24 +254,42 @@ def handle_github_pull_request_event(webhook_data: dict, github_token: str, gith
             logger.info(f"Pull Request Hook event, action={handler.action}, ignored.")
             return
 
+        coalesce_key = make_coalesce_key(github_url_slug, handler.repo_full_name, handler.pull_request_number)
+        if not review_coalescer.is_current(coalesce_key, handler.last_commit_id):
+            logger.info(f"Pull Request {coalesce_key} has newer commits than {handler.last_commit_id}, skipped.")
+            return
+
+        # 重复投递的 webhook 不再重复 Review
+        pr_url = webhook_data['pull_request']['html_url']
+        if handler.last_commit_id and handler.last_commit_id == ReviewService.get_mr_last_reviewed_commit_id(pr_url):
+            logger.info(f"Pull Request {pr_url} head {handler.last_commit_id} has already been reviewed, skipped.")
+            return
+
         # 仅仅在PR创建或更新时进行Code Review
-        # 获取Pull Request的changes
-        changes = handler.get_pull_request_changes()
+        # 并发获取Pull Request的changes和commits
+        changes, commits = run_concurrently(partial(handler.get_pull_request_changes, review_max_tokens),
+                                            handler.get_pull_request_commits)
         logger.info('changes: %s', changes)
-        changes = filter_github_changes(changes)
+        changes = filter_github_changes(changes, webhook_data.get('repository', {}).get('full_name'))
         if not changes:
             logger.info('未检测到有关代码的修改,修改文件可能不满足SUPPORTED_EXTENSIONS。')
             return
 
-        # 获取Pull Request的commits
-        commits = handler.get_pull_request_commits()
         if not commits:
             logger.error('Failed to get commits')
             return
 
         # review 代码
+        if not review_coalescer.is_current(coalesce_key, handler.last_commit_id):
+            logger.info(f"Pull Request {coalesce_key} has newer commits than {handler.last_commit_id}, skipped.")
+            return
         commits_text = ';'.join(commit['title'] for commit in commits)
-        review_result = CodeReviewer().review_and_strip_code(str(changes), commits_text)
+        review_result = CodeReviewer().review_changes(changes, commits_text, handler.changes_truncated)
+
+        # review 期间有新的推送，丢弃本次结果，由最新的任务提交
+        if not review_coalescer.is_current(coalesce_key, handler.last_commit_id):
+            logger.info(f"Pull Request {coalesce_key} updated during review, result discarded.")
+            return
 
         # 将review结果提交到GitHub的 notes
         handler.add_pull_request_notes(f'Auto Review Result: \n{review_result}')
@@ -213,11 +304,16 @@ def handle_github_pull_request_event(webhook_data: dict, github_token: str, gith
                 updated_at=int(datetime.now().timestamp()),
                 commits=commits,
                 score=CodeReviewer.parse_review_score(review_text=review_result),
-                url=webhook_data['pull_request']['html_url'],
+                url=pr_url,
                 review_result=review_result,
-                url_slug=github_url_slug
+                url_slug=github_url_slug,
+                last_commit_id=handler.last_commit_id or '',
             ))
 
+    except RateLimitExceeded as e:
+        # API 限流额度用完，推迟到额度重置后重新执行
+        logger.warn(f'{e}, job deferred.')
+        defer_queue(handle_github_pull_request_event, webhook_data, github_token, github_url, github_url_slug, e.retry_after)
     except Exception as e:
         error_message = f'服务出现未知错误: {str(e)}\n{traceback.format_exc()}'
         notifier.send_notification(content=error_message)
@@ -25,9 +25,16 @@ class ReviewService:
                             commit_messages TEXT,
                             score INTEGER,
                             url TEXT,
-                            review_result TEXT
+                            review_result TEXT,
+                            last_commit_id TEXT
                         )
                     ''')
+                # 兼容旧版本数据库，补充 last_commit_id 字段
+                cursor.execute("PRAGMA table_info(mr_review_log)")
+                columns = [row[1] for row in cursor.fetchall()]
+                if 'last_commit_id' not in columns:
+                    cursor.execute("ALTER TABLE mr_review_log ADD COLUMN last_commit_id TEXT")
+                cursor.execute("CREATE INDEX IF NOT EXISTS idx_mr_review_log_url ON mr_review_log (url)")
                 cursor.execute('''
                         CREATE TABLE IF NOT EXISTS push_review_log (
                             id INTEGER PRIMARY KEY AUTOINCREMENT,
@@ -51,17 +58,34 @@ class ReviewService:
             with sqlite3.connect(ReviewService.DB_FILE) as conn:
                 cursor = conn.cursor()
                 cursor.execute('''
-                                INSERT INTO mr_review_log (project_name,author, source_branch, target_branch, updated_at, commit_messages, score, url,review_result)
-                                VALUES (?,?, ?, ?, ?, ?, ?, ?, ?)
+                                INSERT INTO mr_review_log (project_name,author, source_branch, target_branch, updated_at, commit_messages, score, url,review_result, last_commit_id)
+                                VALUES (?,?, ?, ?, ?, ?, ?, ?, ?, ?)
                             ''',
                                (entity.project_name, entity.author, entity.source_branch,
                                 entity.target_branch,
                                 entity.updated_at, entity.commit_messages, entity.score,
-                                entity.url, entity.review_result))
+                                entity.url, entity.review_result, entity.last_commit_id))
                 conn.commit()
         except sqlite3.DatabaseError as e:
             print(f"Error inserting review log: {e}")
 
+    @staticmethod
+    def get_mr_last_reviewed_commit_id(url: str) -> str | None:
+        """获取合并请求最近一次审核时的 head commit id，没有审核记录时返回 None"""
+        try:
+            with sqlite3.connect(ReviewService.DB_FILE) as conn:
+                cursor = conn.cursor()
+                cursor.execute('''
+                                SELECT last_commit_id FROM mr_review_log
+                                WHERE url = ? AND last_commit_id IS NOT NULL AND last_commit_id != ''
+                                ORDER BY updated_at DESC, id DESC LIMIT 1
+                            ''', (url,))
+                row = cursor.fetchone()
+                return row[0] if row else None
+        except sqlite3.DatabaseError as e:
+            print(f"Error retrieving last reviewed commit: {e}")
+            return None
+
     @staticmethod
     def get_mr_review_logs(authors: list = None, project_names: list = None, updated_at_gte: int = None,
                            updated_at_lte: int = None) -> pd.DataFrame:
@@ -0,0 +1,175 @@
+import os
+import threading
+
+from biz.utils.log import logger
+
+
+def make_coalesce_key(url_slug: str, project_id, number) -> str:
+    """
+    生成 MR/PR Review 任务的合并键，同一个 MR 的多次 webhook 使用同一个键，举例：
+    make_coalesce_key("gitlab_example_com", 12, 3) => gitlab_example_com:12:3
+    """
+    return f"{url_slug}:{project_id}:{number}"
+
+
+class MemoryCoalescer:
+    """
+    async 驱动使用的进程内实现：记录每个 MR 最新的 head SHA 以及最近一次排队的任务(Future)。
+    同一个 MR 登记过的任务全部结束(完成或取消)后删除该 MR 的记录，避免长期运行时无限增长
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._entries = {}
+
+    def supersede(self, key: str, revision: str):
+        """
+        登记新的 head SHA，并取消仍在排队、尚未开始执行的旧任务。
+        head SHA 未变化时(如只修改了标题、标签)不取消，排队中的推送任务仍需 Review 新的提交
+        """
+        with self._lock:
+            previous = self._entries.get(key, {})
+            if revision and previous.get('revision') == revision:
+                return
+            # pending 为仍未结束的任务数，旧任务可能仍在执行，需要保留记录直到其结束
+            self._entries[key] = {'revision': revision, 'job': None, 'pending': previous.get('pending', 0)}
+        job = previous.get('job')
+        if job is not None and job.cancel():
+            logger.info(f"Queued review job for {key} (revision={previous.get('revision')}) superseded, cancelled.")
+
+    def track(self, key: str, revision: str, job):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                # supersede 之后、track 之前旧任务已全部结束，记录已被删除
+                entry = self._entries[key] = {'revision': revision, 'job': None, 'pending': 0}
+            if entry['revision'] == revision:
+                entry['job'] = job
+            entry['pending'] += 1
+        job.add_done_callback(lambda _: self._finish(key))
+
+    def _finish(self, key: str):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return
+            entry['pending'] -= 1
+            if entry['pending'] <= 0:
+                del self._entries[key]
+
+    def current_revision(self, key: str):
+        with self._lock:
+            return self._entries.get(key, {}).get('revision')
+
+
+class RedisCoalescer:
+    """
+    rq 驱动使用的 Redis 实现，api 进程与 worker 进程通过 Redis 共享最新的 head SHA 和排队任务 ID
+    """
+    KEY_PREFIX = 'ai_codereview:coalesce:'
+    KEY_TTL = 24 * 3600
+    # 读取旧任务 ID 与登记新的 head SHA 原子执行，并发的 webhook 不会漏掉需要取消的任务
+    # head SHA 未变化时不取消排队中的任务
+    SUPERSEDE_SCRIPT = """
+if ARGV[1] ~= '' and redis.call('HGET', KEYS[1], 'revision') == ARGV[1] then
+    redis.call('EXPIRE', KEYS[1], ARGV[2])
+    return false
+end
+local previous = redis.call('HGET', KEYS[1], 'job_id')
+redis.call('DEL', KEYS[1])
+redis.call('HSET', KEYS[1], 'revision', ARGV[1])
+redis.call('EXPIRE', KEYS[1], ARGV[2])
+return previous
+"""
+    # head SHA 仍是本次登记的 SHA 时才记录任务 ID
+    TRACK_SCRIPT = """
+if redis.call('HGET', KEYS[1], 'revision') == ARGV[1] then
+    redis.call('HSET', KEYS[1], 'job_id', ARGV[2])
+    return 1
+end
+return 0
+"""
+
+    def __init__(self, connection=None):
+        if connection is None:
+            from biz.utils.queue import get_redis
+            connection = get_redis()
+        self.connection = connection
+        self._supersede_script = connection.register_script(self.SUPERSEDE_SCRIPT)
+        self._track_script = connection.register_script(self.TRACK_SCRIPT)
+
+    def _key(self, key: str) -> str:
+        return f'{self.KEY_PREFIX}{key}'
+
+    def supersede(self, key: str, revision: str):
+        previous_job_id = self._supersede_script(keys=[self._key(key)], args=[revision or '', self.KEY_TTL])
+        if previous_job_id:
+            self._cancel_queued_job(key, previous_job_id.decode() if isinstance(previous_job_id, bytes) else previous_job_id)
+
+    def _cancel_queued_job(self, key: str, job_id: str):
+        from rq.job import Job, JobStatus
+        try:
+            job = Job.fetch(job_id, connection=self.connection)
+            if job.get_status() == JobStatus.QUEUED:
+                job.cancel()
+                logger.info(f"Queued review job {job_id} for {key} superseded, cancelled.")
+        except Exception as e:
+            logger.warn(f"Failed to cancel superseded job {job_id}: {e}")
+
+    def track(self, key: str, revision: str, job):
+        self._track_script(keys=[self._key(key)], args=[revision or '', job.id])
+
+    def current_revision(self, key: str):
+        revision = self.connection.hget(self._key(key), 'revision')
+        if revision is None:
+            return None
+        return revision.decode() if isinstance(revision, bytes) else revision
+
+
+class ReviewCoalescer:
+    """
+    合并同一个 MR/PR 的重复 Review 任务：
+    - 入队时登记最新的 head SHA，取消同一 MR 仍在排队的旧任务
+    - 执行过程中通过 is_current 判断 head SHA 是否已被新的推送取代，已过期的任务直接丢弃结果
+    """
+
+    def __init__(self, backend=None):
+        self._backend = backend
+        self._backend_lock = threading.Lock()
+
+    @property
+    def backend(self):
+        if self._backend is None:
+            with self._backend_lock:
+                if self._backend is None:
+                    if os.getenv('QUEUE_DRIVER', 'async') == 'rq':
+                        self._backend = RedisCoalescer()
+                    else:
+                        self._backend = MemoryCoalescer()
+        return self._backend
+
+    def supersede(self, key: str, revision: str):
+        try:
+            self.backend.supersede(key, revision)
+        except Exception as e:
+            logger.warn(f"Failed to register revision {revision} for {key}: {e}")
+
+    def track(self, key: str, revision: str, job):
+        try:
+            self.backend.track(key, revision, job)
+        except Exception as e:
+            logger.warn(f"Failed to track job for {key}: {e}")
+
+    def is_current(self, key: str, revision: str) -> bool:
+        """revision 是否仍是该 MR 最新的 head SHA，无法判断时视为最新"""
+        if not revision:
+            return True
+        try:
+            current = self.backend.current_revision(key)
+        except Exception as e:
+            logger.warn(f"Failed to get current revision for {key}: {e}")
+            return True
+        return not current or current == revision
+
+
+review_coalescer = ReviewCoalescer()
@@ -44,3 +44,166 @@ class GitDiffParser:
         if self.new_code is None:
             self.parse_diff()
         return self.new_code
+
+
+HUNK_HEADER = re.compile(r'^@@ -(\d+)(?:,(\d+))? \+(\d+)(?:,(\d+))? @@ ?(.*)$')
+
+
+class DiffLine:
+    """diff 中的一行，kind 为 ' '(上下文)、'-'(删除)、'+'(新增)；不存在的一侧行号为 None"""
+    __slots__ = ('kind', 'text', 'old_lineno', 'new_lineno')
+
+    def __init__(self, kind: str, text: str, old_lineno: int | None, new_lineno: int | None):
+        self.kind = kind
+        self.text = text
+        self.old_lineno = old_lineno
+        self.new_lineno = new_lineno
+
+    def __repr__(self):
+        return f'DiffLine({self.kind!r}, {self.text!r}, {self.old_lineno}, {self.new_lineno})'
+
+
+def _normalize_whitespace(text: str) -> str:
+    """保留行首缩进，去掉其余空白"""
+    content = text.lstrip()
+    return text[:len(text) - len(content)] + ''.join(content.split())
+
+
+class Hunk:
+    __slots__ = ('old_start', 'old_count', 'new_start', 'new_count', 'section', 'lines')
+
+    def __init__(self, old_start: int, old_count: int, new_start: int, new_count: int, section: str = ''):
+        self.old_start = old_start
+        self.old_count = old_count
+        self.new_start = new_start
+        self.new_count = new_count
+        self.section = section
+        self.lines = []
+
+    @property
+    def header(self) -> str:
+        header = f'@@ -{self.old_start},{self.old_count} +{self.new_start},{self.new_count} @@'
+        return f'{header} {self.section}' if self.section else header
+
+    @property
+    def added(self) -> list:
+        return [line for line in self.lines if line.kind == '+']
+
+    @property
+    def removed(self) -> list:
+        return [line for line in self.lines if line.kind == '-']
+
+    def is_whitespace_only(self) -> bool:
+        """
+        删除行和新增行去掉行内空白后完全相同。行首缩进保留比较：Python、YAML 等语言中
+        调整缩进会改变代码结构，不视为空白修改
+        """
+        return [_normalize_whitespace(line.text) for line in self.removed] == \
+            [_normalize_whitespace(line.text) for line in self.added]
+
+    def to_text(self) -> str:
+        return '\n'.join([self.header] + [line.kind + line.text for line in self.lines])
+
+
+class FileDiff:
+    __slots__ = ('old_path', 'new_path', 'hunks')
+
+    def __init__(self, old_path: str, new_path: str, hunks: list = None):
+        self.old_path = old_path
+        self.new_path = new_path
+        self.hunks = hunks if hunks is not None else []
+
+    @property
+    def added_count(self) -> int:
+        return sum(1 for hunk in self.hunks for line in hunk.lines if line.kind == '+')
+
+    @property
+    def removed_count(self) -> int:
+        return sum(1 for hunk in self.hunks for line in hunk.lines if line.kind == '-')
+
+    def find_line(self, new_lineno: int) -> DiffLine | None:
+        """按新文件行号查找 diff 中的行(用于行内评论定位)，不在 diff 中时返回 None"""
+        for hunk in self.hunks:
+            if hunk.new_start <= new_lineno < hunk.new_start + max(hunk.new_count, 1):
+                for line in hunk.lines:
+                    if line.new_lineno == new_lineno:
+                        return line
+        return None
+
+    def to_text(self) -> str:
+        return '\n'.join(hunk.to_text() for hunk in self.hunks)
+
+
+def parse_diff(diff: str, old_path: str = '', new_path: str = '') -> FileDiff:
+    """
+    单次遍历解析单个文件的 diff(GitLab/GitHub API 返回的 diff 字段，或 git diff 输出)，
+    得到 hunk 以及每一行的新旧行号；hunk 之前的文件头(diff --git、---、+++ 等)会被忽略
+    """
+    file_diff = FileDiff(old_path, new_path)
+    hunks = file_diff.hunks
+    append = None
+    old_lineno = new_lineno = 0
+    line_type = DiffLine
+    for raw in diff.splitlines():
+        kind = raw[:1]
+        if kind == '+':
+            if append is not None:
+                append(line_type('+', raw[1:], None, new_lineno))
+                new_lineno += 1
+        elif kind == '-':
+            if append is not None:
+                append(line_type('-', raw[1:], old_lineno, None))
+                old_lineno += 1
+        elif kind == '@':
+            match = HUNK_HEADER.match(raw)
+            if match is None:
+                continue
+            old_start, old_count, new_start, new_count, section = match.groups()
+            hunk = Hunk(int(old_start), int(old_count) if old_count is not None else 1,
+                        int(new_start), int(new_count) if new_count is not None else 1, section)
+            hunks.append(hunk)
+            append = hunk.lines.append
+            old_lineno, new_lineno = hunk.old_start, hunk.new_start
+        elif kind == '\\':
+            # "\ No newline at end of file"
+            continue
+        elif append is not None:
+            append(line_type(' ', raw[1:], old_lineno, new_lineno))
+            old_lineno += 1
+            new_lineno += 1
+    return file_diff
+
+
+def parse_changes(changes: list) -> list:
+    """将 change 字典列表解析为 FileDiff 列表"""
+    return [parse_diff(change.get('diff', ''), change.get('old_path', change.get('new_path', '')),
+                       change.get('new_path', '')) for change in changes]
+
+
+if __name__ == '__main__':
+    import sys
+    import time
+    import tracemalloc
+
+    # 基准测试：解析 N MB 的 diff，对比 GitDiffParser
+    size_mb = float(sys.argv[1]) if len(sys.argv) > 1 else 8
+    hunk_text = '@@ -10,7 +10,8 @@ def func():\n' + ''.join(
+        [' context line\n'] * 3 + ['-    old = compute(a, b)\n', '+    new = compute(a, b, c)\n',
+                                   '+    log(new)\n'] + [' context line\n'] * 3)
+    text = hunk_text * int(size_mb * 1024 * 1024 / len(hunk_text))
+    print(f'diff size: {len(text) / 1024 / 1024:.1f} MB, {text.count(chr(10))} lines')
+
+    start = time.perf_counter()
+    GitDiffParser(text).parse_diff()
+    print(f'GitDiffParser.parse_diff: {time.perf_counter() - start:.3f}s')
+
+    start = time.perf_counter()
+    parsed = parse_diff(text, 'a.py', 'a.py')
+    print(f'parse_diff: {time.perf_counter() - start:.3f}s, {len(parsed.hunks)} hunks')
+    del parsed
+
+    tracemalloc.start()
+    parse_diff(text, 'a.py', 'a.py')
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print(f'parse_diff peak memory: {peak / 1024 / 1024:.1f} MB')
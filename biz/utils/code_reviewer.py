@@ -1,14 +1,39 @@
 import abc
+import asyncio
+import hashlib
 import os
 import re
+import threading
 from typing import Dict, Any, List
 
 import yaml
 from jinja2 import Template
 
-from biz.llm.factory import Factory
+from biz.llm.client.deepseek import DeepSeekClient
+from biz.llm.factory import Factory, get_review_max_tokens
+from biz.llm.stream import COT_ABORT, INCOMPLETE_MARK
+from biz.utils.code_parser import parse_changes
+from biz.utils.concurrent_util import run_coroutine
+from biz.utils.diff_minifier import get_diff_minifier
 from biz.utils.log import logger
-from biz.utils.token_util import count_tokens, truncate_text_by_tokens
+from biz.utils.metrics import metrics
+from biz.utils.rate_limiter import RateLimitExceeded
+from biz.utils.review_cache import ReviewCache, get_review_cache
+from biz.utils.token_budget import BudgetResult, TokenBudgetAllocator
+
+
+PROMPT_TEMPLATES_FILE = "conf/prompt_templates.yml"
+
+# 渲染后的提示词缓存：{(prompt_key, style): (提示词文件的 mtime, 提示词)}
+_prompt_cache = {}
+_prompt_cache_lock = threading.Lock()
+
+
+def get_review_max_chunks() -> int:
+    """开启 REVIEW_CHUNKED_ENABLED 时每次 Review 最多拆分的分块数，未开启时为 1"""
+    if os.getenv("REVIEW_CHUNKED_ENABLED", "0") != "1":
+        return 1
+    return max(int(os.getenv("REVIEW_MAX_CHUNKS", 8)), 1)
 
 
 class BaseReviewer(abc.ABC):
@@ -19,11 +44,28 @@ class BaseReviewer(abc.ABC):
         self.prompts = self._load_prompts(prompt_key,os.getenv("REVIEW_STYLE", "professional"))
 
     def _load_prompts(self, prompt_key: str, style="professional") -> Dict[str, Any]:
-        """加载提示词配置"""
-        prompt_templates_file = "conf/prompt_templates.yml"
+        """
+        加载提示词配置。渲染结果按 (prompt_key, style) 在进程内缓存，
+        conf/prompt_templates.yml 的修改时间变化后重新加载
+        """
+        try:
+            mtime = os.stat(PROMPT_TEMPLATES_FILE).st_mtime_ns
+        except FileNotFoundError as e:
+            logger.error(f"加载提示词配置失败: {e}")
+            raise Exception(f"提示词配置加载失败: {e}")
+        cached = _prompt_cache.get((prompt_key, style))
+        if cached is not None and cached[0] == mtime:
+            return cached[1]
+        with _prompt_cache_lock:
+            prompts = self._render_prompts(prompt_key, style)
+            _prompt_cache[(prompt_key, style)] = (mtime, prompts)
+        return prompts
+
+    @staticmethod
+    def _render_prompts(prompt_key: str, style: str) -> Dict[str, Any]:
         try:
             # 在打开 YAML 文件时显式指定编码为 UTF-8，避免使用系统默认的 GBK 编码。
-            with open(prompt_templates_file, "r", encoding="utf-8") as file:
+            with open(PROMPT_TEMPLATES_FILE, "r", encoding="utf-8") as file:
                 prompts = yaml.safe_load(file).get(prompt_key, {})
 
                 # 使用Jinja2渲染模板
@@ -48,6 +90,13 @@ class BaseReviewer(abc.ABC):
         logger.info(f"收到 AI 返回结果: {review_result}")
         return review_result
 
+    async def acall_llm(self, messages: List[Dict[str, Any]]) -> str:
+        """在事件循环中调用 LLM 进行代码审核，多个请求可在同一线程中并发"""
+        logger.info(f"向 AI 发送代码 Review 请求, messages: {messages}")
+        review_result = await self.client.acompletions(messages=messages)
+        logger.info(f"收到 AI 返回结果: {review_result}")
+        return review_result
+
     @abc.abstractmethod
     def review_code(self, *args, **kwargs) -> str:
         """抽象方法，子类必须实现"""
@@ -60,6 +109,105 @@ class CodeReviewer(BaseReviewer):
     def __init__(self):
         super().__init__("code_review_prompt")
 
+    def review_changes(self, changes: list, commits_text: str = "", changes_truncated: bool = False) -> str:
+        """
+        Review 过滤后的 changes 列表。变更超出 REVIEW_MAX_TOKENS 时按文件优先级分配预算，
+        未完整 Review 的文件会列在结果末尾，changes_truncated 为 True(读取变更时已截断)时在同一说明中注明。开启 REVIEW_CACHE_ENABLED 时，相同补丁(patch-id)、模型和提示词版本的
+        Review 结果直接从缓存返回，不再调用 LLM。只缓存完整的结果，LLM 调用失败或输出不完整时下次重新 Review
+        """
+        review_cache = get_review_cache()
+        cache_key = None
+        if review_cache is not None and changes:
+            cache_key = ReviewCache.make_key(changes, self.model_name(), self.prompt_version())
+            review_result = review_cache.get(cache_key)
+            if review_result is not None:
+                logger.info(f"Review cache hit, key: {cache_key}")
+                return review_result
+
+        budget = self.allocate_changes(changes)
+        failed_note = ''
+        if len(budget.chunks) > 1:
+            review_result, failed_note, complete = self._review_chunks(budget.chunks, commits_text)
+        else:
+            # 预算分配时已按 hunk 计数，文本不会超出 REVIEW_MAX_TOKENS，无需再次编码
+            review_result = self._review_and_strip(budget.text, commits_text)
+            complete = self.is_complete_result(review_result)
+        note = budget.note(changes_truncated)
+        if note:
+            review_result += f'\n\n{note}'
+        if failed_note:
+            # 部分分块失败的结果不完整，不写入缓存
+            return review_result + f'\n\n{failed_note}'
+        if cache_key is not None and complete:
+            review_cache.put(cache_key, review_result)
+        return review_result
+
+    @staticmethod
+    def is_complete_result(review_result: str) -> bool:
+        """LLM 的输出是否完整：思考链被截断、流式输出提前中止或被截断、DeepSeek 返回错误说明时不完整"""
+        if COT_ABORT in review_result or INCOMPLETE_MARK in review_result:
+            return False
+        return not review_result.startswith(DeepSeekClient.ERROR_MESSAGE_PREFIXES)
+
+    @staticmethod
+    def allocate_changes(changes: list) -> BudgetResult:
+        """
+        将 changes 转换为发送给模型的文本：开启 DIFF_MINIFY_ENABLED 时先压缩每个 hunk 并记录节省的 token 数，
+        再按 REVIEW_MAX_TOKENS 在文件之间分配预算。
+        开启 REVIEW_CHUNKED_ENABLED 时总预算为 REVIEW_MAX_TOKENS * REVIEW_MAX_CHUNKS，选出的 hunk 拆分为
+        每块不超过 REVIEW_MAX_TOKENS 的分块(BudgetResult.chunks)
+        """
+        diff_minifier = get_diff_minifier()
+        files = []
+        # 压缩前的 hunk 与压缩后的 hunk 在同一批中计数，用于统计节省的 token 数
+        originals = [] if diff_minifier is not None else None
+        for file_diff in parse_changes(changes):
+            if diff_minifier is not None:
+                hunks = [diff_minifier.minify_hunk(hunk) for hunk in file_diff.hunks]
+            else:
+                hunks = [hunk.to_text() for hunk in file_diff.hunks]
+            hunks = [hunk for hunk in hunks if hunk]
+            # 没有 hunk 的文件(二进制文件等)保留在列表中，由预算分配结果列入说明；hunk 全部被压缩掉的文件不再 Review
+            if hunks or not file_diff.hunks:
+                files.append((file_diff.new_path, hunks))
+                if originals is not None:
+                    originals.append([hunk.to_text() for hunk in file_diff.hunks])
+
+        # 按当前模型的 tokenizer 计数，REVIEW_MAX_TOKENS=auto 时按模型上下文窗口推算预算
+        tokenizer = Factory.getTokenizer()
+        review_max_tokens = get_review_max_tokens()
+        max_chunks = get_review_max_chunks()
+        if max_chunks > 1:
+            allocator = TokenBudgetAllocator(review_max_tokens * max_chunks, tokenizer=tokenizer)
+            budget = allocator.split(files, review_max_tokens, originals)
+        else:
+            budget = TokenBudgetAllocator(review_max_tokens, tokenizer=tokenizer).allocate(files, originals)
+        if diff_minifier is not None:
+            tokens_saved = budget.original_tokens - budget.total_tokens
+            metrics.incr('review_diff_tokens_saved', tokens_saved)
+            logger.info(f"Diff minified: {len(changes)} files, {tokens_saved} tokens saved.")
+        if budget.partial or budget.skipped:
+            metrics.incr('review_files_over_budget', len(budget.partial) + len(budget.skipped))
+            logger.info(f"Token budget exceeded ({budget.total_tokens} tokens), partial: {budget.partial}, "
+                        f"skipped: {budget.skipped}")
+        return budget
+
+    def model_name(self) -> str:
+        return f'{os.getenv("LLM_PROVIDER", "openai")}:{getattr(self.client, "default_model", "")}'
+
+    def prompt_version(self) -> str:
+        """
+        渲染后的提示词、diff 压缩配置及 token 预算的摘要，
+        提示词、REVIEW_STYLE、压缩配置、REVIEW_MAX_TOKENS 或分块配置变化后缓存自动失效
+        """
+        diff_minifier = get_diff_minifier()
+        content = self.prompts["system_message"]["content"] + self.prompts["user_message"]["content"]
+        if diff_minifier is not None:
+            content += diff_minifier.version()
+        # 预算决定 diff 在哪里截断，使用生效的预算(REVIEW_MAX_TOKENS=auto 时按模型推算)
+        content += f'budget:{get_review_max_tokens()}:{get_review_max_chunks()}'
+        return hashlib.sha256(content.encode()).hexdigest()[:16]
+
     def review_and_strip_code(self, changes_text: str, commits_text: str = "") -> str:
         """
         Review判断changes_text超出取前REVIEW_MAX_TOKENS个token，超出则截断changes_text，
@@ -69,25 +217,100 @@ class CodeReviewer(BaseReviewer):
         :return:
         """
         # 如果超长，取前REVIEW_MAX_TOKENS个token
-        review_max_tokens = int(os.getenv("REVIEW_MAX_TOKENS", 10000))
+        review_max_tokens = get_review_max_tokens()
+
+        # 只编码一次：超过REVIEW_MAX_TOKENS时截断changes_text，明显不超出时不编码
+        changes_text, _ = Factory.getTokenizer().fit(changes_text, review_max_tokens)
+        return self._review_and_strip(changes_text, commits_text)
+
+    def _review_and_strip(self, changes_text: str, commits_text: str = "") -> str:
         # 如果changes为空,打印日志
         if not changes_text:
             logger.info("代码为空, diffs_text = %", str(changes_text))
             return "代码为空"
+        return self._strip_markdown(self.review_code(changes_text, commits_text))
 
-        # 计算tokens数量，如果超过REVIEW_MAX_TOKENS，截断changes_text
-        tokens_count = count_tokens(changes_text)
-        if tokens_count > review_max_tokens:
-            changes_text = truncate_text_by_tokens(changes_text, review_max_tokens)
-
-        review_result = self.review_code(changes_text, commits_text).strip()
+    @staticmethod
+    def _strip_markdown(review_result: str) -> str:
+        """如果review_result是markdown格式，则去掉头尾的```"""
+        review_result = review_result.strip()
         if review_result.startswith("```markdown") and review_result.endswith("```"):
             return review_result[11:-3].strip()
         return review_result
 
-    def review_code(self, diffs_text: str, commits_text: str = "") -> str:
-        """Review 代码并返回结果"""
+    def _review_chunks(self, chunks: list, commits_text: str = "") -> tuple[str, str, bool]:
+        """
+        分块 Review(map-reduce)：各分块在事件循环中以 REVIEW_CHUNK_CONCURRENCY 的并发数同时 Review，
+        再由汇总提示词合并所有分块的问题并给出总分，整体耗时约为单个分块 Review 加一次汇总
+        :return: (Review 结果, 失败分块的说明, 分块及汇总的输出是否都完整)
+        """
+        concurrency = min(max(int(os.getenv("REVIEW_CHUNK_CONCURRENCY", 4)), 1), len(chunks))
+        logger.info(f"Chunked review: {len(chunks)} chunks, concurrency {concurrency}.")
+        metrics.incr('review_chunks', len(chunks))
+        # 在进程内共享的事件循环中执行，异步客户端的连接池在多次 Review 之间复用
+        chunk_results = run_coroutine(self._areview_chunks(chunks, commits_text, concurrency))
+        # 任一分块被限流(包括等待 LLM 并发名额超时)时抛出，由 worker 推迟整个任务，不发布不完整的结果；
+        # 其余原因部分分块失败时只汇总成功的分块，全部失败时抛出第一个异常
+        for result in chunk_results:
+            if isinstance(result, RateLimitExceeded):
+                raise result
+        results = [(index, chunk, result) for index, (chunk, result) in enumerate(zip(chunks, chunk_results), start=1)]
+        reviewed = [item for item in results if not isinstance(item[2], BaseException)]
+        failed = [item for item in results if isinstance(item[2], BaseException)]
+        if not reviewed:
+            raise failed[0][2]
+        if failed:
+            metrics.incr('review_chunks_failed', len(failed))
+            logger.warn(f"Chunked review: {len(failed)} of {len(chunks)} chunks failed: "
+                        f"{[f'{index}: {error}' for index, _, error in failed]}")
+
+        chunk_reviews = '\n\n'.join(f'### 第 {index} 部分(共 {len(chunks)} 部分)\n{result}'
+                                     for index, _, result in reviewed)
+        # 汇总输入为各分块的 Review 结果，分块较多时同样按 REVIEW_MAX_TOKENS 截断
+        chunk_reviews, _ = Factory.getTokenizer().fit(chunk_reviews, get_review_max_tokens())
+        reduce_prompts = self._load_prompts("code_review_reduce_prompt", os.getenv("REVIEW_STYLE", "professional"))
         messages = [
+            reduce_prompts["system_message"],
+            {
+                "role": "user",
+                "content": reduce_prompts["user_message"]["content"].format(
+                    chunk_reviews=chunk_reviews, chunk_count=len(chunks), commits_text=commits_text
+                ),
+            },
+        ]
+        review_result = self._strip_markdown(self.call_llm(messages))
+        if not re.search(r"总分[:：]\s*(\d+)分?", review_result):
+            # 汇总结果中没有总分时，按分块长度加权平均能解析出评分的分块，都没有评分时不补充总分
+            scored = [(self.parse_review_score(result), len(chunk)) for _, chunk, result in reviewed
+                      if re.search(r"总分[:：]\s*(\d+)分?", result)]
+            if scored:
+                score = round(sum(s * w for s, w in scored) / sum(w for _, w in scored))
+                review_result += f"\n\n总分:{score}分"
+        complete = all(self.is_complete_result(result) for result in [review_result] + [r for _, _, r in reviewed])
+        return review_result, self._failed_chunks_note(failed, len(chunks)), complete
+
+    @staticmethod
+    def _failed_chunks_note(failed: list, chunk_count: int) -> str:
+        """列出 Review 失败的分块及其中的文件，没有失败的分块时为空"""
+        if not failed:
+            return ''
+        lines = [f'> 分块 Review 中有 {len(failed)}/{chunk_count} 个部分调用 LLM 失败，以下变更未被 Review：']
+        for index, chunk, error in failed:
+            paths = ', '.join(f'`{path}`' for path in re.findall(r'^## (.+)$', chunk, re.MULTILINE))
+            lines.append(f'> - 第 {index} 部分({paths})：{error}')
+        return '\n'.join(lines)
+
+    async def _areview_chunks(self, chunks: list, commits_text: str, concurrency: int) -> list:
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def review_chunk(chunk: str) -> str:
+            async with semaphore:
+                return self._strip_markdown(await self.acall_llm(self._review_messages(chunk, commits_text)))
+
+        return await asyncio.gather(*(review_chunk(chunk) for chunk in chunks), return_exceptions=True)
+
+    def _review_messages(self, diffs_text: str, commits_text: str = "") -> List[Dict[str, Any]]:
+        return [
             self.prompts["system_message"],
             {
                 "role": "user",
@@ -96,7 +319,14 @@ class CodeReviewer(BaseReviewer):
                 ),
             },
         ]
-        return self.call_llm(messages)
+
+    def review_code(self, diffs_text: str, commits_text: str = "") -> str:
+        """Review 代码并返回结果"""
+        return self.call_llm(self._review_messages(diffs_text, commits_text))
+
+    async def areview_code(self, diffs_text: str, commits_text: str = "") -> str:
+        """在事件循环中 Review 代码并返回结果"""
+        return await self.acall_llm(self._review_messages(diffs_text, commits_text))
 
     @staticmethod
     def parse_review_score(review_text: str) -> int:
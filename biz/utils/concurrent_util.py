@@ -0,0 +1,41 @@
+import asyncio
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+
+def run_concurrently(*functions: callable) -> list:
+    """
+    并发执行多个无参函数(通常是相互独立的 API 请求)，按传入顺序返回结果。
+    任一函数抛出异常时，该异常会在获取结果时向上抛出。
+    """
+    if len(functions) <= 1:
+        return [function() for function in functions]
+    with ThreadPoolExecutor(max_workers=len(functions), thread_name_prefix='fetch') as executor:
+        futures = [executor.submit(function) for function in functions]
+        return [future.result() for future in futures]
+
+
+_loop = None
+_loop_pid = None
+_loop_lock = threading.Lock()
+
+
+def _get_background_loop() -> asyncio.AbstractEventLoop:
+    """进程内共享的后台事件循环，fork 出的子进程(rq 任务)中首次使用时重新创建"""
+    global _loop, _loop_pid
+    with _loop_lock:
+        if _loop is None or _loop_pid != os.getpid():
+            _loop = asyncio.new_event_loop()
+            _loop_pid = os.getpid()
+            threading.Thread(target=_loop.run_forever, daemon=True, name='async-loop').start()
+        return _loop
+
+
+def run_coroutine(coroutine) -> object:
+    """
+    在进程内共享的后台事件循环中执行协程并等待结果。
+    异步 SDK 客户端及其连接池绑定事件循环，共享同一个事件循环使其在多次 Review 之间复用，
+    不会像每次 asyncio.run 那样为新的事件循环创建客户端而不关闭
+    """
+    return asyncio.run_coroutine_threadsafe(coroutine, _get_background_loop()).result()
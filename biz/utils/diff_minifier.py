@@ -0,0 +1,66 @@
+import os
+
+from biz.utils.code_parser import Hunk, parse_changes
+
+
+class DiffMinifier:
+    """
+    在 token 计数和发送给模型之前压缩 diff：
+    - 输出紧凑的按文件格式(`## 文件路径` + hunk)，代替 str(changes) 的 Python repr(转义换行、引号和字段名)
+    - 去掉只有空白变化的 hunk
+    - 连续的上下文行只保留变更前后各 context_lines 行，中间用 `...` 代替
+    - 只删除代码的 hunk 只保留一行说明
+    """
+
+    def __init__(self, context_lines: int = 3, strip_whitespace: bool = True, drop_deletions: bool = True):
+        self.context_lines = context_lines
+        self.strip_whitespace = strip_whitespace
+        self.drop_deletions = drop_deletions
+
+    def version(self) -> str:
+        return f'minify:{self.context_lines}:{int(self.strip_whitespace)}:{int(self.drop_deletions)}'
+
+    def minify(self, changes: list) -> str:
+        files = []
+        for file_diff in parse_changes(changes):
+            hunks = [self.minify_hunk(hunk) for hunk in file_diff.hunks]
+            hunks = [hunk for hunk in hunks if hunk]
+            if hunks:
+                files.append(f"## {file_diff.new_path}\n" + '\n'.join(hunks))
+        return '\n\n'.join(files)
+
+    def minify_hunk(self, hunk: Hunk) -> str:
+        lines = hunk.lines
+        removed_count = sum(1 for line in lines if line.kind == '-')
+        added_count = sum(1 for line in lines if line.kind == '+')
+        if not removed_count and not added_count:
+            return ''
+        if self.strip_whitespace and hunk.is_whitespace_only():
+            return ''
+        if self.drop_deletions and not added_count:
+            return f'{hunk.header} (删除 {removed_count} 行)'
+
+        changed = [index for index, line in enumerate(lines) if line.kind != ' ']
+        keep = set()
+        for index in changed:
+            keep.update(range(max(index - self.context_lines, 0), min(index + self.context_lines + 1, len(lines))))
+        result = [hunk.header]
+        skipped = False
+        for index, line in enumerate(lines):
+            if index in keep:
+                result.append(line.kind + line.text)
+                skipped = False
+            elif not skipped:
+                # 首尾多余的上下文直接省略，中间的用 ... 标记
+                if changed[0] < index < changed[-1]:
+                    result.append(' ...')
+                skipped = True
+        return '\n'.join(result)
+
+
+def get_diff_minifier() -> DiffMinifier | None:
+    """未开启 DIFF_MINIFY_ENABLED 时返回 None"""
+    if os.getenv('DIFF_MINIFY_ENABLED', '1') != '1':
+        return None
+    return DiffMinifier(context_lines=int(os.getenv('DIFF_CONTEXT_LINES', 3)),
+                        drop_deletions=os.getenv('DIFF_DROP_PURE_DELETIONS', '1') == '1')
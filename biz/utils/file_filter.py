@@ -0,0 +1,100 @@
+import os
+import re
+import threading
+
+from pathspec import PathSpec
+from pathspec.patterns import GitWildMatchPattern
+
+# 默认跳过的依赖锁文件、压缩/打包产物、第三方目录和生成代码
+DEFAULT_SKIP_PATTERNS = [
+    # lockfiles
+    'package-lock.json', 'yarn.lock', 'pnpm-lock.yaml', 'npm-shrinkwrap.json', 'composer.lock', 'Gemfile.lock',
+    'Pipfile.lock', 'poetry.lock', 'Cargo.lock', 'go.sum', 'gradle.lockfile', 'packages.lock.json',
+    # minified / bundled
+    '*.min.js', '*.min.css', '*.bundle.js', '*.chunk.js', '*.map',
+    # vendored
+    'vendor/', 'node_modules/', 'third_party/', 'bower_components/',
+    # build output：只匹配仓库根目录，src/build/、com/x/generated/ 等同名源码包仍参与 Review
+    '/dist/', '/build/', '/target/',
+    # generated
+    '*_pb2.py', '*_pb2_grpc.py', '*.pb.go', '*.pb.h', '*.pb.cc', '*.generated.*', '*.g.dart', '*.freezed.dart',
+    '__generated__/', '/generated/',
+]
+
+# 新增内容开头出现这些标记时视为生成代码
+GENERATED_MARKER = re.compile(r'@generated|Code generated .* DO NOT EDIT|<auto-generated')
+GENERATED_MARKER_LINES = 5
+
+
+def _split(value: str) -> list:
+    return [item.strip() for item in value.split(',') if item.strip()]
+
+
+def _project_env(name: str, project: str = None, default: str = '') -> str:
+    """读取配置，项目级配置({name}_{PROJECT}，PROJECT 为项目路径转大写、非字母数字替换为下划线)优先"""
+    if project:
+        value = os.getenv(f"{name}_{re.sub(r'[^A-Za-z0-9]', '_', project).upper()}")
+        if value is not None:
+            return value
+    return os.getenv(name, default)
+
+
+class FileFilter:
+    """
+    预编译的文件过滤器：
+    - 后缀命中 extensions 或路径命中 include 规则的文件才参与 Review
+    - 命中 exclude 规则，或开启 skip_generated 时命中锁文件/压缩文件/第三方目录/生成代码规则的文件不参与 Review
+    include/exclude 使用 .gitignore 风格的 glob(例如 src/**/*.py、docs/)
+    """
+
+    def __init__(self, extensions: list, include: list = None, exclude: list = None, skip_generated: bool = True):
+        self.extensions = tuple(extensions)
+        self.include = PathSpec.from_lines(GitWildMatchPattern, include) if include else None
+        self.exclude = PathSpec.from_lines(GitWildMatchPattern,
+                                           list(exclude or []) + (DEFAULT_SKIP_PATTERNS if skip_generated else []))
+        self.skip_generated = skip_generated
+
+    def match(self, path: str) -> bool:
+        if not path:
+            return False
+        if not path.endswith(self.extensions) and not (self.include and self.include.match_file(path)):
+            return False
+        return not self.exclude.match_file(path)
+
+    def is_generated(self, diff: str) -> bool:
+        """根据 diff 新增内容开头的生成代码标记判断"""
+        if not self.skip_generated or not diff:
+            return False
+        added = 0
+        for line in diff.splitlines():
+            if line.startswith('+') and not line.startswith('+++'):
+                if GENERATED_MARKER.search(line):
+                    return True
+                added += 1
+                if added >= GENERATED_MARKER_LINES:
+                    break
+        return False
+
+    def accept(self, change: dict) -> bool:
+        return self.match(change.get('new_path', '')) and not self.is_generated(change.get('diff', ''))
+
+
+_file_filters = {}
+_file_filters_lock = threading.Lock()
+
+
+def get_file_filter(project: str = None) -> FileFilter:
+    """按项目获取进程内缓存的 FileFilter，只在首次使用时读取环境变量并编译规则"""
+    file_filter = _file_filters.get(project)
+    if file_filter is None:
+        with _file_filters_lock:
+            file_filter = _file_filters.get(project)
+            if file_filter is None:
+                file_filter = FileFilter(
+                    extensions=_split(_project_env('SUPPORTED_EXTENSIONS', project, '.java,.py,.php')),
+                    include=_split(_project_env('REVIEW_INCLUDE_GLOBS', project)),
+                    exclude=_split(_project_env('REVIEW_EXCLUDE_GLOBS', project)),
+                    skip_generated=_project_env('REVIEW_SKIP_GENERATED', project, '1') == '1',
+                )
+                _file_filters[project] = file_filter
+    return file_filter
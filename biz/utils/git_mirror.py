@@ -0,0 +1,198 @@
+import base64
+import fcntl
+import os
+import re
+import subprocess
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlparse
+
+from biz.utils.log import logger
+
+
+class GitMirrorError(Exception):
+    pass
+
+
+class GitMirror:
+    """
+    本地 bare mirror 的 diff 数据源，代替 GitLab compare/changes 接口：
+    - 每个仓库在 base_dir 下维护一个 bare 仓库，每次只 fetch 本次需要的 ref
+    - 用 git diff 计算变更，多个文件的 diff 在子进程池中并发执行
+    - 返回与 GitLab API 相同结构的 change 字典(old_path, new_path, diff, new_file, renamed_file, deleted_file)
+    """
+
+    def __init__(self, base_dir: str, max_workers: int = 4, timeout: float = 120):
+        self.base_dir = base_dir
+        self.max_workers = max_workers
+        self.timeout = timeout
+        self._lock = threading.Lock()
+        self._repo_locks = {}
+
+    def mirror_path(self, remote_url: str) -> str:
+        parsed = urlparse(remote_url)
+        name = re.sub(r'[^a-zA-Z0-9]', '_', f'{parsed.netloc}{parsed.path}').strip('_')
+        return os.path.join(self.base_dir, f'{name}.git')
+
+    def _git(self, *args, cwd: str = None, extra_config: dict = None, check: bool = True, stdin: str = None) -> str:
+        env = {**os.environ, 'GIT_TERMINAL_PROMPT': '0'}
+        # 额外的配置通过环境变量传递(git >= 2.31)，不出现在 ps / /proc/*/cmdline 中
+        for index, (key, value) in enumerate((extra_config or {}).items()):
+            env[f'GIT_CONFIG_KEY_{index}'] = key
+            env[f'GIT_CONFIG_VALUE_{index}'] = value
+        if extra_config:
+            env['GIT_CONFIG_COUNT'] = str(len(extra_config))
+        result = subprocess.run(['git', *args], cwd=cwd, capture_output=True, timeout=self.timeout, env=env,
+                                input=stdin.encode() if stdin is not None else None)
+        if check and result.returncode != 0:
+            raise GitMirrorError(f"git {args[0]} failed: {result.stderr.decode('utf-8', 'replace').strip()}")
+        return result.stdout.decode('utf-8', 'replace') if result.returncode == 0 else ''
+
+    @staticmethod
+    def _auth_config(remote_url: str, token: str) -> dict:
+        # token 只通过环境变量传给本次 fetch，不写入 mirror 的配置文件，也不出现在命令行参数中
+        if not token or urlparse(remote_url).scheme not in ('http', 'https'):
+            return {}
+        credential = base64.b64encode(f'oauth2:{token}'.encode()).decode()
+        return {'http.extraHeader': f'Authorization: Basic {credential}'}
+
+    def _prune_review_refs(self, path: str, keep: list):
+        """
+        删除之前 fetch 的 MR/PR ref(refs/merge-requests/*、refs/pull/*)，避免 mirror 随 MR 数量无限增长。
+        正在进行的 diff 使用 commit id，不依赖这些 ref；不再被引用的对象由 git gc --auto 按 gc.pruneExpire 回收
+        """
+        refs = self._git('for-each-ref', '--format=%(refname)', 'refs/merge-requests/', 'refs/pull/', cwd=path)
+        stale = [ref for ref in refs.split() if ref not in keep]
+        if stale:
+            self._git('update-ref', '--stdin', cwd=path, stdin=''.join(f'delete {ref}\n' for ref in stale))
+            self._git('gc', '--auto', '--quiet', cwd=path, check=False)
+
+    def _repo_lock(self, path: str) -> threading.Lock:
+        with self._lock:
+            return self._repo_locks.setdefault(path, threading.Lock())
+
+    def fetch(self, remote_url: str, refs: list, token: str = None) -> str:
+        """
+        确保 mirror 存在并 fetch 指定的 ref(分支名、完整 ref 或 commit id)
+        :return: mirror 的路径
+        """
+        path = self.mirror_path(remote_url)
+        os.makedirs(self.base_dir, exist_ok=True)
+        # 线程锁 + 文件锁，避免多个 worker 线程/进程同时操作同一个 mirror
+        with self._repo_lock(path), open(f'{path}.lock', 'w') as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            if not os.path.isdir(path):
+                self._git('init', '--bare', '--quiet', path)
+            refspecs = []
+            for ref in refs:
+                if re.fullmatch(r'[0-9a-f]{40}', ref):
+                    refspecs.append(ref)
+                else:
+                    ref = ref if ref.startswith('refs/') else f'refs/heads/{ref}'
+                    refspecs.append(f'+{ref}:{ref}')
+            self._prune_review_refs(path, refs)
+            self._git('fetch', '--quiet', '--no-tags', remote_url, *refspecs, cwd=path,
+                      extra_config=self._auth_config(remote_url, token))
+        return path
+
+    def has_commit(self, path: str, commit_id: str) -> bool:
+        return bool(self._git('rev-parse', '--verify', '--quiet', f'{commit_id}^{{commit}}', cwd=path, check=False))
+
+    def merge_base(self, path: str, commit_a: str, commit_b: str) -> str:
+        return self._git('merge-base', commit_a, commit_b, cwd=path).strip()
+
+    def diff(self, path: str, base: str, head: str) -> list:
+        """计算 base..head 的变更，返回 GitLab 格式的 change 列表"""
+        output = self._git('diff', '--name-status', '-z', '-M', '--no-ext-diff', base, head, cwd=path)
+        fields = output.split('\0')
+        entries = []
+        i = 0
+        while i < len(fields) and fields[i]:
+            status = fields[i]
+            if status[0] in ('R', 'C'):
+                old_path, new_path = fields[i + 1], fields[i + 2]
+                i += 3
+            else:
+                old_path = new_path = fields[i + 1]
+                i += 2
+            entries.append((status[0], old_path, new_path))
+
+        def file_diff(entry):
+            status, old_path, new_path = entry
+            paths = [old_path, new_path] if old_path != new_path else [new_path]
+            patch = self._git('--literal-pathspecs', 'diff', '--no-color', '--no-ext-diff', '-M', base, head, '--',
+                              *paths, cwd=path)
+            return {
+                'old_path': old_path,
+                'new_path': new_path,
+                'diff': self._strip_header(patch),
+                'new_file': status == 'A',
+                'renamed_file': status == 'R',
+                'deleted_file': status == 'D',
+            }
+
+        if len(entries) <= 1:
+            return [file_diff(entry) for entry in entries]
+        with ThreadPoolExecutor(max_workers=min(self.max_workers, len(entries)),
+                                thread_name_prefix='git-diff') as executor:
+            return list(executor.map(file_diff, entries))
+
+    @staticmethod
+    def _strip_header(patch: str) -> str:
+        """去掉 diff --git/index/---/+++ 等文件头，与 GitLab API 返回的 diff 字段保持一致"""
+        lines = patch.splitlines(keepends=True)
+        for index, line in enumerate(lines):
+            if line.startswith('@@') or line.startswith('Binary files'):
+                return ''.join(lines[index:])
+        return ''
+
+
+def _enabled_for(project_path: str) -> bool:
+    if os.getenv('GIT_MIRROR_ENABLED', '0') != '1':
+        return False
+    projects = [project.strip() for project in os.getenv('GIT_MIRROR_PROJECTS', '').split(',') if project.strip()]
+    return not projects or project_path in projects
+
+
+_git_mirror = None
+_git_mirror_lock = threading.Lock()
+
+
+def get_git_mirror(project_path: str) -> GitMirror | None:
+    """未开启 GIT_MIRROR_ENABLED，或项目不在 GIT_MIRROR_PROJECTS 中时返回 None"""
+    global _git_mirror
+    if not _enabled_for(project_path):
+        return None
+    if _git_mirror is None:
+        with _git_mirror_lock:
+            if _git_mirror is None:
+                _git_mirror = GitMirror(base_dir=os.getenv('GIT_MIRROR_DIR', 'data/git_mirrors'),
+                                        max_workers=int(os.getenv('GIT_MIRROR_WORKERS', 4)),
+                                        timeout=float(os.getenv('GIT_MIRROR_TIMEOUT', 120)))
+    return _git_mirror
+
+
+def get_mirror_changes(project_path: str, remote_url: str, token: str, refs: list, base: str, head: str,
+                       use_merge_base: bool = False) -> list | None:
+    """
+    通过本地 mirror 获取 base..head 的变更
+    :param use_merge_base: 为 True 时以 base 与 head 的 merge-base 为起点(与 MR 的 diff 一致)
+    :return: change 列表；未开启或失败时返回 None，由调用方回退到 API
+    """
+    git_mirror = get_git_mirror(project_path)
+    if git_mirror is None or not remote_url:
+        return None
+    try:
+        path = git_mirror.fetch(remote_url, refs, token)
+        missing = [commit for commit in (base, head) if not git_mirror.has_commit(path, commit)]
+        if missing and all(re.fullmatch(r'[0-9a-f]{40}', commit) for commit in missing):
+            # 分支被 force push 后旧的提交不在任何 ref 上，尝试按 commit id 单独 fetch
+            path = git_mirror.fetch(remote_url, missing, token)
+        if use_merge_base:
+            base = git_mirror.merge_base(path, base, head)
+        changes = git_mirror.diff(path, base, head)
+        logger.info(f"Got {len(changes)} changes from git mirror {path} ({base[:8]}..{head[:8]}).")
+        return changes
+    except (GitMirrorError, subprocess.TimeoutExpired, OSError) as e:
+        logger.warn(f"Failed to get changes from git mirror for {project_path}, fallback to API: {e}")
+        return None
@@ -0,0 +1,149 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+
+import requests
+from requests.structures import CaseInsensitiveDict
+
+from biz.utils.log import logger
+
+
+class HttpCache:
+    """
+    GET 请求的本地条件请求缓存(sqlite)：
+    - 保存响应的 ETag/Last-Modified，再次请求时携带 If-None-Match/If-Modified-Since
+    - 服务端返回 304 时直接使用本地缓存的响应体(GitHub 的 304 响应不计入限流额度)
+    - 缓存总大小超过 max_bytes 时，按最近访问时间淘汰
+    """
+
+    def __init__(self, db_file: str, max_bytes: int):
+        self.db_file = db_file
+        self.max_bytes = max_bytes
+        self._init_lock = threading.Lock()
+        self._initialized = False
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.db_file, timeout=10)
+        if not self._initialized:
+            with self._init_lock:
+                if not self._initialized:
+                    conn.execute('''
+                        CREATE TABLE IF NOT EXISTS http_cache (
+                            cache_key TEXT PRIMARY KEY,
+                            url TEXT,
+                            etag TEXT,
+                            last_modified TEXT,
+                            headers TEXT,
+                            body BLOB,
+                            size INTEGER,
+                            accessed_at REAL
+                        )
+                    ''')
+                    conn.execute("CREATE INDEX IF NOT EXISTS idx_http_cache_accessed_at ON http_cache (accessed_at)")
+                    conn.commit()
+                    self._initialized = True
+        return conn
+
+    @staticmethod
+    def make_key(url: str, params: dict = None, headers: dict = None) -> str:
+        """缓存键包含 URL、查询参数以及认证信息的摘要，不同 token 的响应互不共享"""
+        headers = headers or {}
+        auth = headers.get('Private-Token') or headers.get('Authorization') or ''
+        raw = json.dumps([url, sorted((params or {}).items()), headers.get('Accept', ''),
+                          hashlib.sha256(auth.encode()).hexdigest()], default=str)
+        return hashlib.sha256(raw.encode()).hexdigest()
+
+    def get(self, cache_key: str) -> dict | None:
+        try:
+            with self._connect() as conn:
+                row = conn.execute(
+                    "SELECT url, etag, last_modified, headers, body FROM http_cache WHERE cache_key = ?",
+                    (cache_key,)).fetchone()
+        except sqlite3.DatabaseError as e:
+            logger.warn(f"Failed to read http cache: {e}")
+            return None
+        if not row:
+            return None
+        return {'url': row[0], 'etag': row[1], 'last_modified': row[2], 'headers': json.loads(row[3]),
+                'body': row[4]}
+
+    def touch(self, cache_key: str):
+        try:
+            with self._connect() as conn:
+                conn.execute("UPDATE http_cache SET accessed_at = ? WHERE cache_key = ?", (time.time(), cache_key))
+        except sqlite3.DatabaseError as e:
+            logger.warn(f"Failed to update http cache: {e}")
+
+    def put(self, cache_key: str, response):
+        etag = response.headers.get('ETag')
+        last_modified = response.headers.get('Last-Modified')
+        if not etag and not last_modified:
+            return
+        body = response.content
+        # 单个响应超过缓存总大小的十分之一时不缓存，避免频繁淘汰
+        if len(body) > self.max_bytes / 10:
+            return
+        try:
+            with self._connect() as conn:
+                conn.execute('''
+                    INSERT OR REPLACE INTO http_cache (cache_key, url, etag, last_modified, headers, body, size, accessed_at)
+                    VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+                ''', (cache_key, str(response.url), etag, last_modified, json.dumps(dict(response.headers)), body,
+                      len(body), time.time()))
+                self._evict(conn)
+        except sqlite3.DatabaseError as e:
+            logger.warn(f"Failed to write http cache: {e}")
+
+    def _evict(self, conn: sqlite3.Connection):
+        total_size = conn.execute("SELECT COALESCE(SUM(size), 0) FROM http_cache").fetchone()[0]
+        if total_size <= self.max_bytes:
+            return
+        rows = conn.execute("SELECT cache_key, size FROM http_cache ORDER BY accessed_at").fetchall()
+        evicted = []
+        for cache_key, size in rows:
+            if total_size <= self.max_bytes:
+                break
+            evicted.append((cache_key,))
+            total_size -= size
+        conn.executemany("DELETE FROM http_cache WHERE cache_key = ?", evicted)
+        logger.debug(f"Evicted {len(evicted)} entries from http cache.")
+
+    @staticmethod
+    def conditional_headers(entry: dict) -> dict:
+        headers = {}
+        if entry.get('etag'):
+            headers['If-None-Match'] = entry['etag']
+        if entry.get('last_modified'):
+            headers['If-Modified-Since'] = entry['last_modified']
+        return headers
+
+    @staticmethod
+    def to_response(entry: dict) -> requests.Response:
+        """将缓存的内容还原为 200 响应"""
+        response = requests.Response()
+        response.status_code = 200
+        response._content = entry['body']
+        response.headers = CaseInsensitiveDict(entry['headers'])
+        response.url = entry['url']
+        response.encoding = 'utf-8'
+        return response
+
+
+_http_cache = None
+_http_cache_lock = threading.Lock()
+
+
+def get_http_cache() -> HttpCache | None:
+    """未开启 HTTP_CACHE_ENABLED 时返回 None"""
+    global _http_cache
+    if os.getenv('HTTP_CACHE_ENABLED', '0') != '1':
+        return None
+    if _http_cache is None:
+        with _http_cache_lock:
+            if _http_cache is None:
+                _http_cache = HttpCache(db_file=os.getenv('HTTP_CACHE_DB_FILE', 'data/http_cache.db'),
+                                        max_bytes=int(os.getenv('HTTP_CACHE_MAX_BYTES', 200 * 1024 * 1024)))
+    return _http_cache
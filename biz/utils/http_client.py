@@ -0,0 +1,193 @@
+import os
+import threading
+from urllib.parse import urlparse
+
+import requests
+from requests.adapters import HTTPAdapter
+from requests.structures import CaseInsensitiveDict
+
+from biz.utils.http_cache import HttpCache, get_http_cache
+from biz.utils.log import logger
+from biz.utils.metrics import metrics
+from biz.utils.rate_limiter import RateLimiter, RateLimitExceeded, get_rate_limiter
+
+
+class HttpClient:
+    """
+    单个 host 的 HTTP 客户端，进程内共享，通过 keep-alive 连接池复用 TCP/TLS 连接。
+    默认基于 requests.Session；开启 HTTP_CLIENT_HTTP2 且安装了 h2 时使用 httpx 的 HTTP/2 客户端。
+    两种实现都返回 requests.Response 并默认跟随重定向，调用方无需区分
+    """
+
+    def __init__(self, host: str, pool_size: int = 10, timeout: float = 30, http2: bool = False, verify: bool = True):
+        self.host = host
+        self.pool_size = pool_size
+        self.timeout = timeout
+        self.verify = verify
+        self.http2 = http2 and self._http2_available()
+        self._lock = threading.Lock()
+        self._requests = 0
+        self._connections = 0
+        if self.http2:
+            import httpx
+            self._client = httpx.Client(
+                http2=True,
+                verify=verify,
+                timeout=timeout,
+                follow_redirects=True,
+                limits=httpx.Limits(max_connections=pool_size, max_keepalive_connections=pool_size),
+            )
+        else:
+            self._client = requests.Session()
+            adapter = HTTPAdapter(pool_connections=2, pool_maxsize=pool_size)
+            self._client.mount('http://', adapter)
+            self._client.mount('https://', adapter)
+            self._adapter = adapter
+
+    @staticmethod
+    def _http2_available() -> bool:
+        try:
+            import h2  # noqa: F401
+            return True
+        except ImportError:
+            logger.warn("HTTP_CLIENT_HTTP2 is enabled but package 'h2' is not installed, fallback to HTTP/1.1.")
+            return False
+
+    def request(self, method: str, url: str, **kwargs):
+        http_cache = get_http_cache()
+        if method.upper() == 'GET' and http_cache is not None:
+            return self._cached_get(http_cache, url, **kwargs)
+        return self._send(method, url, **kwargs)
+
+    def _cached_get(self, http_cache: HttpCache, url: str, **kwargs):
+        cache_key = HttpCache.make_key(url, kwargs.get('params'), kwargs.get('headers'))
+        entry = http_cache.get(cache_key)
+        if entry:
+            kwargs['headers'] = {**(kwargs.get('headers') or {}), **HttpCache.conditional_headers(entry)}
+        response = self._send('GET', url, **kwargs)
+        if response.status_code == 304 and entry:
+            metrics.incr('http_cache_hits')
+            http_cache.touch(cache_key)
+            return HttpCache.to_response(entry)
+        metrics.incr('http_cache_misses')
+        if response.status_code == 200:
+            http_cache.put(cache_key, response)
+        return response
+
+    def _send(self, method: str, url: str, **kwargs):
+        kwargs.setdefault('timeout', self.timeout)
+        rate_limiter = get_rate_limiter()
+        rate_limit_key = RateLimiter.make_key(self.host, kwargs.get('headers'))
+        rate_limiter.before_request(rate_limit_key)
+        with self._lock:
+            self._requests += 1
+        metrics.incr('http_requests_total')
+        if self.http2:
+            # httpx 在客户端级别设置 verify，按请求传入的 verify 在 get_http_client 中已用于区分客户端
+            kwargs.pop('verify', None)
+            if 'allow_redirects' in kwargs:
+                kwargs['follow_redirects'] = kwargs.pop('allow_redirects')
+            kwargs.setdefault('extensions', {})['trace'] = self._trace
+            response = self._to_requests_response(self._client.request(method, url, **kwargs))
+        else:
+            kwargs.setdefault('verify', self.verify)
+            response = self._client.request(method, url, **kwargs)
+        try:
+            rate_limiter.after_response(rate_limit_key, response)
+        except RateLimitExceeded:
+            metrics.incr('http_rate_limited_total')
+            raise
+        return response
+
+    @staticmethod
+    def _to_requests_response(response) -> requests.Response:
+        """将 httpx.Response 转换为 requests.Response(.ok、.raise_for_status() 等与 requests 后端一致)"""
+        result = requests.Response()
+        result.status_code = response.status_code
+        result._content = response.content
+        result.headers = CaseInsensitiveDict(response.headers)
+        result.url = str(response.url)
+        result.reason = response.reason_phrase
+        result.encoding = response.encoding
+        result.elapsed = response.elapsed
+        return result
+
+    def get(self, url: str, **kwargs):
+        return self.request('GET', url, **kwargs)
+
+    def post(self, url: str, **kwargs):
+        return self.request('POST', url, **kwargs)
+
+    def _trace(self, event_name: str, info: dict):
+        if event_name == 'connection.connect_tcp.complete':
+            with self._lock:
+                self._connections += 1
+
+    def stats(self) -> dict:
+        with self._lock:
+            requests_count, connections = self._requests, self._connections
+        if not self.http2:
+            pools = self._adapter.poolmanager.pools
+            for key in pools.keys():
+                pool = pools.get(key)
+                if pool is not None:
+                    connections += pool.num_connections
+        return {
+            'http2': self.http2,
+            'requests': requests_count,
+            'connections_opened': connections,
+            'connections_reused': max(requests_count - connections, 0),
+        }
+
+    def close(self):
+        self._client.close()
+
+
+_clients = {}
+_clients_lock = threading.Lock()
+
+
+def get_http_client(url: str, verify: bool = True) -> HttpClient:
+    """按 scheme + host 获取进程内共享的 HttpClient"""
+    parsed = urlparse(url)
+    key = (parsed.scheme, parsed.netloc, verify)
+    client = _clients.get(key)
+    if client is None:
+        with _clients_lock:
+            client = _clients.get(key)
+            if client is None:
+                client = HttpClient(
+                    host=f'{parsed.scheme}://{parsed.netloc}',
+                    pool_size=int(os.getenv('HTTP_POOL_SIZE', 10)),
+                    timeout=float(os.getenv('HTTP_TIMEOUT', 30)),
+                    http2=os.getenv('HTTP_CLIENT_HTTP2', '0') == '1',
+                    verify=verify,
+                )
+                _clients[key] = client
+    return client
+
+
+def request(method: str, url: str, **kwargs):
+    """与 requests.request 用法一致，但复用同一 host 的连接池"""
+    return get_http_client(url, verify=kwargs.get('verify', True)).request(method, url, **kwargs)
+
+
+def get(url: str, **kwargs):
+    return request('GET', url, **kwargs)
+
+
+def post(url: str, **kwargs):
+    return request('POST', url, **kwargs)
+
+
+def stats() -> dict:
+    with _clients_lock:
+        clients = list(_clients.values())
+    result = {}
+    for client in clients:
+        key = client.host if client.verify else f'{client.host} (verify=False)'
+        result[key] = client.stats()
+    return result
+
+
+metrics.register_collector('http_clients', stats)
@@ -0,0 +1,36 @@
+import threading
+
+
+class Metrics:
+    """
+    进程内的简单指标收集器：
+    - incr: 累加计数器
+    - register_collector: 注册回调，在 snapshot 时实时采集(如连接池、线程池状态)
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters = {}
+        self._collectors = {}
+
+    def incr(self, name: str, value: int = 1):
+        with self._lock:
+            self._counters[name] = self._counters.get(name, 0) + value
+
+    def register_collector(self, name: str, collector: callable):
+        with self._lock:
+            self._collectors[name] = collector
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            result = {'counters': dict(self._counters)}
+            collectors = dict(self._collectors)
+        for name, collector in collectors.items():
+            try:
+                result[name] = collector()
+            except Exception as e:
+                result[name] = {'error': str(e)}
+        return result
+
+
+metrics = Metrics()
@@ -1,10 +1,14 @@
 import os
-from multiprocessing import Process
+import threading
+from concurrent.futures import ThreadPoolExecutor, Future
+from datetime import timedelta
 
 from redis import Redis
 from rq import Queue
 
+from biz.utils.coalescer import review_coalescer
 from biz.utils.log import logger
+from biz.utils.metrics import metrics
 
 queue_driver = os.getenv('QUEUE_DRIVER', 'async')
 
@@ -12,14 +16,159 @@ if queue_driver == 'rq':
     queues = {}
 
 
-def handle_queue(function: callable, data: any, token: str, url: str, url_slug: str):
-    if queue_driver == 'rq':
-        if url_slug not in queues:
-            logger.info(f'REDIS_HOST: {os.getenv("REDIS_HOST", "127.0.0.1")}，REDIS_PORT: {os.getenv("REDIS_PORT", 6379)}')
-            queues[url_slug] = Queue(url_slug, connection=Redis(os.getenv('REDIS_HOST', '127.0.0.1'),
-                                                                              os.getenv('REDIS_PORT', 6379)))
+# webhook 数据中记录任务已推迟次数的键
+DEFERRALS_KEY = '_deferrals'
+
+
+class QueueFullError(Exception):
+    """async 队列已满，无法再接收新的任务"""
+
+
+class AsyncWorkerPool:
+    """
+    async 驱动使用的进程内线程池：
+    - 固定数量的常驻 worker 线程，复用已加载的模块(pandas、tiktoken、LLM SDK 等)，避免每个 webhook 都 fork 新进程
+    - 等待执行的任务数有上限，超出时抛出 QueueFullError，保证突发流量下内存可控
+    """
+
+    def __init__(self, max_workers: int, max_pending: int):
+        self.max_workers = max_workers
+        self.max_pending = max_pending
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='review-worker')
+        # 正在执行 + 等待执行的任务总数上限
+        self._slots = threading.BoundedSemaphore(max_workers + max_pending)
+        self._lock = threading.Lock()
+        self._submitted = 0
+        self._running = 0
+
+    def submit(self, function: callable, *args) -> Future:
+        if not self._slots.acquire(blocking=False):
+            raise QueueFullError(
+                f'async queue is full (workers={self.max_workers}, max_pending={self.max_pending})')
+        with self._lock:
+            self._submitted += 1
+        try:
+            future = self._executor.submit(self._run, function, *args)
+        except Exception:
+            self._release()
+            raise
+        # 被取消的任务不会进入 _run，需要在回调中释放名额
+        future.add_done_callback(lambda f: f.cancelled() and self._release())
+        return future
+
+    def _run(self, function: callable, *args):
+        with self._lock:
+            self._running += 1
+        try:
+            return function(*args)
+        except Exception as e:
+            logger.error(f'Async job {getattr(function, "__name__", function)} failed: {e}')
+        finally:
+            with self._lock:
+                self._running -= 1
+            self._release()
+
+    def _release(self):
+        with self._lock:
+            self._submitted -= 1
+        self._slots.release()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                'workers': self.max_workers,
+                'max_pending': self.max_pending,
+                'running': self._running,
+                'pending': self._submitted - self._running,
+            }
+
+    def shutdown(self, wait: bool = True):
+        self._executor.shutdown(wait=wait)
+
+
+_worker_pool = None
+_worker_pool_lock = threading.Lock()
+
+
+def get_worker_pool() -> AsyncWorkerPool:
+    """获取进程内共享的 async 线程池(首次调用时创建)"""
+    global _worker_pool
+    if _worker_pool is None:
+        with _worker_pool_lock:
+            if _worker_pool is None:
+                max_workers = int(os.getenv('ASYNC_WORKER_POOL_SIZE', 4))
+                max_pending = int(os.getenv('ASYNC_MAX_PENDING_JOBS', 100))
+                logger.info(f'Async worker pool started, workers: {max_workers}, max pending jobs: {max_pending}')
+                _worker_pool = AsyncWorkerPool(max_workers, max_pending)
+                metrics.register_collector('async_worker_pool', _worker_pool.stats)
+    return _worker_pool
 
-        queues[url_slug].enqueue(function, data, token, url, url_slug)
+
+_redis = None
+
+
+def get_redis() -> Redis:
+    """获取进程内共享的 Redis 连接"""
+    global _redis
+    if _redis is None:
+        logger.info(f'REDIS_HOST: {os.getenv("REDIS_HOST", "127.0.0.1")}，REDIS_PORT: {os.getenv("REDIS_PORT", 6379)}')
+        _redis = Redis(os.getenv('REDIS_HOST', '127.0.0.1'), os.getenv('REDIS_PORT', 6379))
+    return _redis
+
+
+def get_rq_queue(url_slug: str) -> Queue:
+    if url_slug not in queues:
+        queues[url_slug] = Queue(url_slug, connection=get_redis())
+    return queues[url_slug]
+
+
+def handle_queue(function: callable, data: any, token: str, url: str, url_slug: str, coalesce_key: str = None,
+                 revision: str = None):
+    """
+    将任务放入队列
+    :param coalesce_key: 合并键(见 make_coalesce_key)，传入时同一个键仍在排队的旧任务会被取消(head SHA 未变化时除外)
+    :param revision: 本次任务对应的 head SHA，用于在执行过程中判断任务是否已被新的推送取代
+    """
+    if coalesce_key:
+        review_coalescer.supersede(coalesce_key, revision)
+
+    if queue_driver == 'rq':
+        job = get_rq_queue(url_slug).enqueue(function, data, token, url, url_slug)
     else:
-        process = Process(target=function, args=(data, token, url, url_slug))
-        process.start()
+        job = get_worker_pool().submit(function, data, token, url, url_slug)
+
+    if coalesce_key:
+        review_coalescer.track(coalesce_key, revision, job)
+    return job
+
+
+def defer_queue(function: callable, data: any, token: str, url: str, url_slug: str, delay: float):
+    """
+    将任务推迟 delay 秒后重新放入队列(如 GitLab/GitHub 限流额度用完、等待 LLM 并发名额超时时)。
+    推迟的任务不重新登记合并键，任务执行时会自行判断 head SHA 是否已过期。
+    推迟次数记录在 data 的 DEFERRALS_KEY 中，同一个任务最多推迟 QUEUE_MAX_DEFERRALS 次，超出后放弃
+    :return: 放弃时返回 None
+    """
+    deferrals = data.get(DEFERRALS_KEY, 0) if isinstance(data, dict) else 0
+    max_deferrals = int(os.getenv('QUEUE_MAX_DEFERRALS', 5))
+    if deferrals >= max_deferrals:
+        metrics.incr('queue_jobs_dropped')
+        logger.error(f'Job {function.__name__} has been deferred {deferrals} times, dropped.')
+        return None
+    if isinstance(data, dict):
+        data = {**data, DEFERRALS_KEY: deferrals + 1}
+    logger.info(f'Job {function.__name__} deferred for {int(delay)} seconds ({deferrals + 1}/{max_deferrals}).')
+    if queue_driver == 'rq':
+        # 需要 rq worker 以 --with-scheduler 方式启动
+        return get_rq_queue(url_slug).enqueue_in(timedelta(seconds=delay), function, data, token, url, url_slug)
+
+    def resubmit():
+        try:
+            get_worker_pool().submit(function, data, token, url, url_slug)
+        except QueueFullError as e:
+            logger.error(f'Failed to resubmit deferred job {function.__name__}: {e}')
+
+    timer = threading.Timer(delay, resubmit)
+    timer.daemon = True
+    timer.start()
+    return timer
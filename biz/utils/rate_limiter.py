@@ -0,0 +1,254 @@
+import hashlib
+import os
+import threading
+import time
+from email.utils import parsedate_to_datetime
+
+from biz.utils.log import logger
+
+
+class RateLimitExceeded(Exception):
+    """API 限流额度已用完，retry_after 秒后才能继续请求"""
+
+    def __init__(self, message: str, retry_after: float):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class TokenBucket:
+    """令牌桶：以 rate 个/秒的速度补充令牌，最多累积 capacity 个，每次请求消耗一个令牌"""
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = capacity
+        self._updated_at = time.monotonic()
+        self._lock = threading.Lock()
+
+    def try_acquire(self) -> float:
+        """获取一个令牌，成功时返回 0，否则返回需要等待的秒数"""
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.capacity, self._tokens + (now - self._updated_at) * self.rate)
+            self._updated_at = now
+            if self._tokens >= 1:
+                self._tokens -= 1
+                return 0
+            return (1 - self._tokens) / self.rate
+
+    def acquire(self):
+        while wait := self.try_acquire():
+            time.sleep(wait)
+
+
+def quota_rate(base_rate: float, remaining: int | None, reset_at: float | None, now: float) -> float:
+    """剩余额度不足以按基础速率支撑到重置时间时降低速率，重置时间过后恢复基础速率"""
+    if remaining is None or not reset_at or reset_at <= now:
+        return base_rate
+    return max(min(base_rate, remaining / max(reset_at - now, 1)), 0.01)
+
+
+class MemoryQuotaState:
+    """async 驱动使用的进程内实现：每个 host + token 一个令牌桶及剩余额度、重置时间"""
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self._buckets = {}
+        self._quotas = {}
+        self._lock = threading.Lock()
+
+    def try_acquire(self, key: str) -> float:
+        """获取一个令牌，成功时返回 0，否则返回需要等待的秒数"""
+        with self._lock:
+            bucket = self._buckets.get(key)
+            if bucket is None:
+                bucket = self._buckets[key] = TokenBucket(self.rate, self.capacity)
+            remaining, reset_at = self._quotas.get(key, (None, None))
+        bucket.rate = quota_rate(self.rate, remaining, reset_at, time.time())
+        return bucket.try_acquire()
+
+    def quota(self, key: str) -> tuple[int | None, float | None]:
+        """:return: (剩余额度, 重置时间)，未知时为 None"""
+        with self._lock:
+            return self._quotas.get(key, (None, None))
+
+    def update(self, key: str, remaining: int | None, reset_at: float | None):
+        """记录响应头中的剩余额度和重置时间，为 None 的值保持不变"""
+        with self._lock:
+            previous = self._quotas.get(key, (None, None))
+            self._quotas[key] = (previous[0] if remaining is None else remaining,
+                                 previous[1] if reset_at is None else reset_at)
+
+    def clear_remaining(self, key: str):
+        with self._lock:
+            self._quotas[key] = (None, self._quotas.get(key, (None, None))[1])
+
+
+class RedisQuotaState:
+    """
+    rq 驱动使用的 Redis 实现。每个任务都在 fork 出的子进程中执行，进程内的状态随任务结束丢失，
+    令牌桶、剩余额度和重置时间保存在 Redis 中，所有 worker 共享同一个 host + token 的额度
+    """
+    KEY_PREFIX = 'ai_codereview:rate_limit:'
+    KEY_TTL = 24 * 3600
+    # 补充令牌与消耗令牌原子执行，速率按剩余额度和重置时间计算(与 quota_rate 一致)
+    ACQUIRE_SCRIPT = """
+local now, base_rate, capacity = tonumber(ARGV[1]), tonumber(ARGV[2]), tonumber(ARGV[3])
+local state = redis.call('HMGET', KEYS[1], 'tokens', 'updated_at', 'remaining', 'reset_at')
+local tokens = tonumber(state[1]) or capacity
+local updated_at = tonumber(state[2]) or now
+local remaining, reset_at = tonumber(state[3]), tonumber(state[4])
+local rate = base_rate
+if remaining and reset_at and reset_at > now then
+    rate = math.max(math.min(base_rate, remaining / math.max(reset_at - now, 1)), 0.01)
+end
+tokens = math.min(capacity, tokens + math.max(now - updated_at, 0) * rate)
+local wait = 0
+if tokens >= 1 then
+    tokens = tokens - 1
+else
+    wait = (1 - tokens) / rate
+end
+redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'updated_at', tostring(now))
+redis.call('EXPIRE', KEYS[1], ARGV[4])
+return tostring(wait)
+"""
+
+    def __init__(self, rate: float, capacity: float, connection=None):
+        if connection is None:
+            from biz.utils.queue import get_redis
+            connection = get_redis()
+        self.rate = rate
+        self.capacity = capacity
+        self.connection = connection
+        self._acquire_script = connection.register_script(self.ACQUIRE_SCRIPT)
+
+    def _key(self, key: str) -> str:
+        return f'{self.KEY_PREFIX}{key}'
+
+    def try_acquire(self, key: str) -> float:
+        return float(self._acquire_script(keys=[self._key(key)],
+                                          args=[time.time(), self.rate, self.capacity, self.KEY_TTL]))
+
+    def quota(self, key: str) -> tuple[int | None, float | None]:
+        remaining, reset_at = self.connection.hmget(self._key(key), 'remaining', 'reset_at')
+        return (int(remaining) if remaining is not None else None,
+                float(reset_at) if reset_at is not None else None)
+
+    def update(self, key: str, remaining: int | None, reset_at: float | None):
+        mapping = {}
+        if remaining is not None:
+            mapping['remaining'] = remaining
+        if reset_at is not None:
+            mapping['reset_at'] = reset_at
+        if mapping:
+            pipe = self.connection.pipeline()
+            pipe.hset(self._key(key), mapping=mapping)
+            pipe.expire(self._key(key), self.KEY_TTL)
+            pipe.execute()
+
+    def clear_remaining(self, key: str):
+        self.connection.hdel(self._key(key), 'remaining')
+
+
+class RateLimiter:
+    """
+    按 host + token 跟踪 GitLab/GitHub 的剩余请求额度：
+    - 请求前通过令牌桶控制请求速率，剩余额度较少时按 remaining / 距重置时间 自动降速，重置后恢复基础速率
+    - 额度用完时，等待时间不超过 max_wait 则直接等待，否则抛出 RateLimitExceeded，由调用方推迟任务
+    - 额度状态保存在 state 中：async 驱动为 MemoryQuotaState，rq 驱动为所有 worker 共享的 RedisQuotaState
+    """
+
+    def __init__(self, rate: float, capacity: float, max_wait: float, state=None):
+        self.rate = rate
+        self.capacity = capacity
+        self.max_wait = max_wait
+        self.state = state if state is not None else MemoryQuotaState(rate, capacity)
+
+    @staticmethod
+    def make_key(host: str, headers: dict = None) -> str:
+        headers = headers or {}
+        auth = headers.get('Private-Token') or headers.get('Authorization') or ''
+        return f"{host}:{hashlib.sha256(auth.encode()).hexdigest()[:16]}"
+
+    def before_request(self, key: str):
+        remaining, reset_at = self.state.quota(key)
+        if remaining is not None and remaining <= 0 and reset_at:
+            wait = reset_at - time.time()
+            if wait > self.max_wait:
+                raise RateLimitExceeded(f"Rate limit of {key.rsplit(':', 1)[0]} exhausted, resets in {int(wait)}s", wait)
+            if wait > 0:
+                logger.info(f"Rate limit exhausted, waiting {wait:.1f} seconds for reset.")
+                time.sleep(wait)
+            self.state.clear_remaining(key)
+        while wait := self.state.try_acquire(key):
+            time.sleep(wait)
+
+    def after_response(self, key: str, response):
+        headers = response.headers
+        remaining = headers.get('X-RateLimit-Remaining') or headers.get('RateLimit-Remaining')
+        reset = headers.get('X-RateLimit-Reset') or headers.get('RateLimit-Reset')
+        remaining = int(remaining) if remaining is not None else None
+        reset_at = float(reset) if reset is not None else None
+        self.state.update(key, remaining, reset_at)
+
+        if self._is_rate_limited(response, remaining):
+            retry_after = self._parse_retry_after(headers.get('Retry-After'))
+            if retry_after is not None:
+                wait = retry_after
+            elif remaining == 0 and reset_at:
+                wait = max(reset_at - time.time(), 1)
+            else:
+                wait = 60
+            self.state.update(key, 0, time.time() + wait)
+            raise RateLimitExceeded(f"Rate limited by {key.rsplit(':', 1)[0]} (HTTP {response.status_code}), "
+                                    f"retry after {int(wait)}s", wait)
+
+    @staticmethod
+    def _is_rate_limited(response, remaining: int | None) -> bool:
+        """
+        429，或 403 且满足以下任一条件：主限流额度用完(remaining 为 0)；
+        携带 Retry-After 或响应提示 secondary rate limit(GitHub 的次级限流，此时 remaining 仍大于 0)
+        """
+        if response.status_code == 429:
+            return True
+        if response.status_code != 403:
+            return False
+        if remaining == 0 or response.headers.get('Retry-After') is not None:
+            return True
+        return 'secondary rate limit' in (response.text or '').lower()
+
+    @staticmethod
+    def _parse_retry_after(value: str | None) -> float | None:
+        """Retry-After 可以是秒数或 HTTP 日期"""
+        if not value:
+            return None
+        try:
+            return max(float(value), 0)
+        except ValueError:
+            pass
+        try:
+            return max(parsedate_to_datetime(value).timestamp() - time.time(), 0)
+        except (TypeError, ValueError):
+            return None
+
+
+_rate_limiter = None
+_rate_limiter_lock = threading.Lock()
+
+
+def get_rate_limiter() -> RateLimiter:
+    global _rate_limiter
+    if _rate_limiter is None:
+        with _rate_limiter_lock:
+            if _rate_limiter is None:
+                rate = float(os.getenv('HTTP_RATE_LIMIT_PER_SECOND', 10))
+                capacity = float(os.getenv('HTTP_RATE_LIMIT_BURST', 20))
+                if os.getenv('QUEUE_DRIVER', 'async') == 'rq':
+                    state = RedisQuotaState(rate, capacity)
+                else:
+                    state = MemoryQuotaState(rate, capacity)
+                _rate_limiter = RateLimiter(rate=rate, capacity=capacity,
+                                            max_wait=float(os.getenv('HTTP_RATE_LIMIT_MAX_WAIT', 10)), state=state)
+    return _rate_limiter
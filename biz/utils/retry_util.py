@@ -0,0 +1,22 @@
+def exponential_backoff(initial_delay: float = 0.5, factor: float = 2, max_delay: float = 8,
+                        max_elapsed: float = 30):
+    """
+    生成指数退避的等待时间(秒)，累计等待时间不超过 max_elapsed，举例：
+    list(exponential_backoff(0.5, 2, 8, 30)) => [0.5, 1.0, 2.0, 4.0, 8.0, 8, 6.5]
+    """
+    delay = initial_delay
+    elapsed = 0
+    while elapsed < max_elapsed:
+        current = min(delay, max_delay, max_elapsed - elapsed)
+        yield current
+        elapsed += current
+        delay *= factor
+
+
+def backoff_attempts(initial_delay: float = 0.5, factor: float = 2, max_delay: float = 8, max_elapsed: float = 30):
+    """
+    按指数退避重试：生成 (第几次尝试, 本次尝试失败后的等待时间)，最后一次尝试的等待时间为 None，调用方不再等待，举例：
+    list(backoff_attempts(1, 2, 8, 5)) => [(1, 1), (2, 2), (3, 2), (4, None)]
+    """
+    delays = list(exponential_backoff(initial_delay, factor, max_delay, max_elapsed))
+    yield from enumerate(delays + [None], start=1)
@@ -0,0 +1,121 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+
+from biz.utils.log import logger
+
+
+def patch_id(changes: list) -> str:
+    """
+    计算一组变更的内容标识(类似 git patch-id)：
+    只取每个文件的路径和增删行，忽略 hunk 头中的行号和行内空白，
+    同一个补丁 push 到不同分支、出现在 MR 中或被 cherry-pick 后得到相同的标识
+    """
+    digest = hashlib.sha256()
+    for change in sorted(changes, key=lambda item: item.get('new_path', '')):
+        digest.update(f"\0file {change.get('new_path', '')}\n".encode())
+        for line in change.get('diff', '').splitlines():
+            if line.startswith(('+++', '---')) or not line.startswith(('+', '-')):
+                continue
+            digest.update(line[0].encode() + ''.join(line[1:].split()).encode() + b'\n')
+    return digest.hexdigest()
+
+
+class ReviewCache:
+    """
+    Review 结果缓存(sqlite)，键为 patch-id + 模型 + 提示词版本：
+    - 相同补丁在不同分支、不同事件中只 Review 一次
+    - 超过 ttl 秒的结果视为过期；条目数超过 max_entries 时按最近访问时间淘汰
+    """
+
+    def __init__(self, db_file: str, max_entries: int, ttl: float):
+        self.db_file = db_file
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._init_lock = threading.Lock()
+        self._initialized = False
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.db_file, timeout=10)
+        if not self._initialized:
+            with self._init_lock:
+                if not self._initialized:
+                    conn.execute('''
+                        CREATE TABLE IF NOT EXISTS review_cache (
+                            cache_key TEXT PRIMARY KEY,
+                            review_result TEXT,
+                            created_at REAL,
+                            accessed_at REAL
+                        )
+                    ''')
+                    conn.execute(
+                        "CREATE INDEX IF NOT EXISTS idx_review_cache_accessed_at ON review_cache (accessed_at)")
+                    conn.commit()
+                    self._initialized = True
+        return conn
+
+    @staticmethod
+    def make_key(changes: list, model: str, prompt_version: str) -> str:
+        raw = json.dumps([patch_id(changes), model, prompt_version])
+        return hashlib.sha256(raw.encode()).hexdigest()
+
+    def get(self, cache_key: str) -> str | None:
+        now = time.time()
+        try:
+            with self._connect() as conn:
+                row = conn.execute("SELECT review_result, created_at FROM review_cache WHERE cache_key = ?",
+                                   (cache_key,)).fetchone()
+                if not row:
+                    return None
+                if now - row[1] > self.ttl:
+                    conn.execute("DELETE FROM review_cache WHERE cache_key = ?", (cache_key,))
+                    return None
+                conn.execute("UPDATE review_cache SET accessed_at = ? WHERE cache_key = ?", (now, cache_key))
+                return row[0]
+        except sqlite3.DatabaseError as e:
+            logger.warn(f"Failed to read review cache: {e}")
+            return None
+
+    def put(self, cache_key: str, review_result: str):
+        now = time.time()
+        try:
+            with self._connect() as conn:
+                conn.execute('''
+                    INSERT OR REPLACE INTO review_cache (cache_key, review_result, created_at, accessed_at)
+                    VALUES (?, ?, ?, ?)
+                ''', (cache_key, review_result, now, now))
+                self._evict(conn, now)
+        except sqlite3.DatabaseError as e:
+            logger.warn(f"Failed to write review cache: {e}")
+
+    def _evict(self, conn: sqlite3.Connection, now: float):
+        conn.execute("DELETE FROM review_cache WHERE created_at < ?", (now - self.ttl,))
+        count = conn.execute("SELECT COUNT(*) FROM review_cache").fetchone()[0]
+        if count > self.max_entries:
+            conn.execute('''
+                DELETE FROM review_cache WHERE cache_key IN (
+                    SELECT cache_key FROM review_cache ORDER BY accessed_at LIMIT ?
+                )
+            ''', (count - self.max_entries,))
+            logger.debug(f"Evicted {count - self.max_entries} entries from review cache.")
+
+
+_review_cache = None
+_review_cache_lock = threading.Lock()
+
+
+def get_review_cache() -> ReviewCache | None:
+    """未开启 REVIEW_CACHE_ENABLED 时返回 None"""
+    global _review_cache
+    if os.getenv('REVIEW_CACHE_ENABLED', '0') != '1':
+        return None
+    if _review_cache is None:
+        with _review_cache_lock:
+            if _review_cache is None:
+                _review_cache = ReviewCache(db_file=os.getenv('REVIEW_CACHE_DB_FILE', 'data/review_cache.db'),
+                                            max_entries=int(os.getenv('REVIEW_CACHE_MAX_ENTRIES', 5000)),
+                                            ttl=float(os.getenv('REVIEW_CACHE_TTL', 7 * 24 * 3600)))
+    return _review_cache
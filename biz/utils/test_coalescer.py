@@ -0,0 +1,121 @@
+from concurrent.futures import Future
+from types import SimpleNamespace
+from unittest import TestCase, main, mock, skipUnless
+
+from biz.utils.coalescer import MemoryCoalescer, RedisCoalescer, ReviewCoalescer, make_coalesce_key
+
+try:
+    import fakeredis
+except ImportError:
+    fakeredis = None
+
+
+class TestReviewCoalescer(TestCase):
+    def setUp(self):
+        self.coalescer = ReviewCoalescer(backend=MemoryCoalescer())
+        self.key = make_coalesce_key('gitlab_example_com', 1, 2)
+
+    def test_make_coalesce_key(self):
+        self.assertEqual(self.key, 'gitlab_example_com:1:2')
+
+    def test_newer_revision_supersedes(self):
+        """新的 head SHA 登记后，旧 SHA 的任务不再是最新"""
+        self.coalescer.supersede(self.key, 'sha1')
+        self.assertTrue(self.coalescer.is_current(self.key, 'sha1'))
+        self.coalescer.supersede(self.key, 'sha2')
+        self.assertFalse(self.coalescer.is_current(self.key, 'sha1'))
+        self.assertTrue(self.coalescer.is_current(self.key, 'sha2'))
+
+    def test_unknown_key_is_current(self):
+        self.assertTrue(self.coalescer.is_current('unknown', 'sha1'))
+        self.assertTrue(self.coalescer.is_current(self.key, None))
+
+    def test_queued_job_cancelled(self):
+        """同一个 MR 仍在排队的旧任务会被取消，已开始执行的任务不受影响"""
+        queued_job, running_job = Future(), Future()
+        running_job.set_running_or_notify_cancel()
+
+        self.coalescer.supersede(self.key, 'sha1')
+        self.coalescer.track(self.key, 'sha1', queued_job)
+        self.coalescer.supersede(self.key, 'sha2')
+        self.assertTrue(queued_job.cancelled())
+
+        self.coalescer.track(self.key, 'sha2', running_job)
+        self.coalescer.supersede(self.key, 'sha3')
+        self.assertFalse(running_job.cancelled())
+
+    def test_metadata_update_keeps_queued_push(self):
+        """推送之后只修改标题、标签的 update 事件 head SHA 不变，不取消排队中的推送任务"""
+        push_job, metadata_job = Future(), Future()
+        self.coalescer.supersede(self.key, 'sha1')
+        self.coalescer.track(self.key, 'sha1', push_job)
+        self.coalescer.supersede(self.key, 'sha1')
+        self.coalescer.track(self.key, 'sha1', metadata_job)
+        self.assertFalse(push_job.cancelled())
+        self.assertTrue(self.coalescer.is_current(self.key, 'sha1'))
+
+        # 新的推送仍会取代两个任务
+        self.coalescer.supersede(self.key, 'sha2')
+        self.assertFalse(self.coalescer.is_current(self.key, 'sha1'))
+
+    def test_entry_removed_after_jobs_finish(self):
+        """同一个 MR 的任务全部结束后删除记录"""
+        backend = self.coalescer.backend
+        old_job, new_job = Future(), Future()
+        old_job.set_running_or_notify_cancel()
+        self.coalescer.supersede(self.key, 'sha1')
+        self.coalescer.track(self.key, 'sha1', old_job)
+        self.coalescer.supersede(self.key, 'sha2')
+        self.coalescer.track(self.key, 'sha2', new_job)
+
+        new_job.set_running_or_notify_cancel()
+        new_job.set_result(None)
+        # 旧任务仍在执行，保留记录以便其判断结果已过期
+        self.assertFalse(self.coalescer.is_current(self.key, 'sha1'))
+        old_job.set_result(None)
+        self.assertEqual(backend._entries, {})
+
+    def test_cancelled_job_finishes(self):
+        job = Future()
+        self.coalescer.supersede(self.key, 'sha1')
+        self.coalescer.track(self.key, 'sha1', job)
+        job.cancel()
+        self.assertEqual(self.coalescer.backend._entries, {})
+
+
+@skipUnless(fakeredis, 'fakeredis is not installed')
+class TestRedisCoalescer(TestCase):
+    def setUp(self):
+        self.backend = RedisCoalescer(connection=fakeredis.FakeRedis())
+        self.key = make_coalesce_key('gitlab_example_com', 1, 2)
+
+    def test_supersede_cancels_previous_job(self):
+        with mock.patch.object(self.backend, '_cancel_queued_job') as cancel:
+            self.backend.supersede(self.key, 'sha1')
+            self.backend.track(self.key, 'sha1', SimpleNamespace(id='job1'))
+            self.backend.supersede(self.key, 'sha2')
+        cancel.assert_called_once_with(self.key, 'job1')
+        self.assertEqual(self.backend.current_revision(self.key), 'sha2')
+        self.assertGreater(self.backend.connection.ttl(self.backend._key(self.key)), 0)
+
+    def test_metadata_update_keeps_queued_push(self):
+        with mock.patch.object(self.backend, '_cancel_queued_job') as cancel:
+            self.backend.supersede(self.key, 'sha1')
+            self.backend.track(self.key, 'sha1', SimpleNamespace(id='push'))
+            self.backend.supersede(self.key, 'sha1')
+            self.backend.track(self.key, 'sha1', SimpleNamespace(id='metadata'))
+            cancel.assert_not_called()
+            self.assertEqual(self.backend.current_revision(self.key), 'sha1')
+            self.backend.supersede(self.key, 'sha2')
+        cancel.assert_called_once_with(self.key, 'metadata')
+
+    def test_track_ignores_stale_revision(self):
+        self.backend.supersede(self.key, 'sha2')
+        self.backend.track(self.key, 'sha1', SimpleNamespace(id='job1'))
+        with mock.patch.object(self.backend, '_cancel_queued_job') as cancel:
+            self.backend.supersede(self.key, 'sha3')
+        cancel.assert_not_called()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,65 @@
+from unittest import TestCase, main
+
+from biz.utils.code_parser import parse_diff
+
+DIFF = '\n'.join([
+    'diff --git a/a.py b/a.py',
+    '--- a/a.py',
+    '+++ b/a.py',
+    '@@ -10,4 +10,5 @@ def func():',
+    ' keep',
+    '-old',
+    '+new',
+    '+added',
+    ' tail',
+    '\\ No newline at end of file',
+    '@@ -30 +31 @@',
+    '-x',
+    '+y',
+])
+
+
+class TestParseDiff(TestCase):
+    def test_hunks_and_line_numbers(self):
+        file_diff = parse_diff(DIFF, 'a.py', 'a.py')
+        self.assertEqual(len(file_diff.hunks), 2)
+        first, second = file_diff.hunks
+        self.assertEqual((first.old_start, first.old_count, first.new_start, first.new_count), (10, 4, 10, 5))
+        self.assertEqual(first.section, 'def func():')
+        self.assertEqual([(line.kind, line.text, line.old_lineno, line.new_lineno) for line in first.lines], [
+            (' ', 'keep', 10, 10),
+            ('-', 'old', 11, None),
+            ('+', 'new', None, 11),
+            ('+', 'added', None, 12),
+            (' ', 'tail', 12, 13),
+        ])
+        self.assertEqual((second.old_count, second.new_count), (1, 1))
+        self.assertEqual((file_diff.added_count, file_diff.removed_count), (3, 2))
+
+    def test_find_line(self):
+        file_diff = parse_diff(DIFF)
+        self.assertEqual(file_diff.find_line(12).text, 'added')
+        self.assertEqual(file_diff.find_line(31).text, 'y')
+        self.assertIsNone(file_diff.find_line(20))
+
+    def test_whitespace_only(self):
+        self.assertTrue(parse_diff('@@ -1 +1 @@\n-a=1\n+a = 1').hunks[0].is_whitespace_only())
+        self.assertFalse(parse_diff('@@ -1 +1 @@\n-a=1\n+a = 2').hunks[0].is_whitespace_only())
+        self.assertTrue(parse_diff('@@ -1 +1 @@\n-    a=1\n+    a = 1  ').hunks[0].is_whitespace_only())
+
+    def test_indentation_is_significant(self):
+        """Python 代码调整缩进会改变逻辑，不是空白修改"""
+        diff = '\n'.join([
+            '@@ -1,4 +1,4 @@',
+            ' for item in items:',
+            '     process(item)',
+            '-    notify(item)',
+            '-cleanup()',
+            '+notify(item)',
+            '+    cleanup()',
+        ])
+        self.assertFalse(parse_diff(diff).hunks[0].is_whitespace_only())
+
+
+if __name__ == '__main__':
+    main()
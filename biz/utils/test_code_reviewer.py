@@ -0,0 +1,108 @@
+import os
+from types import SimpleNamespace
+from unittest import TestCase, main, mock
+
+from biz.llm.client.base import BaseClient
+from biz.llm.factory import Factory
+from biz.llm.limiter import ConcurrencyLimitExceeded
+from biz.utils.code_reviewer import CodeReviewer
+
+
+class ChunkClient(BaseClient):
+    """按分块内容返回预设结果，包含 fail 的分块抛出异常"""
+
+    def __init__(self, reduce_result: str):
+        self.reduce_result = reduce_result
+
+    def completions(self, messages, model=None) -> str:
+        return self.reduce_result
+
+    async def acompletions(self, messages, model=None) -> str:
+        content = messages[-1]['content']
+        if 'fail' in content:
+            raise ConnectionError('endpoint down')
+        if 'busy' in content:
+            raise ConcurrencyLimitExceeded('LLM concurrency limit reached', 300)
+        return '总分:90分' if 'good' in content else '没有评分'
+
+
+class TestChunkedReview(TestCase):
+    def reviewer(self, reduce_result: str) -> CodeReviewer:
+        with mock.patch.object(Factory, 'getClient', return_value=ChunkClient(reduce_result)):
+            return CodeReviewer()
+
+    def test_fallback_score_of_parsed_chunks(self):
+        chunks = ['## a.py\ngood', '## b.py\nunscored ' * 10, '## c.py\nfail']
+        review_result, failed_note, complete = self.reviewer('汇总')._review_chunks(chunks)
+        # 没有评分的分块和失败的分块不参与平均
+        self.assertTrue(review_result.endswith('总分:90分'))
+        self.assertTrue(complete)
+        self.assertIn('1/3', failed_note)
+        self.assertIn('第 3 部分(`c.py`)：endpoint down', failed_note)
+
+    def test_no_parsed_score(self):
+        review_result, failed_note, complete = self.reviewer('汇总')._review_chunks(['## a.py\nx', '## b.py\ny'])
+        self.assertEqual(review_result, '汇总')
+        self.assertEqual(failed_note, '')
+        self.assertTrue(complete)
+
+    def test_rate_limited_chunk_defers_job(self):
+        """任一分块等待并发名额超时时抛出异常，由 worker 推迟整个任务，而不是发布不完整的结果"""
+        reviewer = self.reviewer('汇总')
+        with mock.patch.object(reviewer, 'call_llm') as call_llm, self.assertRaises(ConcurrencyLimitExceeded):
+            reviewer._review_chunks(['## a.py\ngood', '## b.py\nbusy', '## c.py\nfail'])
+        call_llm.assert_not_called()
+
+    def test_incomplete_reduce(self):
+        _, _, complete = self.reviewer('COT ABORT!')._review_chunks(['## a.py\ngood', '## b.py\ngood'])
+        self.assertFalse(complete)
+
+    def test_all_chunks_failed(self):
+        with self.assertRaises(ConnectionError):
+            self.reviewer('汇总')._review_chunks(['## a.py\nfail', '## b.py\nfail'])
+
+
+class StaticClient(BaseClient):
+    default_model = 'test'
+
+    def __init__(self, result: str):
+        self.result = result
+
+    def completions(self, messages, model=None) -> str:
+        return self.result
+
+
+class TestReviewCaching(TestCase):
+    def review(self, result: str) -> mock.Mock:
+        review_cache = mock.Mock()
+        review_cache.get.return_value = None
+        budget = SimpleNamespace(chunks=['diff'], text='diff', note=lambda changes_truncated=False: '')
+        with mock.patch.object(Factory, 'getClient', return_value=StaticClient(result)), \
+                mock.patch('biz.utils.code_reviewer.get_review_cache', return_value=review_cache), \
+                mock.patch.object(CodeReviewer, 'allocate_changes', return_value=budget):
+            self.assertEqual(CodeReviewer().review_changes([{'new_path': 'a.py', 'diff': '+a'}]), result)
+        return review_cache
+
+    def test_complete_result_cached(self):
+        self.review('总分:90分').put.assert_called_once()
+
+    def test_incomplete_result_not_cached(self):
+        for result in ('COT ABORT!',
+                       '部分结果\n\n> 模型输出停滞，结果不完整。',
+                       '部分结果\n\n> 模型输出超出 Token 上限，结果不完整。',
+                       '调用DeepSeek API时出错: timeout',
+                       'AI服务返回为空，请稍后重试'):
+            with self.subTest(result=result):
+                self.review(result).put.assert_not_called()
+
+    def test_prompt_version_includes_budget(self):
+        with mock.patch.object(Factory, 'getClient', return_value=StaticClient('')):
+            reviewer = CodeReviewer()
+        with mock.patch.dict(os.environ, {'REVIEW_MAX_TOKENS': '10000', 'REVIEW_CHUNKED_ENABLED': '0'}):
+            version = reviewer.prompt_version()
+        with mock.patch.dict(os.environ, {'REVIEW_MAX_TOKENS': '20000', 'REVIEW_CHUNKED_ENABLED': '0'}):
+            self.assertNotEqual(reviewer.prompt_version(), version)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,45 @@
+import asyncio
+from unittest import TestCase, main
+
+from biz.llm.client.base import BaseClient
+from biz.utils.concurrent_util import run_concurrently, run_coroutine
+
+
+class FakeAsyncClient(BaseClient):
+    def __init__(self):
+        self.created = 0
+
+    def completions(self, messages, model=None) -> str:
+        return ''
+
+    async def acompletions(self, messages, model=None) -> str:
+        return str(id(self._get_async_client(self._create)))
+
+    def _create(self):
+        self.created += 1
+        return object()
+
+
+class TestConcurrentUtil(TestCase):
+    def test_run_concurrently(self):
+        self.assertEqual(run_concurrently(lambda: 1, lambda: 2), [1, 2])
+
+    def test_run_coroutine_reuses_loop(self):
+        async def current_loop():
+            return asyncio.get_running_loop()
+
+        self.assertIs(run_coroutine(current_loop()), run_coroutine(current_loop()))
+        # 异步客户端在多次调用之间复用
+        client = FakeAsyncClient()
+        self.assertEqual(run_coroutine(client.acompletions([])), run_coroutine(client.acompletions([])))
+        self.assertEqual(client.created, 1)
+
+    def test_run_coroutine_raises(self):
+        async def fail():
+            raise ValueError('boom')
+
+        self.assertRaises(ValueError, run_coroutine, fail())
+
+
+if __name__ == '__main__':
+    main()
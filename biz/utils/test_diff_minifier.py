@@ -0,0 +1,68 @@
+from unittest import TestCase, main
+
+from biz.utils.diff_minifier import DiffMinifier
+
+DIFF = '\n'.join([
+    '@@ -1,12 +1,12 @@',
+    ' line1',
+    ' line2',
+    ' line3',
+    '-a = 1',
+    '+a = 2',
+    ' line5',
+    ' line6',
+    ' line7',
+    ' line8',
+    ' line9',
+    '-b = 1',
+    '+b = 2',
+    ' line11',
+    '@@ -30,2 +30,2 @@',
+    '-if x:',
+    '+if  x :',
+    '@@ -50,3 +50,0 @@',
+    '-removed1',
+    '-removed2',
+    '-removed3',
+    '\\ No newline at end of file',
+])
+
+
+class TestDiffMinifier(TestCase):
+    def test_minify(self):
+        text = DiffMinifier(context_lines=1).minify([{'new_path': 'a.py', 'diff': DIFF}])
+        self.assertEqual(text, '\n'.join([
+            '## a.py',
+            '@@ -1,12 +1,12 @@',
+            ' line3',
+            '-a = 1',
+            '+a = 2',
+            ' line5',
+            ' ...',
+            ' line9',
+            '-b = 1',
+            '+b = 2',
+            ' line11',
+            '@@ -50,3 +50,0 @@ (删除 3 行)',
+        ]))
+
+    def test_keep_everything_when_disabled(self):
+        text = DiffMinifier(context_lines=100, strip_whitespace=False, drop_deletions=False).minify(
+            [{'new_path': 'a.py', 'diff': DIFF}])
+        self.assertIn('+if  x :', text)
+        self.assertIn('-removed3', text)
+        self.assertIn(' line1', text)
+
+    def test_keep_reindented_block(self):
+        """调整缩进的 Python 代码仍需 Review"""
+        diff = '@@ -1,3 +1,3 @@\n if ready:\n-    start()\n-    wait()\n+    start()\n+wait()'
+        text = DiffMinifier().minify([{'new_path': 'a.py', 'diff': diff}])
+        self.assertIn('+wait()', text)
+
+    def test_skip_files_without_changes(self):
+        changes = [{'new_path': 'a.py', 'diff': '@@ -1 +1 @@\n-x=1\n+x = 1'}, {'new_path': 'b.py', 'diff': ''}]
+        self.assertEqual(DiffMinifier().minify(changes), '')
+
+
+if __name__ == '__main__':
+    main()
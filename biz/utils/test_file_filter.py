@@ -0,0 +1,40 @@
+import os
+from unittest import TestCase, main, mock
+
+from biz.utils import file_filter
+from biz.utils.file_filter import FileFilter, get_file_filter
+
+
+class TestFileFilter(TestCase):
+    def test_extensions_and_globs(self):
+        f = FileFilter(['.py', '.js'], include=['Dockerfile'], exclude=['tests/fixtures/'])
+        self.assertTrue(f.match('src/app.py'))
+        self.assertTrue(f.match('Dockerfile'))
+        self.assertTrue(f.match('deploy/Dockerfile'))
+        self.assertFalse(f.match('README.md'))
+        self.assertFalse(f.match('tests/fixtures/data.py'))
+
+    def test_skip_generated(self):
+        f = FileFilter(['.js', '.json', '.py', '.go'])
+        for path in ['package-lock.json', 'web/package-lock.json', 'dist/app.js', 'static/lib.min.js',
+                     'vendor/github.com/x/y.go', 'api/user_pb2.py']:
+            self.assertFalse(f.match(path), path)
+        self.assertTrue(FileFilter(['.js'], skip_generated=False).match('dist/app.js'))
+        # 构建目录只在仓库根目录跳过，同名的源码包不受影响
+        for path in ['src/build/config.py', 'tools/target/main.go', 'com/x/generated/model.py', 'web/dist/util.js']:
+            self.assertTrue(f.match(path), path)
+        self.assertFalse(f.match('target/classes/App.py'))
+        self.assertTrue(f.is_generated('@@ -0,0 +1,2 @@\n+// Code generated by protoc-gen-go. DO NOT EDIT.\n+package x\n'))
+        self.assertFalse(f.is_generated('@@ -0,0 +1,1 @@\n+package x\n'))
+
+    def test_project_override(self):
+        env = {'SUPPORTED_EXTENSIONS': '.py', 'SUPPORTED_EXTENSIONS_GROUP_GO_SERVICE': '.go'}
+        with mock.patch.dict(os.environ, env), mock.patch.object(file_filter, '_file_filters', {}):
+            self.assertTrue(get_file_filter('group/go-service').match('main.go'))
+            self.assertFalse(get_file_filter('group/go-service').match('main.py'))
+            self.assertTrue(get_file_filter('group/other').match('main.py'))
+            self.assertIs(get_file_filter('group/other'), get_file_filter('group/other'))
+
+
+if __name__ == '__main__':
+    main()
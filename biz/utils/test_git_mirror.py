@@ -0,0 +1,112 @@
+import os
+import subprocess
+import tempfile
+from unittest import TestCase, main, mock
+
+from biz.utils import git_mirror
+from biz.utils.git_mirror import GitMirror, get_mirror_changes
+
+
+def git(cwd, *args):
+    return subprocess.run(['git', '-c', 'user.name=test', '-c', 'user.email=test@example.com', *args], cwd=cwd,
+                          check=True, capture_output=True, text=True).stdout.strip()
+
+
+def write(path, content):
+    with open(path, 'w') as f:
+        f.write(content)
+
+
+class TestGitMirror(TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.source = os.path.join(self.tmp.name, 'source')
+        os.makedirs(self.source)
+        git(self.source, 'init', '--quiet', '--initial-branch=main')
+        write(os.path.join(self.source, 'app.py'), 'print("hello")\n')
+        write(os.path.join(self.source, 'old name.py'), 'x = 1\ny = 2\nz = 3\n')
+        write(os.path.join(self.source, 'removed.py'), 'pass\n')
+        git(self.source, 'add', '.')
+        git(self.source, 'commit', '--quiet', '-m', 'init')
+        self.base = git(self.source, 'rev-parse', 'HEAD')
+
+        git(self.source, 'checkout', '--quiet', '-b', 'feature')
+        write(os.path.join(self.source, 'app.py'), 'print("hello world")\n')
+        write(os.path.join(self.source, 'added.py'), 'a = 1\n')
+        git(self.source, 'mv', 'old name.py', 'new name.py')
+        git(self.source, 'rm', '--quiet', 'removed.py')
+        git(self.source, 'add', '.')
+        git(self.source, 'commit', '--quiet', '-m', 'feature')
+        self.head = git(self.source, 'rev-parse', 'HEAD')
+
+        # main 分支上的后续提交不应出现在以 merge-base 为起点的 diff 中
+        git(self.source, 'checkout', '--quiet', 'main')
+        write(os.path.join(self.source, 'main_only.py'), 'b = 2\n')
+        git(self.source, 'add', '.')
+        git(self.source, 'commit', '--quiet', '-m', 'main')
+
+        self.remote_url = f'file://{self.source}'
+        self.mirror_dir = os.path.join(self.tmp.name, 'mirrors')
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_diff_matches_gitlab_change_format(self):
+        mirror = GitMirror(self.mirror_dir)
+        path = mirror.fetch(self.remote_url, ['feature'])
+        changes = {change['new_path']: change for change in mirror.diff(path, self.base, self.head)}
+
+        self.assertEqual(set(changes), {'app.py', 'added.py', 'new name.py', 'removed.py'})
+        self.assertTrue(changes['app.py']['diff'].startswith('@@'))
+        self.assertIn('+print("hello world")', changes['app.py']['diff'])
+        self.assertTrue(changes['added.py']['new_file'])
+        self.assertTrue(changes['new name.py']['renamed_file'])
+        self.assertEqual(changes['new name.py']['old_path'], 'old name.py')
+        self.assertTrue(changes['removed.py']['deleted_file'])
+        self.assertFalse(changes['app.py']['deleted_file'])
+
+    def test_token_not_on_command_line(self):
+        mirror = GitMirror(self.mirror_dir)
+        with mock.patch.object(git_mirror.subprocess, 'run',
+                               return_value=subprocess.CompletedProcess([], 0, b'', b'')) as run:
+            mirror.fetch('https://gitlab.example.com/group/repo.git', ['feature'], token='secret-token')
+        fetch = [call for call in run.call_args_list if 'fetch' in call.args[0]][0]
+        self.assertNotIn('Authorization', ' '.join(fetch.args[0]))
+        self.assertEqual(fetch.kwargs['env']['GIT_CONFIG_KEY_0'], 'http.extraHeader')
+        self.assertTrue(fetch.kwargs['env']['GIT_CONFIG_VALUE_0'].startswith('Authorization: Basic '))
+        # git 能读取通过环境变量传递的配置
+        self.assertEqual(mirror._git('config', '--get', 'x.y', extra_config={'x.y': 'z'}).strip(), 'z')
+
+    def test_prune_review_refs(self):
+        git(self.source, 'update-ref', 'refs/merge-requests/1/head', self.head)
+        git(self.source, 'update-ref', 'refs/merge-requests/2/head', self.base)
+        mirror = GitMirror(self.mirror_dir)
+        path = mirror.fetch(self.remote_url, ['refs/merge-requests/1/head'])
+        mirror.fetch(self.remote_url, ['main', 'refs/merge-requests/2/head'])
+        refs = git(path, 'for-each-ref', '--format=%(refname)').split()
+        self.assertIn('refs/merge-requests/2/head', refs)
+        self.assertNotIn('refs/merge-requests/1/head', refs)
+        # 删除 ref 后 commit 仍然可用
+        self.assertTrue(mirror.has_commit(path, self.head))
+
+    def test_merge_request_changes_use_merge_base(self):
+        with mock.patch.dict(os.environ, {'GIT_MIRROR_ENABLED': '1', 'GIT_MIRROR_DIR': self.mirror_dir,
+                                          'GIT_MIRROR_PROJECTS': 'group/source'}), \
+                mock.patch.object(git_mirror, '_git_mirror', None):
+            changes = get_mirror_changes('group/source', self.remote_url, None, ['main', 'feature'],
+                                         base='refs/heads/main', head=self.head, use_merge_base=True)
+            self.assertNotIn('main_only.py', [change['new_path'] for change in changes])
+            self.assertEqual(len(changes), 4)
+            # 不在 GIT_MIRROR_PROJECTS 中的项目不使用 mirror
+            self.assertIsNone(get_mirror_changes('group/other', self.remote_url, None, ['feature'],
+                                                 base=self.base, head=self.head))
+
+    def test_fallback_when_fetch_fails(self):
+        with mock.patch.dict(os.environ, {'GIT_MIRROR_ENABLED': '1', 'GIT_MIRROR_DIR': self.mirror_dir}), \
+                mock.patch.object(git_mirror, '_git_mirror', None):
+            self.assertIsNone(get_mirror_changes('group/source', f'file://{self.tmp.name}/missing', None,
+                                                 ['feature'], base=self.base, head=self.head))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,81 @@
+import os
+import tempfile
+from unittest import TestCase, main, mock
+
+import requests
+
+from biz.utils.http_cache import HttpCache
+from biz.utils.http_client import HttpClient
+
+
+def make_response(status_code: int, body: bytes = b'', headers: dict = None, url: str = '') -> requests.Response:
+    response = requests.Response()
+    response.status_code = status_code
+    response._content = body
+    response.headers.update(headers or {})
+    response.url = url
+    return response
+
+
+class TestHttpCache(TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.cache = HttpCache(os.path.join(self.tmp_dir.name, 'http_cache.db'), max_bytes=1000)
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def test_304_replayed_as_200(self):
+        url = 'https://api.github.com/repos/a/b/pulls/1/files'
+        client = HttpClient('https://api.github.com')
+        fresh = make_response(200, b'[{"filename": "a.py"}]', {'ETag': '"v1"', 'Content-Type': 'application/json'}, url)
+        sent = []
+
+        def send(method, url, **kwargs):
+            sent.append(kwargs.get('headers'))
+            return fresh if len(sent) == 1 else make_response(304, headers={'ETag': '"v1"'}, url=url)
+
+        with mock.patch('biz.utils.http_client.get_http_cache', return_value=self.cache), \
+                mock.patch.object(client, '_send', side_effect=send):
+            self.assertEqual(client.get(url, headers={'Authorization': 'token a'}).json(), [{'filename': 'a.py'}])
+            response = client.get(url, headers={'Authorization': 'token a'})
+        # 第二次请求携带 If-None-Match，304 响应还原为缓存的 200 响应
+        self.assertEqual(sent[1], {'Authorization': 'token a', 'If-None-Match': '"v1"'})
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.ok)
+        self.assertEqual(response.json(), [{'filename': 'a.py'}])
+        self.assertEqual(response.headers['content-type'], 'application/json')
+        self.assertEqual(response.url, url)
+
+    def test_lru_eviction_by_size(self):
+        for name in ('a', 'b', 'c'):
+            self.cache.put(name, make_response(200, b'x' * 90, {'ETag': name}, name))
+        self.cache.touch('a')
+        # 总大小超过 max_bytes 时淘汰最久未访问的 b
+        for name in ('d', 'e', 'f', 'g', 'h', 'i', 'j', 'k', 'l', 'm'):
+            self.cache.put(name, make_response(200, b'x' * 90, {'ETag': name}, name))
+            self.cache.touch('a')
+        self.assertIsNotNone(self.cache.get('a'))
+        self.assertIsNone(self.cache.get('b'))
+        self.assertIsNotNone(self.cache.get('m'))
+        # 超过总大小十分之一的响应和没有校验头的响应不缓存
+        self.cache.put('big', make_response(200, b'x' * 101, {'ETag': 'big'}))
+        self.cache.put('plain', make_response(200, b'x'))
+        self.assertIsNone(self.cache.get('big'))
+        self.assertIsNone(self.cache.get('plain'))
+
+    def test_key_isolation(self):
+        url = 'https://gitlab.example.com/api/v4/projects/1/merge_requests/1/diffs'
+        key = HttpCache.make_key(url, {'page': 1}, {'Private-Token': 'a'})
+        self.assertEqual(key, HttpCache.make_key(url, {'page': 1}, {'Private-Token': 'a'}))
+        # 不同 token、不同 host、不同参数的响应互不共享
+        self.assertNotEqual(key, HttpCache.make_key(url, {'page': 1}, {'Private-Token': 'b'}))
+        self.assertNotEqual(key, HttpCache.make_key(url.replace('gitlab.example.com', 'gitlab.other.com'),
+                                                    {'page': 1}, {'Private-Token': 'a'}))
+        self.assertNotEqual(key, HttpCache.make_key(url, {'page': 2}, {'Private-Token': 'a'}))
+        self.assertNotEqual(HttpCache.make_key(url, headers={'Authorization': 'token a'}),
+                            HttpCache.make_key(url, headers={'Authorization': 'token b'}))
+
+
+if __name__ == '__main__':
+    main()
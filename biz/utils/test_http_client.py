@@ -0,0 +1,96 @@
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest import TestCase, main, skipUnless
+
+from biz.utils.http_client import HttpClient
+
+try:
+    import h2
+except ImportError:
+    h2 = None
+
+
+class Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        if self.path == '/redirect':
+            self._reply(302, b'', {'Location': '/projects?page=2'})
+        elif self.path == '/forbidden':
+            self._reply(403, b'{"message": "forbidden"}')
+        else:
+            self._reply(200, json.dumps({'path': self.path}).encode(), {'X-Next-Page': '3'})
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers['Content-Length']))
+        self._reply(201, body)
+
+    def _reply(self, status: int, body: bytes, headers: dict = None):
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class HttpClientTestMixin:
+    http2 = False
+
+    @classmethod
+    def setUpClass(cls):
+        cls.server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        threading.Thread(target=cls.server.serve_forever, daemon=True).start()
+        cls.host = f'http://127.0.0.1:{cls.server.server_port}'
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+
+    def setUp(self):
+        self.client = HttpClient(self.host, http2=self.http2)
+
+    def tearDown(self):
+        self.client.close()
+
+    def test_get(self):
+        response = self.client.get(f'{self.host}/projects', params={'page': 1}, headers={'Private-Token': 'a'})
+        self.assertTrue(response.ok)
+        self.assertEqual(response.json(), {'path': '/projects?page=1'})
+        self.assertEqual(response.headers['x-next-page'], '3')
+        self.assertEqual(self.client.http2, self.http2)
+
+    def test_follow_redirects(self):
+        response = self.client.get(f'{self.host}/redirect')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json(), {'path': '/projects?page=2'})
+        self.assertEqual(response.url, f'{self.host}/projects?page=2')
+
+    def test_error_status(self):
+        response = self.client.get(f'{self.host}/forbidden')
+        self.assertFalse(response.ok)
+        self.assertEqual(response.json(), {'message': 'forbidden'})
+
+    def test_post(self):
+        response = self.client.post(f'{self.host}/notes', json={'body': 'ok'}, verify=False)
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.json(), {'body': 'ok'})
+
+
+class TestRequestsBackend(HttpClientTestMixin, TestCase):
+    pass
+
+
+@skipUnless(h2, 'h2 is not installed')
+class TestHttpxBackend(HttpClientTestMixin, TestCase):
+    http2 = True
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,54 @@
+import os
+import threading
+from unittest import TestCase, main, mock
+
+from biz.utils import queue
+from biz.utils.queue import DEFERRALS_KEY, AsyncWorkerPool, QueueFullError, defer_queue
+
+
+class TestAsyncWorkerPool(TestCase):
+    def setUp(self):
+        self.pool = AsyncWorkerPool(max_workers=1, max_pending=1)
+        self.release = threading.Event()
+
+    def tearDown(self):
+        self.release.set()
+        self.pool.shutdown()
+
+    def test_reject_when_full(self):
+        """正在执行和排队的任务数达到上限后拒绝新任务"""
+        self.pool.submit(self.release.wait, 5)
+        self.pool.submit(self.release.wait, 5)
+        with self.assertRaises(QueueFullError):
+            self.pool.submit(self.release.wait, 5)
+
+    def test_slots_released_after_done(self):
+        """任务完成后释放名额，异常不会泄漏名额"""
+        self.pool.submit(lambda: 1 / 0).result(timeout=5)
+        self.pool.submit(lambda: None).result(timeout=5)
+        self.assertEqual(self.pool.stats()['running'], 0)
+        self.pool.submit(self.release.wait, 5)
+        self.pool.submit(self.release.wait, 5)
+
+
+class TestDeferQueue(TestCase):
+    def test_max_deferrals(self):
+        """推迟次数随任务数据传递，超过 QUEUE_MAX_DEFERRALS 后放弃"""
+        pool = mock.Mock()
+        data = {'object_kind': 'merge_request'}
+        with mock.patch.dict(os.environ, {'QUEUE_MAX_DEFERRALS': '2'}), \
+                mock.patch.object(queue, 'queue_driver', 'async'), \
+                mock.patch.object(queue, 'get_worker_pool', return_value=pool):
+            for _ in range(3):
+                timer = defer_queue(print, data, 'token', 'url', 'slug', 0)
+                if timer is None:
+                    break
+                timer.join(5)
+                data = pool.submit.call_args.args[1]
+        self.assertIsNone(timer)
+        self.assertEqual(pool.submit.call_count, 2)
+        self.assertEqual(data, {'object_kind': 'merge_request', DEFERRALS_KEY: 2})
+
+
+if __name__ == '__main__':
+    main()
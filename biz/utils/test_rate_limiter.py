@@ -0,0 +1,149 @@
+import time
+from email.utils import formatdate
+from unittest import TestCase, main, mock, skipUnless
+
+import requests
+
+from biz.utils.rate_limiter import RateLimiter, RateLimitExceeded, RedisQuotaState, TokenBucket
+
+try:
+    import fakeredis
+except ImportError:
+    fakeredis = None
+
+
+def make_response(status_code: int, headers: dict = None, text: str = '') -> requests.Response:
+    response = requests.Response()
+    response.status_code = status_code
+    response.headers.update(headers or {})
+    response._content = text.encode()
+    return response
+
+
+class TestTokenBucket(TestCase):
+    def test_burst_then_rate(self):
+        bucket = TokenBucket(rate=20, capacity=3)
+        started = time.monotonic()
+        for _ in range(3):
+            bucket.acquire()
+        self.assertLess(time.monotonic() - started, 0.05)
+        # 令牌用完后按 rate 补充，两个请求至少间隔约 1/rate 秒
+        bucket.acquire()
+        bucket.acquire()
+        self.assertGreaterEqual(time.monotonic() - started, 0.09)
+
+
+class TestRateLimiter(TestCase):
+    def setUp(self):
+        self.limiter = RateLimiter(rate=10, capacity=20, max_wait=5)
+        self.key = RateLimiter.make_key('https://api.github.com', {'Authorization': 'token a'})
+
+    def test_key_per_token(self):
+        self.assertNotEqual(self.key, RateLimiter.make_key('https://api.github.com', {'Authorization': 'token b'}))
+        self.assertTrue(self.key.startswith('https://api.github.com:'))
+
+    def test_slow_down_when_quota_low(self):
+        reset = time.time() + 100
+        self.limiter.after_response(self.key, make_response(200, {'X-RateLimit-Remaining': '50',
+                                                                  'X-RateLimit-Reset': str(reset)}))
+        self.assertEqual(self.limiter.state.quota(self.key), (50, reset))
+        self.limiter.before_request(self.key)
+        bucket = self.limiter.state._buckets[self.key]
+        self.assertAlmostEqual(bucket.rate, 0.5, places=1)
+        # GitLab 使用不带 X- 前缀的响应头
+        self.limiter.after_response(self.key, make_response(200, {'RateLimit-Remaining': '5000',
+                                                                  'RateLimit-Reset': str(reset)}))
+        self.limiter.before_request(self.key)
+        self.assertEqual(bucket.rate, 10)
+
+    def test_restore_rate_after_reset(self):
+        """额度重置时间过后恢复基础速率，不需要等待新的响应头"""
+        reset = time.time() + 100
+        self.limiter.after_response(self.key, make_response(200, {'X-RateLimit-Remaining': '1',
+                                                                  'X-RateLimit-Reset': str(reset)}))
+        self.limiter.before_request(self.key)
+        bucket = self.limiter.state._buckets[self.key]
+        self.assertAlmostEqual(bucket.rate, 0.01)
+        with mock.patch('biz.utils.rate_limiter.time.time', return_value=reset + 1):
+            self.limiter.before_request(self.key)
+        self.assertEqual(bucket.rate, 10)
+
+    def test_primary_limit_exhausted(self):
+        reset = time.time() + 3600
+        with self.assertRaises(RateLimitExceeded) as context:
+            self.limiter.after_response(self.key, make_response(403, {'X-RateLimit-Remaining': '0',
+                                                                      'X-RateLimit-Reset': str(reset)}))
+        self.assertAlmostEqual(context.exception.retry_after, 3600, delta=5)
+        # 等待时间超过 max_wait，后续请求直接推迟
+        self.assertRaises(RateLimitExceeded, self.limiter.before_request, self.key)
+
+    def test_secondary_limit(self):
+        # 次级限流：remaining 仍大于 0，按 Retry-After 等待，而不是主限流的重置时间
+        headers = {'X-RateLimit-Remaining': '4000', 'X-RateLimit-Reset': str(time.time() + 3600), 'Retry-After': '30'}
+        with self.assertRaises(RateLimitExceeded) as context:
+            self.limiter.after_response(self.key, make_response(403, headers))
+        self.assertEqual(context.exception.retry_after, 30)
+
+        # 没有 Retry-After 时根据响应内容识别，至少等待 60 秒
+        headers = {'X-RateLimit-Remaining': '4000', 'X-RateLimit-Reset': str(time.time() + 3600)}
+        with self.assertRaises(RateLimitExceeded) as context:
+            self.limiter.after_response(self.key, make_response(
+                403, headers, '{"message": "You have exceeded a secondary rate limit."}'))
+        self.assertEqual(context.exception.retry_after, 60)
+
+    def test_forbidden_is_not_rate_limited(self):
+        self.limiter.after_response(self.key, make_response(403, {'X-RateLimit-Remaining': '4000'},
+                                                            '{"message": "Resource not accessible"}'))
+
+    def test_429_retry_after_http_date(self):
+        with self.assertRaises(RateLimitExceeded) as context:
+            self.limiter.after_response(self.key, make_response(429, {'Retry-After': formatdate(time.time() + 120,
+                                                                                                 usegmt=True)}))
+        self.assertAlmostEqual(context.exception.retry_after, 120, delta=2)
+
+    def test_short_wait_before_request(self):
+        """等待时间不超过 max_wait 时直接等待"""
+        self.limiter.state.update(self.key, 0, time.time() + 1)
+        with mock.patch('biz.utils.rate_limiter.time.sleep') as sleep:
+            self.limiter.before_request(self.key)
+        self.assertAlmostEqual(sleep.call_args.args[0], 1, delta=0.1)
+        self.assertIsNone(self.limiter.state.quota(self.key)[0])
+
+
+@skipUnless(fakeredis, 'fakeredis is not installed')
+class TestRedisQuotaState(TestCase):
+    def setUp(self):
+        self.connection = fakeredis.FakeRedis()
+        self.key = RateLimiter.make_key('https://gitlab.example.com', {'Private-Token': 'a'})
+
+    def limiter(self) -> RateLimiter:
+        return RateLimiter(rate=10, capacity=2, max_wait=5, state=RedisQuotaState(10, 2, connection=self.connection))
+
+    def test_shared_between_processes(self):
+        # 两个实例模拟两个 rq 任务进程
+        first, second = self.limiter(), self.limiter()
+        first.before_request(self.key)
+        second.before_request(self.key)
+        # 令牌桶共享，突发额度已被两个进程用完
+        self.assertGreater(second.state.try_acquire(self.key), 0)
+
+        reset = time.time() + 3600
+        with self.assertRaises(RateLimitExceeded):
+            first.after_response(self.key, make_response(403, {'RateLimit-Remaining': '0',
+                                                               'RateLimit-Reset': str(reset)}))
+        self.assertRaises(RateLimitExceeded, second.before_request, self.key)
+
+    def test_restore_rate_after_reset(self):
+        state = RedisQuotaState(10, 1, connection=self.connection)
+        now = time.time()
+        state.update(self.key, 1, now + 100)
+        self.assertEqual(state.try_acquire(self.key), 0)
+        # 剩余额度很少时按最低速率补充令牌
+        self.assertAlmostEqual(state.try_acquire(self.key), 100, delta=1)
+        with mock.patch('biz.utils.rate_limiter.time.time', return_value=now + 101):
+            self.assertEqual(state.try_acquire(self.key), 0)
+        self.assertEqual(state.quota(self.key), (1, now + 100))
+
+
+if __name__ == '__main__':
+    main()
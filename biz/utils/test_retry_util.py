@@ -0,0 +1,18 @@
+from unittest import TestCase, main
+
+from biz.utils.retry_util import backoff_attempts, exponential_backoff
+
+
+class TestRetryUtil(TestCase):
+    def test_exponential_backoff(self):
+        self.assertEqual(list(exponential_backoff(0.5, 2, 8, 30)), [0.5, 1.0, 2.0, 4.0, 8.0, 8, 6.5])
+
+    def test_no_delay_after_last_attempt(self):
+        attempts = list(backoff_attempts(0.5, 2, 8, 30))
+        self.assertEqual([attempt for attempt, _ in attempts], list(range(1, 9)))
+        self.assertIsNone(attempts[-1][1])
+        self.assertEqual(sum(delay for _, delay in attempts[:-1]), 30)
+
+
+if __name__ == '__main__':
+    main()
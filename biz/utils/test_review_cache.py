@@ -0,0 +1,50 @@
+import os
+import tempfile
+import time
+from unittest import TestCase, main, mock
+
+from biz.utils.review_cache import ReviewCache, patch_id
+
+
+class TestPatchId(TestCase):
+    def test_ignore_line_numbers_and_whitespace(self):
+        """cherry-pick 后行号变化、空白差异不影响 patch-id"""
+        changes = [{'new_path': 'a.py', 'diff': '@@ -1,2 +1,2 @@\n ctx\n-x = 1\n+x = 2\n'}]
+        moved = [{'new_path': 'a.py', 'diff': '@@ -40,2 +40,2 @@\n other\n-x  = 1\n+x = 2 \n'}]
+        self.assertEqual(patch_id(changes), patch_id(moved))
+
+    def test_order_independent_and_content_sensitive(self):
+        a = {'new_path': 'a.py', 'diff': '+a\n'}
+        b = {'new_path': 'b.py', 'diff': '+b\n'}
+        self.assertEqual(patch_id([a, b]), patch_id([b, a]))
+        self.assertNotEqual(patch_id([a]), patch_id([{'new_path': 'a.py', 'diff': '+c\n'}]))
+        self.assertNotEqual(patch_id([a]), patch_id([{'new_path': 'c.py', 'diff': '+a\n'}]))
+
+
+class TestReviewCache(TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.cache = ReviewCache(os.path.join(self.tmp.name, 'review_cache.db'), max_entries=2, ttl=60)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_lru_eviction(self):
+        now = time.time()
+        with mock.patch('time.time', side_effect=[now - 4, now - 3, now - 2, now - 1]):
+            self.cache.put('a', 'A')
+            self.cache.put('b', 'B')
+            self.assertEqual(self.cache.get('a'), 'A')
+            self.cache.put('c', 'C')
+        self.assertIsNone(self.cache.get('b'))
+        self.assertEqual(self.cache.get('a'), 'A')
+        self.assertEqual(self.cache.get('c'), 'C')
+
+    def test_ttl_expiration(self):
+        self.cache.put('a', 'A')
+        with mock.patch('time.time', return_value=time.time() + self.cache.ttl + 1):
+            self.assertIsNone(self.cache.get('a'))
+
+
+if __name__ == '__main__':
+    main()
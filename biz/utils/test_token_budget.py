@@ -0,0 +1,89 @@
+from types import SimpleNamespace
+from unittest import TestCase, main
+
+from biz.utils.token_budget import TokenBudgetAllocator, file_priority
+
+
+def count_words(text: str) -> int:
+    return len(text.split())
+
+
+class TestTokenBudgetAllocator(TestCase):
+    def test_priority(self):
+        self.assertGreater(file_priority('src/app.py'), file_priority('tests/test_app.py'))
+        self.assertGreater(file_priority('src/app.test.js'), file_priority('README.md'))
+        self.assertGreater(file_priority('src/auth/login.py'), file_priority('src/app.py'))
+
+    def test_everything_fits(self):
+        result = TokenBudgetAllocator(100, count_words).allocate([('a.py', ['h1 x']), ('b.py', ['h2 y'])])
+        self.assertEqual(result.text, '## a.py\nh1 x\n\n## b.py\nh2 y')
+        self.assertEqual(result.note(), '')
+        self.assertEqual(result.original_tokens, result.total_tokens)
+
+    def test_original_tokens(self):
+        # 压缩前的 hunk 与文件头、压缩后的 hunk 在同一批中计数
+        batches = []
+
+        def count_batch(texts):
+            batches.append(texts)
+            return [count_words(text) for text in texts]
+
+        allocator = TokenBudgetAllocator(100, tokenizer=SimpleNamespace(count_batch=count_batch))
+        result = allocator.allocate([('a.py', ['x y'])], originals=[['x  y  z w', 'removed']])
+        self.assertEqual(len(batches), 1)
+        self.assertEqual(result.total_tokens, 2 + 3)
+        self.assertEqual(result.original_tokens, 2 + 5 + 2)
+
+    def test_spread_across_files_at_hunk_boundaries(self):
+        files = [
+            ('src/big.py', ['a ' * 10, 'b ' * 10, 'c ' * 10]),
+            ('tests/test_big.py', ['t ' * 10]),
+            ('src/small.py', ['s ' * 5, 'u ' * 5]),
+            ('docs/guide.md', ['d ' * 30]),
+        ]
+        # 每个文件头 2 个 token，每个 hunk 额外计 1 个 token 的换行
+        result = TokenBudgetAllocator(51, count_words).allocate(files)
+        # 第一轮：small(8) + big(13) + test(13)，第二轮：small 的第二个 hunk(6) + big 的第二个 hunk(11)
+        self.assertEqual(result.partial, [('src/big.py', 2, 3)])
+        self.assertEqual(result.skipped, ['docs/guide.md'])
+        self.assertEqual(result.used_tokens, 51)
+        # 输出保持原有的文件顺序
+        self.assertLess(result.text.index('src/big.py'), result.text.index('src/small.py'))
+        self.assertNotIn('c c', result.text)
+        self.assertIn('`docs/guide.md`：未 Review', result.note())
+
+    def test_changes_truncated_note(self):
+        """读取变更时已截断的说明与预算说明合并为一条"""
+        result = TokenBudgetAllocator(100, count_words).allocate([('a.py', ['x y'])])
+        self.assertEqual(result.note(changes_truncated=True), '> 变更超出 REVIEW_MAX_TOKENS 限制，部分文件未被读取和 Review。')
+        result = TokenBudgetAllocator(3, count_words).allocate([('a.py', ['x y']), ('b.py', ['z ' * 10])])
+        note = result.note(changes_truncated=True)
+        self.assertEqual(note.count('REVIEW_MAX_TOKENS'), 1)
+        self.assertIn('部分文件未被读取', note)
+        self.assertIn('`b.py`：未 Review', note)
+
+    def test_files_without_hunks(self):
+        """二进制文件等没有 hunk 的文件列在说明中"""
+        files = [('logo.png', []), ('a.py', ['x y'])]
+        result = TokenBudgetAllocator(100, count_words).allocate(files)
+        self.assertEqual(result.text, '## a.py\nx y')
+        self.assertEqual((result.skipped, result.no_diff), ([], ['logo.png']))
+        self.assertIn('> - `logo.png`', result.note())
+        self.assertNotIn('REVIEW_MAX_TOKENS', result.note())
+        # 超出预算时同样不影响其它文件
+        result = TokenBudgetAllocator(6, count_words).split(files + [('b.py', ['z ' * 10])], 6)
+        self.assertEqual(result.chunks, ['## a.py\nx y'])
+        self.assertEqual((result.skipped, result.no_diff), (['b.py'], ['logo.png']))
+
+    def test_split_into_chunks(self):
+        a, b, c = ['a ' * 10, 'b ' * 10, 'c ' * 10], ['x ' * 5], ['y ' * 30]
+        result = TokenBudgetAllocator(100, count_words).split([('a.py', a), ('b.py', b), ('c.py', c)], 25)
+        # a.py 在 hunk 边界拆分到两个分块，单个 hunk 超出分块上限的 c.py 不 Review
+        self.assertEqual(result.chunks, ['## a.py\n' + a[0] + '\n' + a[1],
+                                         '## a.py\n' + a[2] + '\n\n## b.py\n' + b[0]])
+        self.assertEqual(result.skipped, ['c.py'])
+        self.assertEqual(result.used_tokens, 43)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,193 @@
+import re
+
+from biz.utils.token_util import Tokenizer, get_tokenizer
+
+TEST_PATH = re.compile(r'(^|/)(tests?|__tests__|specs?)/|(^|/)test_[^/]*$|[._-](test|spec)s?\.\w+$', re.IGNORECASE)
+DOC_PATH = re.compile(r'\.(md|rst|txt|adoc)$|(^|/)docs?/', re.IGNORECASE)
+# 路径中包含这些关键字的文件风险更高，优先 Review
+RISK_PATH = re.compile(r'auth|login|passw|secret|token|crypt|secur|permission|acl|payment|sql|migration|config',
+                       re.IGNORECASE)
+
+
+def file_priority(path: str) -> int:
+    """源码 > 测试 > 文档，命中风险关键字的文件再提高一级"""
+    if DOC_PATH.search(path):
+        priority = 0
+    elif TEST_PATH.search(path):
+        priority = 1
+    else:
+        priority = 2
+    return priority + 1 if RISK_PATH.search(path) else priority
+
+
+class FileBudget:
+    __slots__ = ('index', 'path', 'hunks', 'hunk_tokens', 'header_tokens', 'priority', 'included')
+
+    def __init__(self, index: int, path: str, hunks: list, header_tokens: int, hunk_tokens: list):
+        self.index = index
+        self.path = path
+        self.hunks = hunks
+        self.header_tokens = header_tokens
+        self.hunk_tokens = hunk_tokens
+        self.priority = file_priority(path)
+        self.included = 0
+
+    @property
+    def tokens(self) -> int:
+        return self.header_tokens + sum(self.hunk_tokens)
+
+
+class BudgetResult:
+    def __init__(self, text: str, used_tokens: int, total_tokens: int, partial: list, skipped: list,
+                 chunks: list = None, original_tokens: int = None, no_diff: list = None):
+        self.text = text
+        self.used_tokens = used_tokens
+        self.total_tokens = total_tokens
+        # 压缩前全部变更的 token 数，未传入 originals 时等于 total_tokens
+        self.original_tokens = total_tokens if original_tokens is None else original_tokens
+        # [(文件路径, 已 Review 的 hunk 数, 总 hunk 数)]
+        self.partial = partial
+        self.skipped = skipped
+        # 分块 Review 时每个分块的文本
+        self.chunks = chunks or []
+        # 没有 hunk 的文件(二进制文件、GitHub 未返回 patch 的大文件等)，无法 Review
+        self.no_diff = no_diff or []
+
+    def note(self, changes_truncated: bool = False) -> str:
+        """
+        附加到 Review 结果中的说明，所有变更都在预算内且都有 diff 时为空
+        :param changes_truncated: 读取变更时已达到预算上限，后续的文件未被读取(见 MergeRequestHandler.changes_truncated)
+        """
+        lines = []
+        if self.partial or self.skipped:
+            unread = '，部分文件未被读取' if changes_truncated else ''
+            lines.append(f'> 变更超出 REVIEW_MAX_TOKENS 限制({self.total_tokens} tokens){unread}，以下文件未完整 Review：')
+            lines += [f'> - `{path}`：仅 Review 了 {included}/{total} 个 hunk'
+                      for path, included, total in self.partial]
+            lines += [f'> - `{path}`：未 Review' for path in self.skipped]
+        elif changes_truncated:
+            lines.append('> 变更超出 REVIEW_MAX_TOKENS 限制，部分文件未被读取和 Review。')
+        if self.no_diff:
+            lines.append('> 以下文件没有可 Review 的文本 diff(二进制文件或 diff 过大)，未 Review：')
+            lines += [f'> - `{path}`' for path in self.no_diff]
+        return '\n'.join(lines)
+
+
+class TokenBudgetAllocator:
+    """
+    按优先级在文件之间分配 token 预算，代替对整个 diff 文本的头部截断：
+    1. 按优先级(源码 > 测试 > 文档，风险关键字加权)从高到低、同优先级小文件优先，为每个文件放入第一个 hunk
+    2. 再按同样的顺序依次补充各文件剩余的 hunk，直到预算用完
+    截断只发生在 hunk 边界，未完整 Review 和未 Review 的文件记录在结果中
+    """
+
+    def __init__(self, max_tokens: int, token_counter=None, tokenizer: Tokenizer = None):
+        """
+        :param token_counter: 单个文本的 token 计数函数，默认使用 tokenizer 批量计数
+        :param tokenizer: 与模型匹配的 tokenizer，默认为 cl100k_base
+        """
+        self.max_tokens = max_tokens
+        self.token_counter = token_counter
+        self.tokenizer = tokenizer
+
+    def _count(self, texts: list) -> list:
+        if self.token_counter is None:
+            return (self.tokenizer or get_tokenizer()).count_batch(texts)
+        return [self.token_counter(text) for text in texts]
+
+    def _select(self, files: list, chunk_tokens: int = None, originals: list = None) -> tuple[list, int, int, int]:
+        """
+        为每个文件选出预算内的 hunk(budget.included)
+        :param chunk_tokens: 分块 Review 时每块的 token 上限，文件头加单个 hunk 超出上限的 hunk 不会被选中
+        :param originals: 与 files 一一对应的压缩前的 hunk 文本，与 files 在同一批中计数，用于统计压缩节省的 token 数
+        :return: (每个文件的 FileBudget, 全部变更的 token 数, 剩余预算, 压缩前全部变更的 token 数)
+        """
+        # 所有文件头和 hunk 一次批量计数；每个 hunk 额外计 1 个 token 作为拼接时的换行
+        texts = [f'## {path}\n' for path, _ in files] + [hunk for _, hunks in files for hunk in hunks]
+        original_hunks = [hunk for hunks in originals or [] for hunk in hunks]
+        counts = self._count(texts + original_hunks)
+        budgets = []
+        offset = len(files)
+        for index, (path, hunks) in enumerate(files):
+            hunk_tokens = [tokens + 1 for tokens in counts[offset:offset + len(hunks)]]
+            offset += len(hunks)
+            budgets.append(FileBudget(index, path, hunks, counts[index], hunk_tokens))
+        total_tokens = sum(budget.tokens for budget in budgets)
+        original_tokens = total_tokens
+        if originals is not None:
+            original_tokens = sum(counts[:len(files)]) + sum(counts[len(texts):]) + len(original_hunks)
+
+        def fits(budget: FileBudget, index: int) -> bool:
+            return chunk_tokens is None or budget.header_tokens + budget.hunk_tokens[index] <= chunk_tokens
+
+        remaining = self.max_tokens
+        if total_tokens <= remaining and all(fits(budget, index) for budget in budgets
+                                             for index in range(len(budget.hunks))):
+            for budget in budgets:
+                budget.included = len(budget.hunks)
+            remaining -= total_tokens
+        else:
+            ordered = sorted(budgets, key=lambda budget: (-budget.priority, budget.tokens))
+            for budget in ordered:
+                if not budget.hunks:
+                    continue
+                cost = budget.header_tokens + budget.hunk_tokens[0]
+                if cost <= remaining and fits(budget, 0):
+                    budget.included = 1
+                    remaining -= cost
+            for budget in ordered:
+                if not budget.included:
+                    continue
+                while budget.included < len(budget.hunks) and budget.hunk_tokens[budget.included] <= remaining \
+                        and fits(budget, budget.included):
+                    remaining -= budget.hunk_tokens[budget.included]
+                    budget.included += 1
+        return budgets, total_tokens, remaining, original_tokens
+
+    @staticmethod
+    def _result(budgets: list, used_tokens: int, total_tokens: int, chunks: list = None,
+                original_tokens: int = None) -> BudgetResult:
+        text = '\n\n'.join(f'## {budget.path}\n' + '\n'.join(budget.hunks[:budget.included])
+                           for budget in budgets if budget.included)
+        partial = [(budget.path, budget.included, len(budget.hunks)) for budget in budgets
+                   if 0 < budget.included < len(budget.hunks)]
+        skipped = [budget.path for budget in budgets if budget.hunks and not budget.included]
+        no_diff = [budget.path for budget in budgets if not budget.hunks]
+        return BudgetResult(text, used_tokens, total_tokens, partial, skipped, chunks, original_tokens, no_diff)
+
+    def allocate(self, files: list, originals: list = None) -> BudgetResult:
+        """
+        :param files: [(文件路径, [hunk 文本])]，hunk 为空的文件记录在 BudgetResult.no_diff 中
+        :param originals: 与 files 一一对应的压缩前的 hunk 文本(可选)
+        """
+        budgets, total_tokens, remaining, original_tokens = self._select(files, originals=originals)
+        return self._result(budgets, self.max_tokens - remaining, total_tokens, original_tokens=original_tokens)
+
+    def split(self, files: list, chunk_tokens: int, originals: list = None) -> BudgetResult:
+        """
+        分块 Review：先按 max_tokens(所有分块的总预算)选出 hunk，再按原有文件顺序装入不超过 chunk_tokens 的分块。
+        大文件在 hunk 边界拆分到多个分块，每个分块重复文件头
+        :param files: [(文件路径, [hunk 文本])]
+        :param originals: 与 files 一一对应的压缩前的 hunk 文本(可选)
+        :return: BudgetResult.chunks 为各分块的文本
+        """
+        budgets, total_tokens, remaining, original_tokens = self._select(files, chunk_tokens, originals)
+        chunks = []
+        current, current_tokens = [], 0
+        for budget in budgets:
+            hunks = []
+            for index in range(budget.included):
+                cost = budget.hunk_tokens[index] + (0 if hunks else budget.header_tokens)
+                if current_tokens + cost > chunk_tokens and (current or hunks):
+                    if hunks:
+                        current.append(f'## {budget.path}\n' + '\n'.join(hunks))
+                    chunks.append('\n\n'.join(current))
+                    current, current_tokens, hunks = [], 0, []
+                    cost = budget.hunk_tokens[index] + budget.header_tokens
+                hunks.append(budget.hunks[index])
+                current_tokens += cost
+            if hunks:
+                current.append(f'## {budget.path}\n' + '\n'.join(hunks))
+        if current:
+            chunks.append('\n\n'.join(current))
+        return self._result(budgets, self.max_tokens - remaining, total_tokens, chunks, original_tokens)
@@ -1,5 +1,95 @@
+import math
+import os
+import threading
+import time
+
 import tiktoken
 
+from biz.utils.log import logger
+
+
+class Tokenizer:
+    """
+    进程内共享的 tokenizer，编码器只加载一次。
+    使用 encode_ordinary 编码，代码中出现的 <|endoftext|> 等特殊 token 按普通文本处理。
+    没有对应 tiktoken 编码的模型(qwen、glm 等)使用相近的编码乘以校准系数 ratio 估算
+    """
+
+    def __init__(self, encoding_name: str = "cl100k_base", ratio: float = 1.0):
+        self.encoding_name = encoding_name
+        self.ratio = ratio
+        self._encoding = None
+        self._lock = threading.Lock()
+
+    @property
+    def encoding(self) -> tiktoken.Encoding:
+        if self._encoding is None:
+            with self._lock:
+                if self._encoding is None:
+                    self._encoding = tiktoken.get_encoding(self.encoding_name)
+        return self._encoding
+
+    def _scale(self, count: int) -> int:
+        return count if self.ratio == 1.0 else math.ceil(count * self.ratio)
+
+    def count(self, text: str) -> int:
+        return self._scale(len(self.encoding.encode_ordinary(text)))
+
+    def count_batch(self, texts: list) -> list:
+        """批量计算 token 数(tiktoken 内部多线程编码)"""
+        return [self._scale(len(tokens)) for tokens in self.encoding.encode_ordinary_batch(texts)] if texts else []
+
+    def obviously_fits(self, text: str, max_tokens: int) -> bool:
+        """每个 token 至少对应 1 个字节：字节数不超过 max_tokens 时无需编码即可确定不会超出"""
+        max_bytes = max_tokens / max(self.ratio, 1.0)
+        # UTF-8 每个字符最多 4 个字节，字符数足够小时连字节数都不用计算
+        return len(text) * 4 <= max_bytes or len(text.encode('utf-8')) <= max_bytes
+
+    def count_and_truncate(self, text: str, max_tokens: int) -> tuple[int, str]:
+        """只编码一次，返回 (原文的 token 数, 截断到 max_tokens 后的文本)"""
+        tokens = self.encoding.encode_ordinary(text)
+        limit = int(max_tokens / self.ratio)
+        if len(tokens) > limit:
+            return self._scale(len(tokens)), self.encoding.decode(tokens[:limit])
+        return self._scale(len(tokens)), text
+
+    def fit(self, text: str, max_tokens: int) -> tuple[str, bool]:
+        """返回 (截断到 max_tokens 后的文本, 是否被截断)，明显不超出的文本不编码"""
+        if self.obviously_fits(text, max_tokens):
+            return text, False
+        tokens_count, truncated_text = self.count_and_truncate(text, max_tokens)
+        return truncated_text, tokens_count > max_tokens
+
+
+_tokenizers = {}
+_tokenizers_lock = threading.Lock()
+
+
+def get_tokenizer(encoding_name: str = "cl100k_base", ratio: float = 1.0) -> Tokenizer:
+    key = (encoding_name, ratio)
+    tokenizer = _tokenizers.get(key)
+    if tokenizer is None:
+        with _tokenizers_lock:
+            tokenizer = _tokenizers.setdefault(key, Tokenizer(encoding_name, ratio))
+    return tokenizer
+
+
+def prewarm(encoding_names: tuple = ("cl100k_base",)) -> float:
+    """
+    在进程启动时(rq worker 在 fork 子进程之前)加载编码器，避免第一次 Review 时才下载/解析 BPE 文件。
+    BPE 文件缓存在 TIKTOKEN_CACHE_DIR 中，镜像构建时已预先下载，运行时无需访问网络。
+    :return: 加载耗时(秒)
+    """
+    start = time.perf_counter()
+    for encoding_name in dict.fromkeys(encoding_names):
+        try:
+            get_tokenizer(encoding_name).encoding
+        except Exception as e:
+            # 加载失败不影响服务启动，首次使用时会再次尝试
+            logger.warn(f"Failed to load tokenizer {encoding_name} (TIKTOKEN_CACHE_DIR="
+                        f"{os.getenv('TIKTOKEN_CACHE_DIR', '')}): {e}")
+    return time.perf_counter() - start
+
 
 def count_tokens(text: str) -> int:
     """
@@ -11,8 +101,7 @@ def count_tokens(text: str) -> int:
     Returns:
         int: token 数量。
     """
-    encoding = tiktoken.get_encoding("cl100k_base")  # 适用于 OpenAI GPT 系列
-    return len(encoding.encode(text))
+    return get_tokenizer().count(text)  # 适用于 OpenAI GPT 系列
 
 
 def truncate_text_by_tokens(text: str, max_tokens: int, encoding_name: str = "cl100k_base") -> str:
@@ -27,21 +116,48 @@ def truncate_text_by_tokens(text: str, max_tokens: int, encoding_name: str = "cl
     Returns:
         str: 截断后的文本。
     """
-    # 获取编码器
-    encoding = tiktoken.get_encoding(encoding_name)
+    return get_tokenizer(encoding_name).fit(text, max_tokens)[0]
+
 
-    # 将文本编码为 tokens
-    tokens = encoding.encode(text)
+def _benchmark():
+    """对比冷启动加载编码器，以及父进程预热后 fork 出的子进程首次计数的耗时"""
+    import multiprocessing
+    import subprocess
+    import sys
 
-    # 如果 tokens 数量超过最大限制，则截断
-    if len(tokens) > max_tokens:
-        truncated_tokens = tokens[:max_tokens]
-        truncated_text = encoding.decode(truncated_tokens)
-        return truncated_text
+    cold = subprocess.run([sys.executable, '-c',
+                           'import time, tiktoken; s = time.perf_counter(); tiktoken.get_encoding("cl100k_base"); '
+                           'print(time.perf_counter() - s)'], capture_output=True, text=True, check=True)
+    print(f"fresh process, load from TIKTOKEN_CACHE_DIR={os.getenv('TIKTOKEN_CACHE_DIR', '(tmp)')}: "
+          f"{float(cold.stdout):.3f}s")
+
+    def first_count(queue):
+        start = time.perf_counter()
+        count_tokens('def hello(): pass')
+        queue.put(time.perf_counter() - start)
+
+    context = multiprocessing.get_context('fork')
+    for label in ('forked child, parent not prewarmed', 'forked child, parent prewarmed'):
+        if 'parent prewarmed' in label:
+            print(f'prewarm in parent: {prewarm():.3f}s')
+        queue = context.Queue()
+        process = context.Process(target=first_count, args=(queue,))
+        process.start()
+        process.join()
+        print(f'{label}, first count_tokens: {queue.get():.3f}s')
 
-    return text
 
 if __name__ == '__main__':
-    text = "Hello, world! This is a test text for token counting."
-    print(count_tokens(text))  # 输出：11
-    print(truncate_text_by_tokens(text, 5))  # 输出："Hello, world!"
\ No newline at end of file
+    import sys
+
+    if len(sys.argv) > 1 and sys.argv[1] == 'benchmark':
+        _benchmark()
+    elif len(sys.argv) > 1 and sys.argv[1] == 'warmup':
+        # 镜像构建时下载 BPE 文件到 TIKTOKEN_CACHE_DIR，失败时直接报错
+        start = time.perf_counter()
+        get_tokenizer().encoding
+        print(f'tokenizer loaded in {time.perf_counter() - start:.3f}s')
+    else:
+        text = "Hello, world! This is a test text for token counting."
+        print(count_tokens(text))  # 输出：11
+        print(truncate_text_by_tokens(text, 5))  # 输出："Hello, world!"